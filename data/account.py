@@ -1,40 +1,137 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
 import bcrypt
 
 import data.people as ppl
 import data.db_connect as dbc
+import data.email_filter as emf
 
 
 EMAIL = 'email'
+EMAIL_KEY = ppl.EMAIL_KEY
 PASSWORD = 'password'
 ACCOUNT_COLLECT = 'account'
 PEOPLE_COLLECT = 'people'
 
 INVALID_LOGIN_MSG = "Invalid email or password"
+BUSY_MSG = "Too many logins in progress. Please try again shortly."
+
+# bcrypt cost factor for new hashes. Raising it makes logins rehash.
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', 12))
+# Worker processes that run bcrypt, and how many more jobs may wait.
+HASH_WORKERS = int(os.environ.get('HASH_WORKERS', 2))
+HASH_QUEUE = int(os.environ.get('HASH_QUEUE', 8))
 
 client = dbc.connect_db()
 print(f'{client=}')
 
+hash_pool = None
+hash_pool_lock = threading.Lock()
+hash_slots = threading.BoundedSemaphore(HASH_WORKERS + HASH_QUEUE)
 
-def hash_password(password: str) -> str:
+
+class PasswordServiceBusy(Exception):
+    """
+    Raised when the hashing pool already has as many jobs as it accepts.
+    """
+
+
+def _hashpw(password: bytes, rounds: int) -> bytes:
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+
+def _checkpw(password: bytes, hashed_password: bytes) -> bool:
+    return bcrypt.checkpw(password, hashed_password)
+
+
+def get_hash_pool() -> ProcessPoolExecutor:
+    """
+    Returns the process pool that runs bcrypt, starting it on first use.
+    bcrypt work then stays off the request threads of this worker.
+    Workers come from a forkserver, so they don't inherit a fork of this
+    threaded process (its locks, or the Mongo client's sockets).
+    """
+    global hash_pool
+    with hash_pool_lock:
+        if hash_pool is None:
+            hash_pool = ProcessPoolExecutor(
+                max_workers=HASH_WORKERS,
+                mp_context=multiprocessing.get_context('forkserver'))
+        return hash_pool
+
+
+def reset_hash_pool(broken: ProcessPoolExecutor) -> None:
+    """
+    Drops a pool that lost a worker, so the next job starts a new one.
+    Other threads may already have replaced it.
+    """
+    global hash_pool
+    with hash_pool_lock:
+        if hash_pool is broken:
+            hash_pool = None
+    broken.shutdown(wait=False)
+
+
+def run_hash_job(func, *args):
+    """
+    Runs a bcrypt job in the pool and waits for its result.
+    Raises PasswordServiceBusy at once if the pool is full, instead of
+    queueing behind work that would starve everything else.
+    If a worker died and broke the pool, the job is retried once on a new
+    pool.
+    """
+    if not hash_slots.acquire(blocking=False):
+        raise PasswordServiceBusy(BUSY_MSG)
+    try:
+        pool = get_hash_pool()
+        try:
+            return pool.submit(func, *args).result()
+        except BrokenProcessPool:
+            reset_hash_pool(pool)
+            return get_hash_pool().submit(func, *args).result()
+    finally:
+        hash_slots.release()
+
+
+def hash_password(password: str, rounds: int = None) -> str:
     """
     Hashes a password using bcrypt.
     """
-    salt = bcrypt.gensalt()
-    return bcrypt.hashpw(password.encode(), salt).decode()
+    rounds = rounds or BCRYPT_ROUNDS
+    return run_hash_job(_hashpw, password.encode(), rounds).decode()
 
 
 def check_password(password: str, hashed_password: str) -> bool:
     """
     Compares a plain text password with a hashed password.
     """
-    return bcrypt.checkpw(password.encode(), hashed_password.encode())
+    return run_hash_job(_checkpw, password.encode(),
+                        hashed_password.encode())
+
+
+def get_rounds(hashed_password: str) -> int:
+    """
+    Returns the cost factor a bcrypt hash was made with.
+    Hashes look like $2b$12$<salt and hash>.
+    """
+    return int(hashed_password.split('$')[2])
+
+
+def needs_rehash(hashed_password: str) -> bool:
+    return get_rounds(hashed_password) != BCRYPT_ROUNDS
 
 
 def change_password(new_password: str, email: str) -> bool:
     """
     Change password from old to new.
     """
-    result = dbc.update(ACCOUNT_COLLECT, {EMAIL: email},
+    result = dbc.update(ACCOUNT_COLLECT,
+                        {EMAIL_KEY: ppl.normalize_email(email)},
                         {PASSWORD: hash_password(new_password)})
     if result.matched_count > 0:
         return True
@@ -71,18 +168,28 @@ def register(email: str, password: str):
     if not ppl.is_valid_email(email):
         raise ValueError(f'Email does not follow correct format: {email}')
 
-    if dbc.read_one(ACCOUNT_COLLECT, {EMAIL: email}):
-        raise ValueError(f'Account already exists for: {email}')
+    # The Bloom filter answers "certainly new" without going to the DB.
+    key = ppl.normalize_email(email)
+    if emf.might_contain(ACCOUNT_COLLECT, key):
+        if dbc.read_one(ACCOUNT_COLLECT, {EMAIL_KEY: key}):
+            raise ValueError(f'Account already exists for: {email}')
+        emf.record_false_positive()
 
-    if dbc.read_one(PEOPLE_COLLECT, {EMAIL: email}):
-        raise ValueError(f'Person already exists for: {email}')
+    if emf.might_contain(PEOPLE_COLLECT, key):
+        if dbc.read_one(PEOPLE_COLLECT, {EMAIL_KEY: key}):
+            raise ValueError(f'Person already exists for: {email}')
+        emf.record_false_positive()
 
     if not is_valid_password(password):
         raise ValueError('Password is not valid')
 
     hashed_pw = hash_password(password)
-    account = {EMAIL: email, PASSWORD: hashed_pw}
-    dbc.create(ACCOUNT_COLLECT, account)
+    account = {EMAIL: email, EMAIL_KEY: key, PASSWORD: hashed_pw}
+    try:
+        dbc.create(ACCOUNT_COLLECT, account)
+    except dbc.DuplicateKeyError:
+        raise ValueError(f'Account already exists for: {email}')
+    emf.add(ACCOUNT_COLLECT, key)
     return email
 
 
@@ -90,16 +197,33 @@ def login(email: str, password: str) -> bool:
     """
     Logs in a user by verifying their email and password.
     """
-    account = dbc.read_one(ACCOUNT_COLLECT, {EMAIL: email})
+    account = read_account(email)
 
     if not account or not check_password(password, account[PASSWORD]):
         raise ValueError(INVALID_LOGIN_MSG)
 
+    # The password is in hand, so this is the moment to move the stored
+    # hash to the current cost factor. It can wait for a later login if
+    # the hashing pool is full.
+    if needs_rehash(account[PASSWORD]):
+        try:
+            change_password(password, email)
+        except PasswordServiceBusy:
+            pass
+
     return True
 
 
+def read_account(email: str) -> dict:
+    """
+    Returns the account for an email in any case, or None.
+    """
+    return dbc.read_one(ACCOUNT_COLLECT,
+                        {EMAIL_KEY: ppl.normalize_email(email)})
+
+
 def get_password(email: str):
-    account = dbc.read_one(ACCOUNT_COLLECT, {EMAIL: email})
+    account = read_account(email)
     return account[PASSWORD]
 
 
@@ -107,9 +231,65 @@ def delete(email: str) -> int:
     """
     Deletes a user's account.
     """
-    account = dbc.read_one(ACCOUNT_COLLECT, {EMAIL: email})
+    account = read_account(email)
 
     if not account:
         raise ValueError('Account does not exist')
 
-    return dbc.delete(ACCOUNT_COLLECT, {EMAIL: email}) > 0
+    key = ppl.normalize_email(email)
+    deleted = dbc.delete(ACCOUNT_COLLECT, {EMAIL_KEY: key}) > 0
+    if deleted:
+        emf.remove(ACCOUNT_COLLECT, key)
+    return deleted
+
+
+def delete_user(email: str, policy: str = None) -> bool:
+    """
+    Deletes a user's account and their person record, with the person's
+    manuscript cleanup (see people.cascade_delete), in one transaction.
+    """
+    if not read_account(email):
+        raise ValueError('Account does not exist')
+
+    key = ppl.normalize_email(email)
+
+    def writes(session):
+        # The cascade goes first: it may refuse the delete, and without a
+        # transaction nothing must have been deleted by then.
+        person_deleted = ppl.cascade_delete(key, policy, session)
+        deleted = dbc.delete(ACCOUNT_COLLECT, {EMAIL_KEY: key},
+                             session=session)
+        return deleted, person_deleted
+
+    account_deleted, person_deleted = dbc.in_transaction(writes)
+    if account_deleted:
+        emf.remove(ACCOUNT_COLLECT, key)
+    ppl.forget(key, person_deleted)
+    return account_deleted > 0
+
+
+def benchmark(costs=(4, 8, 10, 12), logins: int = 20) -> dict:
+    """
+    Measures password checks per second through the hashing pool for
+    each bcrypt cost factor, with as many concurrent callers as the pool
+    accepts.
+    """
+    results = {}
+    callers = HASH_WORKERS + HASH_QUEUE
+    for rounds in costs:
+        hashed = hash_password('password123', rounds)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=callers) as threads:
+            list(threads.map(lambda _: check_password('password123', hashed),
+                             range(logins)))
+        results[rounds] = logins / (time.perf_counter() - start)
+    return results
+
+
+def main():
+    for rounds, per_sec in benchmark().items():
+        print(f'cost {rounds}: {per_sec:.1f} logins/sec')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,8 @@
 import os
 from dotenv import load_dotenv
 import pymongo as pm
+from pymongo import UpdateOne  # noqa: F401 (re-exported)
+from pymongo.errors import DuplicateKeyError  # noqa: F401 (re-exported)
 import certifi
 from typing import Union
 
@@ -16,6 +18,11 @@ ENV_MONGO_URI = "MONGO_URI"
 JOURNAL_DB = 'journalDB'
 MONGO_ID = '_id'
 
+# Matches strings regardless of case, e.g. emails stored as typed.
+CASE_INSENSITIVE = {'locale': 'en', 'strength': 2}
+# Server error code for "transactions need a replica set".
+ILLEGAL_OPERATION = 20
+
 client = None
 
 
@@ -53,14 +60,22 @@ def convert_mongo_id(doc: dict) -> None:
     return doc
 
 
-def create(collection: str, doc: dict, db=JOURNAL_DB):
+def create(collection: str, doc: dict, db=JOURNAL_DB, session=None):
     """
     Insert a single document into the specified collection in the database.
     """
-    result = client[db][collection].insert_one(doc)
+    result = client[db][collection].insert_one(doc, session=session)
     return result
 
 
+def create_many(collection: str, docs: list[dict], db=JOURNAL_DB,
+                session=None):
+    """
+    Inserts several documents into the collection in one round trip.
+    """
+    return client[db][collection].insert_many(docs, session=session)
+
+
 def read_one(collection: str, filt: dict, db=JOURNAL_DB) -> Union[dict, None]:
     """
     Find with a filter and return on the first doc/dict found.
@@ -73,31 +88,125 @@ def read_one(collection: str, filt: dict, db=JOURNAL_DB) -> Union[dict, None]:
     return doc
 
 
-def delete(collection: str, filt: dict, db=JOURNAL_DB) -> int:
+def delete(collection: str, filt: dict, db=JOURNAL_DB, session=None) -> int:
     """
     Deletes the first document matching the filter.
     Returns the count of deleted documents.
     """
-    print(f'{read_one(collection, filt)=}')
     print(f'Deleting doc with {filt=}')
-    del_result = client[db][collection].delete_one(filt)
+    del_result = client[db][collection].delete_one(filt, session=session)
     return del_result.deleted_count
 
 
-def delete_role(collection: str, filt: dict, role: str, db=JOURNAL_DB) -> bool:
+def delete_many(collection: str, filt: dict, db=JOURNAL_DB, collation=None,
+                session=None) -> int:
+    """
+    Deletes every document matching the filter in one round trip.
+    Returns the count of deleted documents.
+    """
+    result = client[db][collection].delete_many(filt, collation=collation,
+                                                session=session)
+    return result.deleted_count
+
+
+def update_many(collection: str, filt: dict, update_doc: dict,
+                db=JOURNAL_DB, collation=None, session=None,
+                upsert: bool = False) -> int:
+    """
+    Applies an update document ($set, $pull, ...) to every document
+    matching the filter in one round trip.
+    With upsert, a document is created if none matches.
+    Returns the count of modified documents.
+    """
+    result = client[db][collection].update_many(filt, update_doc,
+                                                collation=collation,
+                                                session=session,
+                                                upsert=upsert)
+    return result.modified_count
+
+
+def bulk_write(collection: str, requests: list, ordered: bool = True,
+               db=JOURNAL_DB):
+    """
+    Sends several writes (e.g. UpdateOne) in one round trip.
+    Unordered, the server may apply them in any order, and one failing
+    doesn't stop the rest.
+    """
+    return client[db][collection].bulk_write(requests, ordered=ordered)
+
+
+def count(collection: str, filt: dict, db=JOURNAL_DB, collation=None,
+          session=None, limit: int = 0) -> int:
+    """
+    Counts the documents matching the filter, stopping at limit if set.
+    """
+    kwargs = {'limit': limit} if limit else {}
+    return client[db][collection].count_documents(filt, collation=collation,
+                                                  session=session, **kwargs)
+
+
+def in_transaction(func):
+    """
+    Runs func(session) inside a transaction, so its writes land together
+    or not at all, and returns what it returns.
+    A standalone server (e.g. a local mongod) has no transactions; there
+    func runs with session None and its writes go one after another.
+    """
+    with client.start_session() as session:
+        try:
+            return session.with_transaction(func)
+        except pm.errors.OperationFailure as err:
+            if err.code != ILLEGAL_OPERATION:
+                raise
+    return func(None)
+
+
+def delete_role(collection: str, filt: dict, role: str, db=JOURNAL_DB,
+                set_fields: dict = None) -> bool:
     """
     Removes a specific role from a list in a document based on the filter.
+    Any set_fields are written in the same update.
     """
     print(f'Deleting role with {filt=}')
-    result = client[db][collection].update_one(filt, {'$pull': role})
+    update_dict = {'$pull': role}
+    if set_fields:
+        update_dict['$set'] = set_fields
+    result = client[db][collection].update_one(filt, update_dict)
     return result.modified_count > 0
 
 
-def update(collection: str, filt: dict, update_dict: dict, db=JOURNAL_DB):
+def create_index(collection: str, keys, unique: bool = False,
+                 db=JOURNAL_DB, collation=None, weights: dict = None) -> str:
+    """
+    Makes sure an index exists. keys is a field name for an ascending
+    index, or a list of (field, direction) pairs for a compound one.
+    Queries only use a collated index when they ask for the same
+    collation.
+    weights sets how much each field of a text index counts.
+    Returns the index name.
+    """
+    kwargs = {'collation': collation} if collation else {}
+    if weights:
+        kwargs['weights'] = weights
+    return client[db][collection].create_index(keys, unique=unique,
+                                               **kwargs)
+
+
+def update(collection: str, filt: dict, update_dict: dict, db=JOURNAL_DB,
+           unset_fields: list = None, inc_fields: dict = None,
+           upsert: bool = False):
     """
     Updates fields in a document matching the filter with the provided updates.
+    Any unset_fields are removed, and any inc_fields incremented by the
+    given amounts, in the same update.
+    With upsert, a document is created if none matches.
     """
-    return client[db][collection].update_one(filt, {'$set': update_dict})
+    update_doc = {'$set': update_dict}
+    if unset_fields:
+        update_doc['$unset'] = {field: '' for field in unset_fields}
+    if inc_fields:
+        update_doc['$inc'] = inc_fields
+    return client[db][collection].update_one(filt, update_doc, upsert=upsert)
 
 
 def read(collection, db=JOURNAL_DB, no_id=True) -> list[dict]:
@@ -115,6 +224,24 @@ def read(collection, db=JOURNAL_DB, no_id=True) -> list[dict]:
     return ret
 
 
+def read_cursor(collection, filt: dict = None, projection: dict = None,
+                db=JOURNAL_DB, session=None):
+    """
+    Returns a raw cursor over the documents matching the filter.
+    Callers that convert documents themselves can stream them this way
+    instead of going through the list built by read().
+    """
+    return client[db][collection].find(filt or {}, projection,
+                                       session=session)
+
+
+def aggregate(collection, pipeline: list[dict], db=JOURNAL_DB) -> list[dict]:
+    """
+    Runs an aggregation pipeline in the DB and returns its results.
+    """
+    return list(client[db][collection].aggregate(pipeline))
+
+
 def read_dict(collection, key, db=JOURNAL_DB, no_id=True) -> dict:
     """
     Retrieves all documents as a dictionary with the specified key as the
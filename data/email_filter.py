@@ -0,0 +1,145 @@
+"""
+This module keeps an in-process Bloom filter over the emails in the
+people and account collections.
+Checking that an email is new is nearly always answered "no such email",
+and the filter can say that without a DB round trip. Only a possible hit
+goes to the DB, and the unique email indexes stay the final guard.
+The filter only sees the writes of its own process, so it is consulted
+by those create pre-checks alone, never to decide whether someone
+exists.
+
+Each slot is a small counter rather than a bit, so deleting an email
+takes it back out of the filter.
+Emails are keyed by their normalized form (data.emails.normalize_email).
+The filter is seeded on first use by streaming the email_key field of
+each collection, and is kept current by the create and delete functions in
+data.people and data.account.
+"""
+import hashlib
+import os
+import threading
+
+import data.db_connect as dbc
+
+EMAIL_KEY = 'email_key'
+PEOPLE_COLLECT = 'people'
+ACCOUNT_COLLECT = 'account'
+COLLECTIONS = [PEOPLE_COLLECT, ACCOUNT_COLLECT]
+
+# About 1MB of counters; with 7 hashes this stays under 1% false
+# positives up to roughly 100,000 emails.
+FILTER_SLOTS = int(os.environ.get('EMAIL_FILTER_SLOTS', 1 << 20))
+FILTER_HASHES = int(os.environ.get('EMAIL_FILTER_HASHES', 7))
+MAX_COUNT = 255  # a saturated counter is never decremented
+
+# Stat names
+CHECKS = 'checks'
+NEGATIVES = 'negatives'
+FALSE_POSITIVES = 'false_positives'
+FALSE_POSITIVE_RATE = 'false_positive_rate'
+
+counts = bytearray(FILTER_SLOTS)
+seeded = False
+lock = threading.Lock()
+stats = {CHECKS: 0, NEGATIVES: 0, FALSE_POSITIVES: 0}
+
+
+def _slots(collection: str, email: str) -> list[int]:
+    """
+    Returns the counter positions for an email, by double hashing one
+    128-bit digest.
+    """
+    digest = hashlib.blake2b(f'{collection}:{email}'.encode(),
+                             digest_size=16).digest()
+    first = int.from_bytes(digest[:8], 'little')
+    step = int.from_bytes(digest[8:], 'little') | 1
+    return [(first + i * step) % FILTER_SLOTS for i in range(FILTER_HASHES)]
+
+
+def _add(collection: str, email: str) -> None:
+    for slot in _slots(collection, email):
+        if counts[slot] < MAX_COUNT:
+            counts[slot] += 1
+
+
+def seed() -> int:
+    """
+    Rebuilds the filter from the DB.
+    Returns the number of emails loaded.
+    """
+    global seeded
+    loaded = 0
+    with lock:
+        counts[:] = bytes(FILTER_SLOTS)
+        for collection in COLLECTIONS:
+            for doc in dbc.read_cursor(collection, {}, {EMAIL_KEY: 1}):
+                if doc.get(EMAIL_KEY):
+                    _add(collection, doc[EMAIL_KEY])
+                    loaded += 1
+        seeded = True
+    return loaded
+
+
+def add(collection: str, email: str) -> None:
+    """
+    Records a newly created email.
+    Before seeding this is a no-op: the seed reads it from the DB anyway.
+    """
+    with lock:
+        if seeded:
+            _add(collection, email)
+
+
+def remove(collection: str, email: str) -> None:
+    """
+    Takes a deleted email back out of the filter.
+    """
+    with lock:
+        if not seeded:
+            return
+        for slot in _slots(collection, email):
+            if 0 < counts[slot] < MAX_COUNT:
+                counts[slot] -= 1
+
+
+def might_contain(collection: str, email: str) -> bool:
+    """
+    Returns False only if the email is certainly not in the collection.
+    True means the DB has to be asked.
+    """
+    if not seeded:
+        seed()
+    found = all(counts[slot] for slot in _slots(collection, email))
+    stats[CHECKS] += 1
+    if not found:
+        stats[NEGATIVES] += 1
+    return found
+
+
+def record_false_positive() -> None:
+    """
+    Called when the DB says a possible hit was not there after all.
+    """
+    stats[FALSE_POSITIVES] += 1
+
+
+def get_stats() -> dict:
+    """
+    Returns the check counts and the observed false-positive rate: the
+    share of absent emails that still had to go to the DB.
+    """
+    absent = stats[NEGATIVES] + stats[FALSE_POSITIVES]
+    rate = stats[FALSE_POSITIVES] / absent if absent else 0.0
+    return {**stats, FALSE_POSITIVE_RATE: rate}
+
+
+def reset() -> None:
+    """
+    Empties the filter and its stats; the next check seeds it again.
+    """
+    global seeded
+    with lock:
+        counts[:] = bytes(FILTER_SLOTS)
+        seeded = False
+        for name in stats:
+            stats[name] = 0
@@ -0,0 +1,14 @@
+"""
+This module holds how email addresses are compared.
+It imports nothing, so every module that stores or matches emails can
+use it, whatever else imports that module.
+"""
+
+
+def normalize_email(email: str) -> str:
+    """
+    Returns the key an email is stored and looked up by.
+    Addresses differing only in case or surrounding spaces are the same
+    identity, so every lookup goes through here.
+    """
+    return email.strip().lower()
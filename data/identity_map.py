@@ -0,0 +1,67 @@
+"""
+This module is a request-scoped identity map.
+While a scope is open, the data modules keep every document they read
+here, keyed by collection and key, so the same person or manuscript is
+fetched from Mongo at most once per request.
+Outside a scope nothing is kept and every read goes to the DB.
+"""
+import contextvars
+
+# Returned by get() when the map has no entry for a key.
+MISSING = object()
+
+docs = contextvars.ContextVar('identity_map', default=None)
+
+
+def begin() -> None:
+    """
+    Opens a fresh scope for the current context.
+    """
+    docs.set({})
+
+
+def end() -> None:
+    """
+    Closes the current scope and drops everything in it.
+    """
+    docs.set(None)
+
+
+def get(collection: str, key):
+    """
+    Returns the document stored for key, None if it is known not to
+    exist, or MISSING if it has not been read in this scope.
+    """
+    scope = docs.get()
+    if scope is None:
+        return MISSING
+    return scope.get((collection, key), MISSING)
+
+
+def put(collection: str, key, doc) -> None:
+    """
+    Stores a document (or None for a known miss) in the current scope.
+    """
+    scope = docs.get()
+    if scope is not None:
+        scope[(collection, key)] = doc
+
+
+def evict(collection: str, key) -> None:
+    """
+    Forgets a document after it was written or deleted.
+    """
+    scope = docs.get()
+    if scope is not None:
+        scope.pop((collection, key), None)
+
+
+def evict_collection(collection: str) -> None:
+    """
+    Forgets every document of a collection, after a write that touched
+    many of them at once.
+    """
+    scope = docs.get()
+    if scope is not None:
+        for key in [key for key in scope if key[0] == collection]:
+            del scope[key]
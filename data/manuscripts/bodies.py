@@ -0,0 +1,109 @@
+"""
+This module stores manuscript bodies apart from the manuscripts.
+A body is kept as UTF-8 bytes split into CHUNK_SIZE pieces, one document
+per piece, in its own collection. The manuscript only holds the body's
+id, size and hash, so reading or moving a manuscript through the
+workflow never loads its text, and any byte range of a body can be read
+by fetching just the chunks it covers.
+"""
+import hashlib
+import os
+
+from bson import ObjectId, errors
+
+import data.db_connect as dbc
+
+BODY_COLLECT = 'manuscript_bodies'
+
+# Chunk fields
+BODY_ID = 'body_id'
+NUM = 'n'
+DATA = 'data'
+
+CHUNK_SIZE = int(os.environ.get('BODY_CHUNK_SIZE', 255 * 1024))  # bytes
+
+
+def _to_object_id(body_id: str) -> ObjectId:
+    try:
+        return ObjectId(body_id)
+    except errors.InvalidId:
+        raise ValueError(f'Invalid body id: {body_id}')
+
+
+def get_hash(text: str) -> str:
+    """
+    Returns the hash manuscripts keep to tell whether their body changed.
+    """
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def save(text: str) -> tuple[str, int]:
+    """
+    Stores a body in chunks.
+    Returns its new id and its size in bytes.
+    """
+    raw = text.encode()
+    body_id = ObjectId()
+    chunks = [{BODY_ID: body_id, NUM: num, DATA: raw[start:start + CHUNK_SIZE]}
+              for num, start in enumerate(range(0, len(raw), CHUNK_SIZE))]
+    if chunks:
+        dbc.create_many(BODY_COLLECT, chunks)
+    return str(body_id), len(raw)
+
+
+def stream(body_id: str, start: int = 0, stop: int = None):
+    """
+    Yields the bytes of body[start:stop], one chunk at a time, fetching
+    only the chunks that range covers.
+    """
+    if stop is not None and stop <= start:
+        return
+    first = start // CHUNK_SIZE
+    nums = {'$gte': first}
+    if stop is not None:
+        nums['$lte'] = (stop - 1) // CHUNK_SIZE
+    chunks = (dbc.read_cursor(BODY_COLLECT,
+                              {BODY_ID: _to_object_id(body_id), NUM: nums},
+                              {DATA: 1, NUM: 1})
+              .sort(NUM))
+    for chunk in chunks:
+        offset = chunk[NUM] * CHUNK_SIZE
+        data = chunk[DATA]
+        lo = max(start - offset, 0)
+        hi = len(data) if stop is None else min(stop - offset, len(data))
+        yield bytes(data[lo:hi])
+
+
+def read(body_id: str) -> str:
+    """
+    Returns a whole body as text.
+    """
+    return b''.join(stream(body_id)).decode()
+
+
+def delete(body_id: str) -> int:
+    """
+    Deletes every chunk of a body.
+    Returns the count of chunks deleted.
+    """
+    return dbc.delete_many(BODY_COLLECT, {BODY_ID: _to_object_id(body_id)})
+
+
+def delete_all(body_ids: list[str], session=None) -> int:
+    """
+    Deletes every chunk of several bodies at once.
+    Returns the count of chunks deleted.
+    """
+    return dbc.delete_many(BODY_COLLECT,
+                           {BODY_ID: {'$in': [_to_object_id(body_id)
+                                              for body_id in body_ids]}},
+                           session=session)
+
+
+def ensure_indexes() -> int:
+    """
+    Adds the index chunk reads run on.
+    Changes no documents, so returns 0.
+    """
+    dbc.create_index(BODY_COLLECT, [(BODY_ID, 1), (NUM, 1)], unique=True)
+    return 0
@@ -11,8 +11,17 @@ AUTHOR = 'author'
 REFEREES = 'referees'
 AUTHOR_EMAIL = 'author_email'
 STATE = 'state'
+STATE_RANK = 'state_rank'  # stored sort order of STATE
+VERSION = 'version'  # bumped by every write, see query.update_state
+WRITE_ID = 'write_id'  # token of the last bulk write, see query.handle_actions
 ACTION = 'action'
+ACTIONS = 'actions'
 TEXT = 'text'
+# Where the text is kept, see data.manuscripts.bodies
+TEXT_ID = 'text_id'
+TEXT_SIZE = 'text_size'
+TEXT_HASH = 'text_hash'
+REVISIONS = 'revisions'  # ids in data.manuscripts.revisions, oldest first
 ABSTRACT = 'abstract'
 HISTORY = 'history'
 EDITOR = 'editor'
@@ -24,6 +33,7 @@ NEW_PASSWORD = 'newPassword'
 ROLES = 'roles'
 
 MANU_ID = 'manu_id'
+MANU_IDS = 'manu_ids'
 USER_EMAIL = 'user_email'
 
 
@@ -0,0 +1,175 @@
+"""
+This module keeps each manuscript's path through the workflow, in a
+collection of its own.
+Entries are only ever appended: one per transition, recording the
+manuscript, the state it left and the state it entered, the action
+taken, who took it and when. Reading a manuscript's history never
+touches the manuscript itself.
+Old entries can be compacted into a snapshot, which keeps how many
+entries it replaced, the state they ended in and the time spent in
+each state along the way.
+"""
+import time
+
+from bson import ObjectId, errors
+
+import data.db_connect as dbc
+
+HISTORY_COLLECT = 'manuscript_history'
+
+# Entry fields
+ID = '_id'
+MANU_ID = 'manu_id'
+FROM_STATE = 'from_state'  # None when the manuscript was created
+TO_STATE = 'to_state'
+ACTION = 'action'  # None for an editor's move or a direct edit
+ACTOR = 'actor'
+AT = 'at'  # seconds since the epoch
+
+# Snapshot fields
+SNAPSHOT = 'snapshot'
+ENTRIES = 'entries'
+STATE_TIMES = 'state_times'
+
+ORDER = [(MANU_ID, 1), (AT, 1), (ID, 1)]
+
+
+def make_entry(manu_id: str, from_state: str, to_state: str,
+               action: str = None, actor: str = None,
+               at: float = None) -> dict:
+    return {
+        MANU_ID: manu_id,
+        FROM_STATE: from_state,
+        TO_STATE: to_state,
+        ACTION: action,
+        ACTOR: actor,
+        AT: time.time() if at is None else at,
+    }
+
+
+def record(manu_id: str, from_state: str, to_state: str, action: str = None,
+           actor: str = None, at: float = None) -> str:
+    """
+    Appends a transition to a manuscript's history.
+    Returns the new entry's id.
+    """
+    result = dbc.create(HISTORY_COLLECT,
+                        make_entry(manu_id, from_state, to_state, action,
+                                   actor, at))
+    return str(result.inserted_id)
+
+
+def record_many(entries: list[dict], session=None) -> int:
+    """
+    Appends several entries built by make_entry() in one round trip.
+    Returns the number appended.
+    """
+    if not entries:
+        return 0
+    dbc.create_many(HISTORY_COLLECT, entries, session=session)
+    return len(entries)
+
+
+def read(manu_id: str, limit: int = None, after: str = None) -> list[dict]:
+    """
+    Returns a manuscript's history, oldest first.
+    Pass limit for a page at a time, and the id of the last entry of a
+    page as after to get the next one.
+    """
+    query = {MANU_ID: manu_id}
+    if after:
+        try:
+            after_id = ObjectId(after)
+        except errors.InvalidId:
+            raise ValueError(f'Invalid history entry id: {after}')
+        last = dbc.read_one(HISTORY_COLLECT, {ID: after_id})
+        if not last or last[MANU_ID] != manu_id:
+            raise ValueError(f'No such history entry: {after}')
+        query['$or'] = [{AT: {'$gt': last[AT]}},
+                        {AT: last[AT], ID: {'$gt': after_id}}]
+    cursor = dbc.read_cursor(HISTORY_COLLECT, query).sort(ORDER)
+    if limit:
+        cursor = cursor.limit(limit)
+    return [dbc.convert_mongo_id(entry) for entry in cursor]
+
+
+def summarize(entries: list[dict]) -> dict:
+    """
+    Folds entries, oldest first, into one snapshot.
+    The time spent in the state the last entry entered is still running,
+    so it is not counted yet.
+    """
+    state_times = {}
+    count = 0
+    prev = None
+    for entry in entries:
+        if entry.get(SNAPSHOT):
+            for state, spent in entry[STATE_TIMES].items():
+                state_times[state] = state_times.get(state, 0) + spent
+            count += entry[ENTRIES]
+        else:
+            count += 1
+        if prev is not None:
+            spent = entry[AT] - prev[AT]
+            state_times[prev[TO_STATE]] = (
+                state_times.get(prev[TO_STATE], 0) + spent)
+        prev = entry
+    first = entries[0]
+    return {
+        MANU_ID: first[MANU_ID],
+        SNAPSHOT: True,
+        FROM_STATE: first[FROM_STATE],
+        TO_STATE: prev[TO_STATE],
+        ACTION: prev[ACTION],
+        ACTOR: prev[ACTOR],
+        AT: prev[AT],
+        ENTRIES: count,
+        STATE_TIMES: state_times,
+    }
+
+
+def compact(manu_id: str, before: float) -> int:
+    """
+    Replaces a manuscript's entries older than before with one snapshot.
+    Returns the number of entries removed.
+    """
+    entries = list(dbc.read_cursor(HISTORY_COLLECT,
+                                   {MANU_ID: manu_id, AT: {'$lt': before}})
+                   .sort(ORDER))
+    if len(entries) < 2:
+        return 0
+    snapshot = summarize(entries)
+    ids = [entry[ID] for entry in entries]
+
+    def replace(session):
+        dbc.create(HISTORY_COLLECT, snapshot, session=session)
+        return dbc.delete_many(HISTORY_COLLECT, {ID: {'$in': ids}},
+                               session=session)
+
+    return dbc.in_transaction(replace)
+
+
+def delete(manu_id: str) -> int:
+    """
+    Deletes a manuscript's whole history.
+    Returns the count of entries deleted.
+    """
+    return dbc.delete_many(HISTORY_COLLECT, {MANU_ID: manu_id})
+
+
+def delete_all(manu_ids: list[str], session=None) -> int:
+    """
+    Deletes the whole history of several manuscripts.
+    Returns the count of entries deleted.
+    """
+    return dbc.delete_many(HISTORY_COLLECT, {MANU_ID: {'$in': manu_ids}},
+                           session=session)
+
+
+def ensure_indexes() -> int:
+    """
+    Adds the index history reads and compaction run on.
+    Changes no documents, so returns 0.
+    """
+    dbc.create_index(HISTORY_COLLECT, ORDER)
+    return 0
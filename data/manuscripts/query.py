@@ -1,25 +1,31 @@
+import heapq
+
+import data.manuscripts.bodies as bodies
 import data.manuscripts.fields as flds
+import data.manuscripts.history as hist
+import data.manuscripts.referee_load as load
+import data.manuscripts.revisions as revs
+import data.manuscripts.search as srch
+from data.manuscripts.states import (
+    AUTHOR_REVIEW, AUTHOR_REVISION, COPY_EDIT, EDITOR_REVIEW, FORMATTING,
+    PUBLISHED, REFEREE_REVIEW, REJECTED, SUBMITTED, WITHDRAWN, CLOSED_STATES,
+    get_state_rank,
+)
 import data.people as ppl
 import data.roles as rls
 import data.db_connect as dbc
+import data.identity_map as imap
+import data.records as recs
+import security.security as sec
+
+from types import MappingProxyType
 
 from bson import ObjectId, errors
 
 
 MANU_COLLECT = 'manuscripts'
 
-# States Codes
-AUTHOR_REVIEW = 'AU_RVW'
-AUTHOR_REVISION = 'AU_REV'
-COPY_EDIT = 'CED'
-EDITOR_REVIEW = 'ED_RVW'
-FORMATTING = 'FMT'
-PUBLISHED = 'PUB'
-REFEREE_REVIEW = 'REF_RVW'
-REJECTED = 'REJ'
-SUBMITTED = 'SUB'
-WITHDRAWN = 'WDN'
-
+# State codes are in data.manuscripts.states.
 VALID_STATES = {
     AUTHOR_REVIEW: 'Author Review',
     AUTHOR_REVISION: 'Author Revision',
@@ -44,6 +50,13 @@ ROLE_CHOOSE_ACTION = {
     rls.RE_CODE: [REFEREE_REVIEW]
 }
 
+# Compiled by the policy engine: state -> mask of roles allowed there
+CHOOSE_ACTION_MASKS = sec.compile_state_rules(ROLE_CHOOSE_ACTION)
+
+# Only masthead editors may move a manuscript, from any state
+MOVE_ACTION_MASKS = sec.compile_state_rules(
+    {role: list(VALID_STATES) for role in rls.MH_ROLES})
+
 # Action Codes
 ACTION_ACCEPT = 'ACC'
 ACTION_ACCEPT_WITH_REV = 'AWR'
@@ -79,6 +92,25 @@ SAMPLE_MANU = {
 }
 
 FUNC = 'f'
+TARGETS = 't'  # every state the action can lead to
+
+
+class ManuscriptConflict(ValueError):
+    """
+    Raised when a manuscript changed between being read and written.
+    """
+
+
+class Manuscript(recs.Record):
+    """
+    A manuscript's metadata, as listed; the text stays in the body store.
+    """
+    __slots__ = (flds.ID, flds.TITLE, flds.AUTHOR, flds.AUTHOR_EMAIL,
+                 flds.REFEREES, flds.STATE, flds.STATE_RANK, flds.VERSION,
+                 flds.ABSTRACT, flds.TEXT_ID, flds.TEXT_SIZE, flds.TEXT_HASH,
+                 flds.REVISIONS)
+    COLLECTION = MANU_COLLECT
+    KEY = flds.ID
 
 
 def get_states() -> dict:
@@ -89,6 +121,11 @@ def is_valid_state(state: str) -> bool:
     return state in VALID_STATES
 
 
+def get_version(manu: dict) -> int:
+    # Manuscripts written before versions were kept count as version 0.
+    return manu.get(flds.VERSION) or 0
+
+
 def get_actions() -> dict:
     return ACTION_NAMES
 
@@ -97,34 +134,60 @@ def is_valid_action(action: str) -> bool:
     return action in ACTION_NAMES
 
 
-def create_manuscript(title: str, author: str, author_email: str, referee: str, state: str, text: str, abstract: str) -> str:
-    if not ppl.exists(author_email):
-        raise ValueError('Author does not exist')
+def to_referee_list(referees) -> list[str]:
+    """
+    Takes no referee, one email, or a list of emails, and returns them as
+    a list of stripped emails, raising ValueError for any invalid one.
+    """
+    if not referees:
+        return []
+    if isinstance(referees, str):
+        referees = [referees]
+    if not isinstance(referees, list):
+        raise ValueError(f'Referees must be a list: {referees=}')
+    for referee in referees:
+        ppl.is_valid_email(referee)
+    return [referee.strip() for referee in referees]
 
-    # Add author role when you submit manuscript
-    author_info = ppl.read_one(author_email)
-    roles = author_info.get(ppl.ROLES, [])
-    if rls.AUTHOR_CODE not in roles:
-        updated_roles = roles + [rls.AUTHOR_CODE]
-        ppl.update(author_info[ppl.NAME], author_info[ppl.AFFILIATION], author_email, updated_roles)
 
+def create_manuscript(title: str, author: str, author_email: str, referee, state: str, text: str, abstract: str) -> str:
+    """
+    Adds a manuscript. referee may be one email or a list of them.
+    Everything is checked before anything is written.
+    """
     if not is_valid_state(state):
         raise ValueError(f'Invalid state: {state}')
-    
-    referees = [referee] if referee else []
+    referees = to_referee_list(referee)
+    if not ppl.exists(author_email):
+        raise ValueError('Author does not exist')
+
     manuscript = {
         flds.TITLE: title,
         flds.AUTHOR: author,
         flds.AUTHOR_EMAIL: author_email, 
         flds.REFEREES: referees,
         flds.STATE: state,
-        flds.TEXT: text,
+        flds.STATE_RANK: get_state_rank(state),
+        flds.VERSION: 0,
         flds.ABSTRACT: abstract,
+        **save_body(text),
     }
     
     result = dbc.create(MANU_COLLECT, manuscript)
-    inserted_doc = dbc.read_one(MANU_COLLECT, {flds.ID: result.inserted_id})
-    return str(inserted_doc[flds.ID])
+    manu_id = str(result.inserted_id)
+
+    # Add author role when you submit manuscript
+    author_info = ppl.read_one(author_email)
+    roles = author_info.get(ppl.ROLES, [])
+    if rls.AUTHOR_CODE not in roles:
+        updated_roles = roles + [rls.AUTHOR_CODE]
+        ppl.update(author_info[ppl.NAME], author_info[ppl.AFFILIATION], author_email, updated_roles)
+
+    add_revision(manu_id, text)
+    hist.record(manu_id, None, state, actor=author_email)
+    load.apply(None, manuscript)
+    srch.index(manu_id, {**manuscript, flds.TEXT: text or ''})
+    return manu_id
 
 
 def update(id: str, title: str, author: str, author_email: str, referee: str, state: str, text: str, abstract: str) -> str:
@@ -134,6 +197,7 @@ def update(id: str, title: str, author: str, author_email: str, referee: str, st
     """
     if not exists(id):
         raise ValueError(f'Can not update non-existent manuscript: {id=}')
+    old_manu = get_one_manu(id, with_body=False)
     
     if referee: 
         if not ppl.is_valid_email(author_email):
@@ -151,39 +215,316 @@ def update(id: str, title: str, author: str, author_email: str, referee: str, st
             flds.AUTHOR_EMAIL: author_email,
             flds.REFEREES: referee,
             flds.STATE: state,
-            flds.TEXT: text,
+            flds.STATE_RANK: get_state_rank(state),
             flds.ABSTRACT: abstract,
         }
+    # Only a changed body is written again.
+    text = text or ''
+    if old_manu.get(flds.TEXT_HASH) != bodies.get_hash(text):
+        manuscript.update(save_body(text))
     
     try:
         object_id = ObjectId(id)
     except errors.InvalidId:
         raise ValueError(f"Invalid ObjectId: {id}")
 
-    dbc.update(MANU_COLLECT, {flds.ID: object_id}, manuscript)
+    dbc.update(MANU_COLLECT, {flds.ID: object_id}, manuscript,
+               unset_fields=[flds.TEXT], inc_fields={flds.VERSION: 1})
+    imap.evict(MANU_COLLECT, str(object_id))
+    if old_manu[flds.STATE] != state:
+        hist.record(id, old_manu[flds.STATE], state)
+    load.apply(old_manu, manuscript)
+    srch.index(id, {**manuscript, flds.TEXT: text})
+    if flds.TEXT_ID in manuscript:
+        add_revision(id, text)
+    if flds.TEXT_ID in manuscript and old_manu.get(flds.TEXT_ID):
+        bodies.delete(old_manu[flds.TEXT_ID])
     return id
 
 
+def update_state(id: str, state: str, referees: list[str] = None,
+                 expected_state: str = None,
+                 expected_version: int = None) -> str:
+    """
+    Moves a manuscript to a new state, and sets its referees if given,
+    without reading or rewriting anything else.
+    The write is one conditional update: given expected_state or
+    expected_version, it only lands if the manuscript still has them,
+    and raises a ManuscriptConflict otherwise.
+    """
+    if not is_valid_state(state):
+        raise ValueError(f'Invalid state: {state=}')
+    try:
+        object_id = ObjectId(id)
+    except errors.InvalidId:
+        raise ValueError(f"Invalid ObjectId: {id}")
+
+    filt = _write_filter(object_id, expected_version)
+    if expected_state is not None:
+        filt[flds.STATE] = expected_state
+    changes = {flds.STATE: state, flds.STATE_RANK: get_state_rank(state)}
+    if referees is not None:
+        changes[flds.REFEREES] = referees
+    result = dbc.update(MANU_COLLECT, filt, changes,
+                        inc_fields={flds.VERSION: 1})
+    imap.evict(MANU_COLLECT, str(object_id))
+    _check_written(id, filt, result)
+    srch.index(id, {flds.STATE: state})
+    return id
+
+
+def _write_filter(object_id: ObjectId, expected_version: int = None) -> dict:
+    filt = {flds.ID: object_id}
+    if expected_version == 0:
+        filt[flds.VERSION] = {'$in': [0, None]}
+    elif expected_version is not None:
+        filt[flds.VERSION] = expected_version
+    return filt
+
+
+def _check_written(id: str, filt: dict, result) -> None:
+    if not result.matched_count:
+        if len(filt) > 1 and exists(id):
+            raise ManuscriptConflict(
+                f'Manuscript changed since it was read: {id=}')
+        raise ValueError(f'Can not update non-existent manuscript: {id=}')
+
+
+PATCH_FIELDS = [flds.TITLE, flds.AUTHOR, flds.AUTHOR_EMAIL, flds.REFEREES,
+                flds.STATE, flds.TEXT, flds.ABSTRACT]
+
+
+def patch(id: str, changes: dict, version: int = None) -> int:
+    """
+    Updates just the given fields of a manuscript, checking only those.
+    Changed text goes to the body store; unchanged text is not written.
+    Given a version, the write only lands if the manuscript is still at
+    it, and raises a ManuscriptConflict otherwise. Without one, it is
+    pinned to the version read here the same way, so the referee loads
+    are moved from the document the write actually replaced.
+    Returns the manuscript's new version.
+    """
+    try:
+        object_id = ObjectId(id)
+    except errors.InvalidId:
+        raise ValueError(f"Invalid ObjectId: {id}")
+    if not changes:
+        raise ValueError('No fields to update')
+    unknown = set(changes) - set(PATCH_FIELDS)
+    if unknown:
+        raise ValueError(f'Can not update fields: {sorted(unknown)}')
+
+    updates = dict(changes)
+    if flds.AUTHOR_EMAIL in updates:
+        if not ppl.exists(updates[flds.AUTHOR_EMAIL]):
+            raise ValueError(
+                f'Author doesnt exist: {updates[flds.AUTHOR_EMAIL]}')
+    if flds.REFEREES in updates:
+        referees = updates[flds.REFEREES]
+        if not isinstance(referees, list):
+            raise ValueError(f'Referees must be a list: {referees=}')
+        for referee in referees:
+            ppl.is_valid_email(referee)
+    if flds.STATE in updates:
+        if not is_valid_state(updates[flds.STATE]):
+            raise ValueError(f'Invalid state: {updates[flds.STATE]}')
+        updates[flds.STATE_RANK] = get_state_rank(updates[flds.STATE])
+
+    old_manu, version = _read_for_write(id, version)
+
+    old_body = None
+    if flds.TEXT in updates:
+        text = updates.pop(flds.TEXT) or ''
+        if old_manu.get(flds.TEXT_HASH) != bodies.get_hash(text):
+            updates.update(save_body(text))
+            old_body = old_manu.get(flds.TEXT_ID)
+        elif not updates:
+            # Only unchanged text was sent; still check and bump the version.
+            updates[flds.TEXT_HASH] = old_manu[flds.TEXT_HASH]
+
+    filt = _write_filter(object_id, version)
+    if flds.STATE in updates:
+        # The history entry names the state this write moves away from.
+        filt[flds.STATE] = old_manu[flds.STATE]
+    unset_fields = [flds.TEXT] if flds.TEXT_ID in updates else None
+    result = dbc.update(MANU_COLLECT, filt, updates,
+                        unset_fields=unset_fields,
+                        inc_fields={flds.VERSION: 1})
+    imap.evict(MANU_COLLECT, str(object_id))
+    if not result.matched_count and flds.TEXT_ID in updates:
+        bodies.delete(updates[flds.TEXT_ID])
+    _check_written(id, filt, result)
+    if flds.STATE in updates and updates[flds.STATE] != filt[flds.STATE]:
+        hist.record(id, filt[flds.STATE], updates[flds.STATE])
+    if flds.STATE in updates or flds.REFEREES in updates:
+        load.apply(old_manu, {**old_manu, **updates})
+    searchable = dict(changes)
+    if flds.TEXT_ID in updates:
+        add_revision(id, text)
+    else:
+        searchable.pop(flds.TEXT, None)  # unchanged
+    srch.index(id, searchable)
+    if old_body:
+        bodies.delete(old_body)
+    return version + 1
+
+
+def _read_for_write(id: str, version: int = None) -> tuple[dict, int]:
+    manu = get_one_manu(id, with_body=False)
+    if not manu:
+        raise ValueError(f'No such manuscript: {id}')
+    if version is None:
+        version = get_version(manu)
+    elif version != get_version(manu):
+        raise ManuscriptConflict(
+            f'Manuscript is at version {get_version(manu)}, not {version}')
+    return manu, version
+
+
+def transition(id: str, action: str, ref: str = None, version: int = None,
+               actor: str = None) -> tuple[str, int]:
+    """
+    Takes an action on a manuscript.
+    The new state is worked out from the manuscript as read, then written
+    only if the manuscript is still in that state and at that version, so
+    two editors acting at once can't overwrite each other: the second
+    gets a ManuscriptConflict.
+    Pass the version the caller last saw to also refuse any change made
+    since.
+    The transition is added to the manuscript's history.
+    Returns the new state and version.
+    """
+    before, version = _read_for_write(id, version)
+    # The action functions edit the referee list; leave the cached copy be.
+    manu = {**before, flds.REFEREES: list(before[flds.REFEREES])}
+    new_state = handle_action(manu[flds.STATE], action, manu=manu, ref=ref)
+    update_state(id, new_state, manu[flds.REFEREES],
+                 expected_state=manu[flds.STATE], expected_version=version)
+    hist.record(id, manu[flds.STATE], new_state, action, actor)
+    load.apply(before, {**manu, flds.STATE: new_state})
+    return new_state, version + 1
+
+
+def move(id: str, state: str, version: int = None,
+         actor: str = None) -> tuple[str, int]:
+    """
+    Moves a manuscript straight to a state, the editor's override, with
+    the same conflict checks as transition().
+    Returns the new state and version.
+    """
+    manu, version = _read_for_write(id, version)
+    update_state(id, state, expected_state=manu[flds.STATE],
+                 expected_version=version)
+    hist.record(id, manu[flds.STATE], state, actor=actor)
+    load.apply(manu, {**manu, flds.STATE: state})
+    return state, version + 1
+
+
+def save_body(text: str) -> dict:
+    """
+    Stores a manuscript's text in the body store.
+    Returns the fields that point the manuscript at it.
+    """
+    text = text or ''
+    body_id, size = bodies.save(text)
+    return {flds.TEXT_ID: body_id, flds.TEXT_SIZE: size,
+            flds.TEXT_HASH: bodies.get_hash(text)}
+
+
+def add_revision(id: str, text: str) -> str:
+    """
+    Keeps this version of a manuscript's text, and adds it to the
+    manuscript's list of revisions.
+    Returns the revision id.
+    """
+    revision_id = revs.save(id, text)
+    dbc.update_many(MANU_COLLECT, {flds.ID: ObjectId(id)},
+                    {'$push': {flds.REVISIONS: revision_id}})
+    imap.evict(MANU_COLLECT, id)
+    return revision_id
+
+
+def backfill_revisions() -> int:
+    """
+    Keeps the current text of every manuscript that has no revisions
+    yet as its first revision.
+    Returns the number of manuscripts updated.
+    """
+    count = 0
+    for manu in dbc.read_cursor(MANU_COLLECT,
+                                {flds.REVISIONS: {'$exists': False}},
+                                {flds.TEXT: 1, flds.TEXT_ID: 1}):
+        text = manu.get(flds.TEXT)
+        if manu.get(flds.TEXT_ID):
+            text = bodies.read(manu[flds.TEXT_ID])
+        add_revision(str(manu[flds.ID]), text or '')
+        count += 1
+    return count
+
+
+def get_text_size(manu: dict) -> int:
+    """
+    Returns the size of a manuscript's text in UTF-8 bytes.
+    """
+    if flds.TEXT_ID in manu:
+        return manu[flds.TEXT_SIZE]
+    return len((manu.get(flds.TEXT) or '').encode())
+
+
+def stream_text(manu: dict, start: int = 0, stop: int = None):
+    """
+    Yields the bytes of a manuscript's text from start to stop.
+    Manuscripts written before bodies were split out still hold their
+    text inline.
+    """
+    if flds.TEXT_ID in manu:
+        yield from bodies.stream(manu[flds.TEXT_ID], start, stop)
+    else:
+        yield (manu.get(flds.TEXT) or '').encode()[start:stop]
+
+
+def split_bodies() -> int:
+    """
+    Moves the text of manuscripts that still hold it inline into the
+    body store.
+    Returns the number of manuscripts updated.
+    """
+    count = 0
+    for manu in dbc.read_cursor(MANU_COLLECT, {flds.TEXT: {'$exists': True}},
+                                {flds.TEXT: 1}):
+        dbc.update(MANU_COLLECT, {flds.ID: manu[flds.ID]},
+                   save_body(manu[flds.TEXT]), unset_fields=[flds.TEXT])
+        count += 1
+    return count
+
+
 def get_manuscripts() -> dict[str, dict]:
     """
-    Retrieves all manuscripts from the database.
+    Retrieves all manuscripts from the database, without their text.
     Returns a dictionary of dictionaries:
     {id: each manuscript represented by a dictionary}
     """
-    manuscripts = dbc.read_dict(MANU_COLLECT, flds.ID, no_id=False)
-    return manuscripts
+    return Manuscript.read_keyed()
 
 
-def get_one_manu(id: str) -> dict:
+def get_one_manu(id: str, with_body: bool = True) -> dict:
     """
     Retrieves a manuscript from the database, by taking in an email.
+    With with_body False only the small metadata document is read, which
+    is all the workflow checks need.
     """
     try:
         object_id = ObjectId(id)
     except errors.InvalidId:
         raise ValueError(f"Invalid ObjectId: {id}")
     
-    manuscript = dbc.read_one(MANU_COLLECT, {flds.ID: object_id})
+    manuscript = imap.get(MANU_COLLECT, str(object_id))
+    if manuscript is imap.MISSING:
+        manuscript = dbc.read_one(MANU_COLLECT, {flds.ID: object_id})
+        imap.put(MANU_COLLECT, str(object_id), manuscript)
+    if with_body and manuscript and flds.TEXT_ID in manuscript:
+        text = bodies.read(manuscript[flds.TEXT_ID])
+        manuscript = {**manuscript, flds.TEXT: text}
     return manuscript
 
 
@@ -196,7 +537,17 @@ def delete(id: str) -> int:
     except errors.InvalidId:
         raise ValueError(f"Invalid ObjectId: {id}")
     
-    return dbc.delete(MANU_COLLECT, {flds.ID: object_id})
+    manuscript = get_one_manu(id, with_body=False)
+    imap.evict(MANU_COLLECT, str(object_id))
+    deleted = dbc.delete(MANU_COLLECT, {flds.ID: object_id})
+    if deleted and manuscript and manuscript.get(flds.TEXT_ID):
+        bodies.delete(manuscript[flds.TEXT_ID])
+    if deleted:
+        load.apply(manuscript, None)
+        hist.delete(str(object_id))
+        srch.remove(str(object_id))
+        revs.delete(str(object_id))
+    return deleted
 
 
 def exists(id: str) -> bool:
@@ -204,7 +555,7 @@ def exists(id: str) -> bool:
     Checks if a manuscript with the given title exists in the database.
     """
     try:
-        manuscript = get_one_manu(id)
+        manuscript = get_one_manu(id, with_body=False)
         return manuscript is not None
     except ValueError:
         return False
@@ -226,110 +577,141 @@ def delete_ref(manu: dict, ref: str) -> str:
     return SUBMITTED
 
 
-def get_active_manuscripts(user_email):
-    """
-    Returns active manuscripts visible to the given user.
-    """
-    active_manuscripts = []
-    manuscripts = get_manuscripts()
-    user_info = ppl.read_one(user_email)
-    user_roles = user_info.get(ppl.ROLES, [])
+def is_author_of(manu: dict, user_email: str) -> bool:
+    return (ppl.normalize_email(user_email)
+            == ppl.normalize_email(manu[flds.AUTHOR_EMAIL]))
 
-    for manu in manuscripts.values():
-        manu_state = manu[flds.STATE]
 
-        # Skip withdrawn/published/rejected
-        if manu_state in (WITHDRAWN, PUBLISHED, REJECTED):
-            continue
+def is_referee_of(manu: dict, user_email: str) -> bool:
+    key = ppl.normalize_email(user_email)
+    return any(key == ppl.normalize_email(referee)
+               for referee in manu[flds.REFEREES])
 
-        # Editors see all active manuscripts
-        if any(role in rls.MH_ROLES for role in user_roles):
-            active_manuscripts.append(manu)
-            continue
 
-        # Authors or referees see only their own
-        is_author = user_email == manu[flds.AUTHOR_EMAIL]
-        is_referee = user_email in manu[flds.REFEREES]
-        if is_author or is_referee:
-            active_manuscripts.append(manu)
-    
-    # Sort manuscripts by state
-    state_order = [
-        SUBMITTED, REFEREE_REVIEW, AUTHOR_REVISION, EDITOR_REVIEW, COPY_EDIT, AUTHOR_REVIEW, FORMATTING 
-    ]
+def get_active_manuscripts(user_email: str, limit: int = None,
+                           after: str = None) -> list[dict]:
+    """
+    Returns active manuscripts visible to the given user, in workflow
+    order (states.ACTIVE_STATE_ORDER), then by id.
+    Editors see every active manuscript; others see those they wrote or
+    referee. The filtering and sorting run in one indexed query, so the
+    cost follows the user's workload, not the journal's history.
+    Pass limit for a page at a time, and the id of the last manuscript
+    of a page as after to get the next one.
+    """
+    query = {flds.STATE: {'$nin': CLOSED_STATES}}
+    user_mask = ppl.get_cached_role_mask(user_email) or 0
+    if not rls.has_any(user_mask, rls.MH_MASK):
+        key = ppl.normalize_email(user_email)
+        query['$or'] = [{flds.AUTHOR_EMAIL: key}, {flds.REFEREES: key}]
+    if after:
+        try:
+            after_id = ObjectId(after)
+        except errors.InvalidId:
+            raise ValueError(f"Invalid ObjectId: {after}")
+        last = dbc.read_one(MANU_COLLECT, {flds.ID: after_id})
+        if not last:
+            raise ValueError(f'No such manuscript: {after}')
+        rank = last.get(flds.STATE_RANK, get_state_rank(last[flds.STATE]))
+        query = {'$and': [query, {'$or': [
+            {flds.STATE_RANK: {'$gt': rank}},
+            {flds.STATE_RANK: rank, flds.ID: {'$gt': after_id}},
+        ]}]}
+
+    cursor = (dbc.read_cursor(MANU_COLLECT, query)
+              .collation(dbc.CASE_INSENSITIVE)
+              .sort([(flds.STATE_RANK, 1), (flds.ID, 1)]))
+    if limit:
+        cursor = cursor.limit(limit)
+    return [dbc.convert_mongo_id(manu) for manu in cursor]
+
+
+def backfill_state_ranks() -> int:
+    """
+    Stores state_rank on every manuscript that lacks it or whose rank
+    no longer matches its state.
+    Returns the number of manuscripts updated.
+    """
+    count = 0
+    for state in VALID_STATES:
+        count += dbc.update_many(
+            MANU_COLLECT,
+            {flds.STATE: state,
+             flds.STATE_RANK: {'$ne': get_state_rank(state)}},
+            {'$set': {flds.STATE_RANK: get_state_rank(state)}})
+    return count
 
-    active_manuscripts.sort(key=lambda m: state_order.index(m[flds.STATE]))
 
-    return active_manuscripts
+def ensure_indexes() -> int:
+    """
+    Adds the indexes get_active_manuscripts() runs on: one for the
+    workflow sort, and one each for the author and referee matches.
+    They use the case-insensitive collation the query asks for.
+    Also adds a plain one on state, that stats counts states from.
+    Changes no documents, so returns 0.
+    """
+    for keys in ([(flds.STATE_RANK, 1), (flds.ID, 1)],
+                 flds.AUTHOR_EMAIL, flds.REFEREES):
+        dbc.create_index(MANU_COLLECT, keys, collation=dbc.CASE_INSENSITIVE)
+    dbc.create_index(MANU_COLLECT, flds.STATE)
+    return 0
+
+
+def goto(state: str) -> dict:
+    """
+    A STATE_TABLE entry for an action that always leads to state.
+    """
+    return {FUNC: lambda **kwargs: state, TARGETS: (state,)}
 
 
 COMMON_ACTIONS = {
-    ACTION_WITHDRAW: {
-        FUNC: lambda **kwargs: WITHDRAWN,
-    },
+    ACTION_WITHDRAW: goto(WITHDRAWN),
 }
 
 STATE_TABLE = {
     AUTHOR_REVIEW: {
-        ACTION_DONE: {
-            FUNC: lambda **kwargs: FORMATTING,
-        },
+        ACTION_DONE: goto(FORMATTING),
         **COMMON_ACTIONS,
     },
     AUTHOR_REVISION: {
-        ACTION_DONE: {
-            FUNC: lambda **kwargs: EDITOR_REVIEW,
-        },
+        ACTION_DONE: goto(EDITOR_REVIEW),
         **COMMON_ACTIONS,
     },
     COPY_EDIT: {
-        ACTION_DONE: {
-            FUNC: lambda **kwargs: AUTHOR_REVIEW,
-        },
+        ACTION_DONE: goto(AUTHOR_REVIEW),
         **COMMON_ACTIONS,
     },
     EDITOR_REVIEW: {
-        ACTION_ACCEPT: {
-            FUNC: lambda **kwargs: COPY_EDIT,
-        },
+        ACTION_ACCEPT: goto(COPY_EDIT),
         **COMMON_ACTIONS,
     },
     FORMATTING: {
-        ACTION_DONE: {
-            FUNC: lambda **kwargs: PUBLISHED,
-        },
+        ACTION_DONE: goto(PUBLISHED),
         **COMMON_ACTIONS,
     },
     PUBLISHED: {},
     REFEREE_REVIEW: {
-        ACTION_ACCEPT: {
-            FUNC: lambda **kwargs: COPY_EDIT,
-        },
-        ACTION_REJECT: {
-            FUNC: lambda **kwargs: REJECTED,
-        },
-        ACTION_ACCEPT_WITH_REV: {
-            FUNC: lambda **kwargs: AUTHOR_REVISION,
-        },
+        ACTION_ACCEPT: goto(COPY_EDIT),
+        ACTION_REJECT: goto(REJECTED),
+        ACTION_ACCEPT_WITH_REV: goto(AUTHOR_REVISION),
         ACTION_ASSIGN_REF: {
             FUNC: assign_ref,
+            TARGETS: (REFEREE_REVIEW,),
         },
         ACTION_DELETE_REF: {
             FUNC: delete_ref,
+            TARGETS: (REFEREE_REVIEW, SUBMITTED),
         },
-        ACTION_SUBMIT_REVIEW: {
-            FUNC: lambda **kwargs: REFEREE_REVIEW,
-        },
+        ACTION_SUBMIT_REVIEW: goto(REFEREE_REVIEW),
         **COMMON_ACTIONS,
     }, 
     REJECTED: {},
     SUBMITTED: {
         ACTION_ASSIGN_REF: {
             FUNC: assign_ref,
+            TARGETS: (REFEREE_REVIEW,),
         },
-        ACTION_REJECT: {
-            FUNC: lambda **kwargs: REJECTED,
-        },
+        ACTION_REJECT: goto(REJECTED),
         **COMMON_ACTIONS,
     },
     WITHDRAWN: {},
@@ -345,51 +727,90 @@ def handle_action(curr_state, action, **kwargs) -> str:
     return STATE_TABLE[curr_state][action][FUNC](**kwargs)
 
 
-def can_choose_action(manu_id: str, user_email: str) -> bool:
-    manu = get_one_manu(manu_id)
-    manu_author = manu[flds.AUTHOR_EMAIL]
-    manu_referees = manu[flds.REFEREES]
-    manu_state = manu[flds.STATE]
-    user_info = ppl.read_one(user_email)
-    user_roles = user_info.get(ppl.ROLES, [])
+class ManuscriptContext:
+    """
+    A manuscript together with one user's roles and relation to it.
+    Loading it reads the manuscript and the user once; every action and
+    state check for that pair can then be evaluated against it.
+    """
+    __slots__ = ('manu', 'user_email', 'user_mask', 'is_author',
+                 'is_referee')
+
+    def __init__(self, manu: dict, user_email: str, user_mask: int):
+        self.manu = manu
+        self.user_email = user_email
+        self.user_mask = user_mask  # None if there is no such user
+        self.is_author = is_author_of(manu, user_email)
+        self.is_referee = is_referee_of(manu, user_email)
+
+    @classmethod
+    def load(cls, manu_id: str, user_email: str) -> 'ManuscriptContext':
+        manu = get_one_manu(manu_id, with_body=False)
+        if not manu:
+            raise ValueError(f'No such manuscript: {manu_id}')
+        return cls(manu, user_email, ppl.get_cached_role_mask(user_email))
+
+    @property
+    def state(self) -> str:
+        return self.manu[flds.STATE]
+
+    @property
+    def mask(self) -> int:
+        return self.user_mask or 0
+
+
+def get_context(manu, user_email: str = None) -> ManuscriptContext:
+    """
+    Returns manu itself if it is already a ManuscriptContext, otherwise
+    loads one for the manuscript id and user.
+    """
+    if isinstance(manu, ManuscriptContext):
+        return manu
+    return ManuscriptContext.load(manu, user_email)
+
+
+def can_choose_action(manu_id, user_email: str = None) -> bool:
+    """
+    Takes a manuscript id and user email, or a ManuscriptContext.
+    """
+    ctx = get_context(manu_id, user_email)
+    manu_state = ctx.state
+    user_mask = ctx.mask
+    # Roles that may choose an action in this state
+    state_mask = CHOOSE_ACTION_MASKS.get(manu_state, 0)
 
     # Author logic
-    if user_email == manu_author:
-        if ACTION_WITHDRAW in STATE_TABLE.get(manu_state, {}):
+    if ctx.is_author:
+        if ACTION_WITHDRAW in STATE_ACTIONS.get(manu_state, ()):
             return True
-        if manu_state in ROLE_CHOOSE_ACTION.get(rls.AUTHOR_CODE, []):
+        if state_mask & rls.ROLE_BITS[rls.AUTHOR_CODE]:
             return True
 
     # Referee logic
-    if rls.RE_CODE in user_roles and user_email in manu_referees:
-        if manu_state in ROLE_CHOOSE_ACTION.get(rls.RE_CODE, []):
+    if ctx.is_referee:
+        if user_mask & state_mask & rls.ROLE_BITS[rls.RE_CODE]:
             return True
 
     # Editor logic
-    if user_email != manu_author:
-        for editor_role in rls.MH_ROLES:
-            if editor_role in user_roles:
-                if manu_state in ROLE_CHOOSE_ACTION.get(editor_role, []):
-                    return True
+    if not ctx.is_author:
+        if user_mask & state_mask & rls.MH_MASK:
+            return True
 
     return False
 
 
-def can_move_action(manu_id, user_email) -> bool:
-    manu = get_one_manu(manu_id)
-    manu_author = manu[flds.AUTHOR_EMAIL]
-    # manu_referees = manu[flds.REFEREES]
-    manu_state = manu[flds.STATE]
-    user_info = ppl.read_one(user_email)
-    user_roles = user_info.get(ppl.ROLES, [])
+def can_move_action(manu_id, user_email: str = None) -> bool:
+    """
+    Takes a manuscript id and user email, or a ManuscriptContext.
+    """
+    ctx = get_context(manu_id, user_email)
 
     #Editor logic ONLY
-    if user_email != manu_author:
-        for editor_role in rls.MH_ROLES:
-            if editor_role in user_roles:
-                if manu_state in VALID_STATES:
-                    return True
-                
+    if not ctx.is_author:
+        state_mask = MOVE_ACTION_MASKS.get(ctx.state, 0)
+        if ctx.mask & state_mask:
+            return True
+
     return False
 
 
@@ -422,65 +843,305 @@ ROLE_STATE_ACTIONS = {
 }
 
 
-def get_valid_actions(manu_id: str, user_email: str) -> list[str]:
+def check_workflow() -> None:
+    """
+    Checks STATE_TABLE and ROLE_STATE_ACTIONS against each other.
+    Raises a ValueError listing every state, action or target that is
+    unknown, every role action that is not a legal transition from its
+    state, and every state SUBMITTED can not lead to.
+    """
+    problems = []
+    for state, actions in STATE_TABLE.items():
+        if not is_valid_state(state):
+            problems.append(f'unknown state {state}')
+        for action, spec in actions.items():
+            if not is_valid_action(action):
+                problems.append(f'unknown action {action} in {state}')
+            for target in spec.get(TARGETS, ()):
+                if not is_valid_state(target):
+                    problems.append(f'{state}/{action} leads to unknown '
+                                    f'state {target}')
+    for role, state_actions in ROLE_STATE_ACTIONS.items():
+        if not rls.is_valid(role):
+            problems.append(f'unknown role {role}')
+        for state, actions in state_actions.items():
+            for action in actions:
+                if action not in STATE_TABLE.get(state, {}):
+                    problems.append(f'{role} may {action} in {state}, '
+                                    'which has no such transition')
+    reachable = {SUBMITTED} | _reachable_from(SUBMITTED)
+    for state in VALID_STATES:
+        if state not in reachable:
+            problems.append(f'{state} can not be reached from {SUBMITTED}')
+    if problems:
+        raise ValueError('Bad workflow: ' + '; '.join(problems))
+
+
+def _successors(state: str) -> frozenset:
+    return frozenset(target
+                     for spec in STATE_TABLE.get(state, {}).values()
+                     for target in spec.get(TARGETS, ()))
+
+
+def _reachable_from(state: str) -> frozenset:
+    seen = set()
+    todo = list(_successors(state))
+    while todo:
+        nxt = todo.pop()
+        if nxt not in seen:
+            seen.add(nxt)
+            todo.extend(_successors(nxt))
+    return frozenset(seen)
+
+
+def _role_actions(user_mask: int, state: str) -> tuple:
+    allowed = []
+    for role in rls.from_mask(user_mask):
+        for action in ROLE_STATE_ACTIONS.get(role, {}).get(state, []):
+            if action in STATE_TABLE[state] and action not in allowed:
+                allowed.append(action)
+    return tuple(allowed)
+
+
+check_workflow()
+
+# The workflow compiled into read-only lookup tables, once, at import.
+# state -> actions that can be taken there
+STATE_ACTIONS = MappingProxyType(
+    {state: frozenset(actions) for state, actions in STATE_TABLE.items()})
+# (role mask, state) -> actions those roles may take there
+ROLE_ACTIONS = MappingProxyType(
+    {(user_mask, state): _role_actions(user_mask, state)
+     for user_mask in range(rls.ALL_MASK + 1)
+     for state in STATE_TABLE})
+# state -> states a masthead editor may move a manuscript to
+MOVE_TARGETS = MappingProxyType(
+    {state: tuple(target for target in VALID_STATES
+                  if target not in (state, WITHDRAWN))
+     for state in VALID_STATES})
+
+
+def get_state_actions(user_mask: int) -> dict[str, list[str]]:
+    """
+    Returns {state: [actions]} the roles in user_mask may take, from
+    ROLE_STATE_ACTIONS.
+    These are role-level capabilities; whether the user is the author or
+    an assigned referee of a given manuscript is checked per manuscript.
+    """
+    state_actions = {}
+    for state in STATE_TABLE:
+        actions = ROLE_ACTIONS[(user_mask & rls.ALL_MASK, state)]
+        if actions:
+            state_actions[state] = list(actions)
+    return state_actions
+
+
+def get_valid_actions(manu_id, user_email: str = None) -> list[str]:
     """
     Returns the list of valid actions the user can perform on the manuscript.
+    Takes a manuscript id and user email, or a ManuscriptContext.
     """
-    if not can_choose_action(manu_id, user_email):
+    ctx = get_context(manu_id, user_email)
+    if not can_choose_action(ctx):
         return []
 
-    manu = get_one_manu(manu_id)
-    manu_state = manu[flds.STATE]
+    manu_state = ctx.state
+    if ctx.user_mask is None:
+        raise ValueError(f"No such user: {ctx.user_email}")
 
-    user_info = ppl.read_one(user_email)
-    if not user_info:
-        raise ValueError(f"No such user: {user_email}")
-    user_roles = user_info.get(ppl.ROLES, [])
+    user_mask = ctx.user_mask & rls.ALL_MASK
+    # Skip editor actions on your own manuscript
+    if ctx.is_author:
+        user_mask &= ~rls.MH_MASK
+    # Allow referee actions only if you're actually assigned
+    if not ctx.is_referee:
+        user_mask &= ~rls.ROLE_BITS[rls.RE_CODE]
 
-    result = []
-    is_author = user_email == manu[flds.AUTHOR_EMAIL]
-    is_referee = user_email in manu[flds.REFEREES]
-    next_actions = STATE_TABLE.get(manu_state, {}).keys()
+    result = list(ROLE_ACTIONS.get((user_mask, manu_state), ()))
 
-    for role in user_roles:
-        # Skip editor actions on your own manuscript
-        if is_author and role in rls.MH_ROLES:
-            continue
+    # Author can always withdraw
+    if (ctx.is_author
+            and ACTION_WITHDRAW in STATE_ACTIONS.get(manu_state, ())
+            and ACTION_WITHDRAW not in result):
+        result.append(ACTION_WITHDRAW)
 
-        # Allow referee actions only if you're actually assigned
-        if role == rls.RE_CODE and not is_referee:
-            continue
+    return result
+
+
+def get_manus(manu_ids: list[str]) -> list[dict]:
+    """
+    Retrieves the metadata of several manuscripts in one query.
+    Ids with no manuscript are left out.
+    """
+    object_ids = []
+    for id in manu_ids:
+        try:
+            object_ids.append(ObjectId(id))
+        except errors.InvalidId:
+            raise ValueError(f"Invalid ObjectId: {id}")
+    cursor = dbc.read_cursor(MANU_COLLECT, {flds.ID: {'$in': object_ids}},
+                             {flds.TEXT: 0})
+    return [dbc.convert_mongo_id(manu) for manu in cursor]
+
+
+def get_valid_actions_bulk(user_email: str,
+                           manu_ids: list[str] = None) -> dict:
+    """
+    Returns {manuscript id: [valid actions]} for the given manuscripts,
+    or for all of the user's active manuscripts if no ids are given.
+    The user and the manuscripts are each read once; the actions are
+    then worked out in memory.
+    """
+    user_mask = ppl.get_cached_role_mask(user_email)
+    if user_mask is None:
+        raise ValueError(f"No such user: {user_email}")
+    if manu_ids is None:
+        manus = get_active_manuscripts(user_email)
+    else:
+        manus = get_manus(manu_ids)
+    actions = {}
+    for manu in manus:
+        ctx = ManuscriptContext(manu, user_email, user_mask)
+        actions[manu[flds.ID]] = get_valid_actions(ctx)
+    return actions
 
-        state_actions = ROLE_STATE_ACTIONS.get(role, {})
-        allowed = state_actions.get(manu_state, [])
 
-        for action in allowed:
-            if action in next_actions and action not in result:
-                result.append(action)
+SUGGESTIONS = 5  # referees suggested when no limit is given
 
-    # Author can always withdraw
-    if is_author and ACTION_WITHDRAW in next_actions and ACTION_WITHDRAW not in result:
-        result.append(ACTION_WITHDRAW)
 
-    return result
+def suggest_referees(id: str, limit: int = None) -> list[dict]:
+    """
+    Returns the people best placed to referee a manuscript: those with
+    the referee role, other than its author and current referees, who
+    hold the fewest active manuscripts.
+    Returns [{email, count}], least loaded first.
+    """
+    manu = get_one_manu(id, with_body=False)
+    if not manu:
+        raise ValueError(f'No such manuscript: {id}')
+    taken = {ppl.normalize_email(email) for email in
+             [manu[flds.AUTHOR_EMAIL], *manu[flds.REFEREES]]}
+    candidates = [ppl.normalize_email(email)
+                  for email in ppl.get_role_holders(rls.RE_CODE)]
+    candidates = [email for email in candidates if email not in taken]
+    loads = load.get_loads(candidates)
+    best = heapq.nsmallest(limit or SUGGESTIONS, candidates,
+                           key=lambda email: (loads[email], email))
+    return [{ppl.EMAIL: email, load.COUNT: loads[email]} for email in best]
+
+
+# Outcomes of handle_actions()
+OUTCOME = 'outcome'
+ERROR = 'error'
+DONE = 'done'
+CONFLICT = 'conflict'
+INVALID = 'invalid'
+NOT_FOUND = 'not_found'
+
+
+def handle_actions(items: list[dict], actor: str = None) -> list[dict]:
+    """
+    Takes actions on many manuscripts at once.
+    Each item names a manuscript id, an action, and optionally a referee
+    and the version the caller last saw.
+    The manuscripts are read in one query and every action is checked
+    against STATE_TABLE in memory. The valid ones are then sent as one
+    unordered bulk write, each conditional on the state and version it
+    was worked out from, as in transition().
+    Each write also stores a fresh WRITE_ID token. The bulk result only
+    has totals, so which writes landed is read back by token: a version
+    and state alone can't tell our write from another request's, made
+    from the same version, that led to the same state.
+    Returns one outcome per item, in order: done (with the new state and
+    version), or conflict, invalid or not_found (with an error).
+    """
+    outcomes = [{flds.ID: item.get(flds.ID)} for item in items]
+    ids = []
+    for outcome in outcomes:
+        if ObjectId.is_valid(outcome[flds.ID]):
+            ids.append(outcome[flds.ID])
+        else:
+            outcome.update({OUTCOME: INVALID,
+                            ERROR: f'Invalid ObjectId: {outcome[flds.ID]}'})
+    manus = {manu[flds.ID]: manu for manu in get_manus(ids)} if ids else {}
+
+    planned = {}
+    for item, outcome in zip(items, outcomes):
+        if OUTCOME in outcome:
+            continue
+        id = outcome[flds.ID]
+        before = manus.get(id)
+        if not before:
+            outcome.update({OUTCOME: NOT_FOUND,
+                            ERROR: f'No such manuscript: {id}'})
+            continue
+        if id in planned:
+            outcome.update({OUTCOME: INVALID,
+                            ERROR: f'Manuscript listed more than once: {id}'})
+            continue
+        version = item.get(flds.VERSION)
+        if version is not None and version != get_version(before):
+            outcome.update({OUTCOME: CONFLICT,
+                            ERROR: f'Manuscript is at version '
+                                   f'{get_version(before)}, not {version}'})
+            continue
+        manu = {**before, flds.REFEREES: list(before[flds.REFEREES])}
+        try:
+            new_state = handle_action(before[flds.STATE],
+                                      item.get(flds.ACTION), manu=manu,
+                                      ref=item.get(flds.REFEREES))
+        except ValueError as err:
+            outcome.update({OUTCOME: INVALID, ERROR: str(err)})
+            continue
+        planned[id] = (item, outcome, before,
+                       {**manu, flds.STATE: new_state})
+
+    if not planned:
+        return outcomes
+    writes = []
+    tokens = {}
+    for id, (item, outcome, before, after) in planned.items():
+        filt = _write_filter(ObjectId(id), get_version(before))
+        filt[flds.STATE] = before[flds.STATE]
+        tokens[id] = str(ObjectId())
+        writes.append(dbc.UpdateOne(filt, {
+            '$set': {flds.STATE: after[flds.STATE],
+                     flds.STATE_RANK: get_state_rank(after[flds.STATE]),
+                     flds.REFEREES: after[flds.REFEREES],
+                     flds.WRITE_ID: tokens[id]},
+            '$inc': {flds.VERSION: 1},
+        }))
+    dbc.bulk_write(MANU_COLLECT, writes, ordered=False)
+
+    written = {manu[flds.ID]: manu for manu in get_manus(list(planned))}
+    for id, (item, outcome, before, after) in planned.items():
+        imap.evict(MANU_COLLECT, id)
+        now = written.get(id)
+        new_version = get_version(before) + 1
+        if not now or now.get(flds.WRITE_ID) != tokens[id]:
+            outcome.update({OUTCOME: CONFLICT,
+                            ERROR: f'Manuscript changed since it was read: '
+                                   f'{id}'})
+            continue
+        outcome.update({OUTCOME: DONE, flds.STATE: after[flds.STATE],
+                        flds.VERSION: new_version})
+        hist.record(id, before[flds.STATE], after[flds.STATE],
+                    item.get(flds.ACTION), actor)
+        load.apply(before, after)
+        srch.index(id, {flds.STATE: after[flds.STATE]})
+    return outcomes
+
 
-def get_valid_states(manu_id: str, user_emai: str) ->list[str]:
+def get_valid_states(manu_id, user_emai: str = None) ->list[str]:
     """
     Returns list of approriate states the editor can move the manuscript to.
+    Takes a manuscript id and user email, or a ManuscriptContext.
     """
-    if not can_move_action(manu_id, user_emai):
+    ctx = get_context(manu_id, user_emai)
+    if not can_move_action(ctx):
         return []
     
-    manu = get_one_manu(manu_id)
-    manu_state = manu[flds.STATE]
-
-    states = []
-    for state in VALID_STATES:
-        if state != manu_state and state not in states:
-            if state != WITHDRAWN:
-                states.append(state)
-
-    return states
+    return list(MOVE_TARGETS.get(ctx.state, ()))
     
    
 def main():
@@ -0,0 +1,96 @@
+"""
+This module keeps count of how many active manuscripts each referee
+holds, so editors can see workloads without scanning every manuscript.
+Counts live in their own collection, one document per referee keyed by
+normalized email. They are moved along by the difference each write
+makes to a manuscript's referees: assigning or removing a referee, and
+a manuscript closing (or reopening), which releases (or takes back) all
+of its referees.
+rebuild() recounts everything from the manuscripts, should counts ever
+drift.
+"""
+import data.db_connect as dbc
+from data.emails import normalize_email
+import data.manuscripts.fields as flds
+import data.manuscripts.states as sts
+
+LOAD_COLLECT = 'referee_load'
+MANU_COLLECT = 'manuscripts'
+
+COUNT = 'count'
+
+
+def get_active_referees(manu: dict) -> set[str]:
+    """
+    Returns the referees a manuscript adds to their loads: all of them
+    while it is active, none once it is closed or gone.
+    """
+    if not manu or manu.get(flds.STATE) in sts.CLOSED_STATES:
+        return set()
+    referees = manu.get(flds.REFEREES) or []
+    if isinstance(referees, str):
+        referees = [referees]
+    return {normalize_email(referee) for referee in referees if referee}
+
+
+def apply(before: dict, after: dict, session=None) -> None:
+    """
+    Moves the counts along for a manuscript written from before to
+    after; either may be None for a manuscript created or deleted.
+    """
+    old = get_active_referees(before)
+    new = get_active_referees(after)
+    for referee in new - old:
+        _add(referee, 1, session)
+    for referee in old - new:
+        _add(referee, -1, session)
+
+
+def _add(referee: str, change: int, session=None) -> None:
+    dbc.update_many(LOAD_COLLECT, {flds.ID: referee},
+                    {'$inc': {COUNT: change}}, session=session, upsert=True)
+
+
+def forget(email: str, session=None) -> int:
+    """
+    Drops a referee's count, once they referee nothing.
+    """
+    return dbc.delete_many(LOAD_COLLECT, {flds.ID: normalize_email(email)},
+                           session=session)
+
+
+def get_loads(emails: list[str] = None) -> dict[str, int]:
+    """
+    Returns {referee email: active manuscripts they hold}, for the given
+    emails (0 for those holding none) or for every counted referee.
+    """
+    filt = {}
+    loads = {}
+    if emails is not None:
+        keys = [normalize_email(email) for email in emails]
+        filt = {flds.ID: {'$in': keys}}
+        loads = dict.fromkeys(keys, 0)
+    for doc in dbc.read_cursor(LOAD_COLLECT, filt):
+        loads[doc[flds.ID]] = doc[COUNT]
+    return loads
+
+
+def rebuild() -> int:
+    """
+    Recounts every referee's load from the active manuscripts.
+    Returns the number of referees counted.
+    """
+    referee = {'$toLower': {'$trim': {'input': f'${flds.REFEREES}'}}}
+    counts = dbc.aggregate(MANU_COLLECT, [
+        {'$match': {flds.STATE: {'$nin': sts.CLOSED_STATES}}},
+        {'$unwind': f'${flds.REFEREES}'},
+        {'$group': {flds.ID: referee, COUNT: {'$sum': 1}}},
+    ])
+
+    def replace(session):
+        dbc.delete_many(LOAD_COLLECT, {}, session=session)
+        if counts:
+            dbc.create_many(LOAD_COLLECT, counts, session=session)
+        return len(counts)
+
+    return dbc.in_transaction(replace)
@@ -0,0 +1,182 @@
+"""
+This module keeps every version of each manuscript's text.
+A text is split into paragraphs, and each paragraph is stored once, as a
+chunk keyed by the SHA-256 of its content. A revision is just the list
+of its chunk keys, so paragraphs that don't change between versions are
+shared rather than stored again.
+Chunks are only ever added; collect_garbage() drops those no revision
+uses any more. Saving a revision stamps each of its chunks, new or
+reused, with the time, before the revision itself is written; chunks
+stamped within GC_GRACE seconds are never collected, so a save in
+progress can't lose the chunks it is about to refer to.
+"""
+import os
+import re
+import time
+
+from bson import ObjectId, errors
+
+import data.db_connect as dbc
+import data.manuscripts.bodies as bodies
+
+CHUNK_COLLECT = 'revision_chunks'
+REVISION_COLLECT = 'manuscript_revisions'
+
+# Chunk fields
+ID = '_id'
+DATA = 'data'
+REFERENCED_AT = 'referenced_at'  # last saved into a revision
+
+# Revision fields
+MANU_ID = 'manu_id'
+CHUNKS = 'chunks'
+SIZE = 'size'  # bytes of UTF-8
+HASH = 'hash'  # as bodies.get_hash
+AT = 'at'  # seconds since the epoch
+
+# Paragraphs longer than this are cut into pieces of this size.
+MAX_CHUNK = int(os.environ.get('REVISION_MAX_CHUNK', 64 * 1024))  # chars
+
+# How long a chunk is kept after it was last saved, used or not, and
+# how many orphans collect_garbage() deletes per request.
+GC_GRACE = int(os.environ.get('REVISION_GC_GRACE', 60 * 60))  # seconds
+GC_BATCH = 1000
+
+PARAGRAPH_END = re.compile(r'(\n[ \t]*\n\s*)')
+
+
+def split(text: str) -> list[str]:
+    """
+    Splits text into paragraphs that join back into it exactly; each
+    keeps the blank lines that end it.
+    """
+    parts = PARAGRAPH_END.split(text)
+    paragraphs = [body + end for body, end
+                  in zip(parts[::2], parts[1::2] + [''])]
+    return [paragraph[start:start + MAX_CHUNK]
+            for paragraph in paragraphs if paragraph
+            for start in range(0, len(paragraph), MAX_CHUNK)]
+
+
+def get_key(chunk: str) -> str:
+    return bodies.get_hash(chunk)
+
+
+def _to_object_id(revision_id: str) -> ObjectId:
+    try:
+        return ObjectId(revision_id)
+    except errors.InvalidId:
+        raise ValueError(f'Invalid revision id: {revision_id}')
+
+
+def save(manu_id: str, text: str) -> str:
+    """
+    Stores a version of a manuscript's text, adding only the chunks not
+    already stored.
+    Returns the new revision's id.
+    """
+    text = text or ''
+    chunks = split(text)
+    keys = [get_key(chunk) for chunk in chunks]
+    now = time.time()
+    if chunks:
+        # A chunk already stored keeps its data, and only gets restamped.
+        writes = [dbc.UpdateOne({ID: key},
+                                {'$setOnInsert': {DATA: chunk},
+                                 '$set': {REFERENCED_AT: now}},
+                                upsert=True)
+                  for key, chunk in dict(zip(keys, chunks)).items()]
+        dbc.bulk_write(CHUNK_COLLECT, writes, ordered=False)
+    result = dbc.create(REVISION_COLLECT, {
+        MANU_ID: manu_id,
+        CHUNKS: keys,
+        SIZE: len(text.encode()),
+        HASH: bodies.get_hash(text),
+        AT: now,
+    })
+    return str(result.inserted_id)
+
+
+def get_revisions(manu_id: str) -> list[dict]:
+    """
+    Returns a manuscript's revisions, oldest first, without their text.
+    """
+    cursor = (dbc.read_cursor(REVISION_COLLECT, {MANU_ID: manu_id},
+                              {CHUNKS: 0})
+              .sort([(AT, 1), (ID, 1)]))
+    return [dbc.convert_mongo_id(revision) for revision in cursor]
+
+
+def read(manu_id: str, revision_id: str) -> str:
+    """
+    Returns the text of one of a manuscript's revisions.
+    """
+    revision = dbc.read_one(REVISION_COLLECT,
+                            {ID: _to_object_id(revision_id),
+                             MANU_ID: manu_id})
+    if not revision:
+        raise ValueError(f'No such revision: {revision_id}')
+    keys = revision[CHUNKS]
+    found = {chunk[ID]: chunk[DATA] for chunk in
+             dbc.read_cursor(CHUNK_COLLECT, {ID: {'$in': keys}})}
+    if not found.keys() >= set(keys):
+        # collect_garbage() ran while this revision was being saved
+        raise ValueError(f'Revision has missing chunks: {revision_id}')
+    return ''.join(found[key] for key in keys)
+
+
+def delete(manu_id: str) -> int:
+    """
+    Deletes a manuscript's revisions; their chunks stay until
+    collect_garbage().
+    Returns the count of revisions deleted.
+    """
+    return dbc.delete_many(REVISION_COLLECT, {MANU_ID: manu_id})
+
+
+def delete_all(manu_ids: list[str], session=None) -> int:
+    """
+    Deletes the revisions of several manuscripts at once.
+    Returns the count of revisions deleted.
+    """
+    return dbc.delete_many(REVISION_COLLECT, {MANU_ID: {'$in': manu_ids}},
+                           session=session)
+
+
+def collect_garbage(grace: int = None) -> int:
+    """
+    Deletes the chunks no revision refers to that weren't saved in the
+    last grace seconds (GC_GRACE by default).
+    The orphans are found in the DB, each chunk looking itself up in the
+    revisions' chunk index, and deleted GC_BATCH at a time. Every delete
+    checks the stamp again, so a chunk a save reuses meanwhile stays.
+    Returns the count of chunks deleted.
+    """
+    cutoff = time.time() - (GC_GRACE if grace is None else grace)
+    # Chunks stored before they were stamped count as old.
+    old = {REFERENCED_AT: {'$not': {'$gte': cutoff}}}
+    orphans = dbc.aggregate(CHUNK_COLLECT, [
+        {'$match': old},
+        {'$project': {ID: 1}},
+        {'$lookup': {'from': REVISION_COLLECT, 'localField': ID,
+                     'foreignField': CHUNKS, 'as': REVISION_COLLECT,
+                     'pipeline': [{'$limit': 1}, {'$project': {ID: 1}}]}},
+        {'$match': {REVISION_COLLECT: []}},
+        {'$project': {ID: 1}},
+    ])
+    deleted = 0
+    for start in range(0, len(orphans), GC_BATCH):
+        batch = [row[ID] for row in orphans[start:start + GC_BATCH]]
+        deleted += dbc.delete_many(CHUNK_COLLECT, {ID: {'$in': batch}, **old})
+    return deleted
+
+
+def ensure_indexes() -> int:
+    """
+    Adds the index revision listings run on, and the one on chunk keys
+    collect_garbage() looks chunks up in.
+    Changes no documents, so returns 0.
+    """
+    dbc.create_index(REVISION_COLLECT, [(MANU_ID, 1), (AT, 1), (ID, 1)])
+    dbc.create_index(REVISION_COLLECT, CHUNKS)
+    return 0
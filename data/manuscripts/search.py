@@ -0,0 +1,154 @@
+"""
+This module keeps the full-text search index over manuscripts.
+Manuscript text lives in the body store (data.manuscripts.bodies), out of
+reach of a text index on the manuscripts themselves, so each manuscript
+has a search document of its own holding its title, abstract, text,
+state and author email, under the manuscript's id.
+One weighted text index covers the three text fields; state and author
+are kept alongside so results can be filtered in the same query.
+data.manuscripts.query keeps the search documents current as manuscripts
+are written; rebuild() fills them in for manuscripts written before.
+"""
+import os
+import re
+
+from bson import ObjectId, errors
+
+import data.db_connect as dbc
+from data.emails import normalize_email
+import data.manuscripts.bodies as bodies
+import data.manuscripts.fields as flds
+
+SEARCH_COLLECT = 'manuscript_search'
+MANU_COLLECT = 'manuscripts'
+
+WEIGHTS = {
+    flds.TITLE: 10,
+    flds.ABSTRACT: 5,
+    flds.TEXT: 1,
+}
+SEARCH_FIELDS = [*WEIGHTS, flds.STATE, flds.AUTHOR_EMAIL]
+
+# Only the start of very long texts is indexed.
+MAX_TEXT = int(os.environ.get('SEARCH_MAX_TEXT', 1_000_000))  # chars
+DEFAULT_LIMIT = 20
+SNIPPET_CHARS = 160
+
+# Result fields
+SCORE = 'score'
+SNIPPET = 'snippet'
+
+
+def _to_object_id(manu_id: str) -> ObjectId:
+    try:
+        return ObjectId(manu_id)
+    except errors.InvalidId:
+        raise ValueError(f'Invalid ObjectId: {manu_id}')
+
+
+def index(manu_id: str, changes: dict) -> None:
+    """
+    Copies the searchable fields among changes to a manuscript's search
+    document, creating it if need be.
+    """
+    doc = {field: changes[field] for field in SEARCH_FIELDS
+           if field in changes}
+    if not doc:
+        return
+    if doc.get(flds.TEXT):
+        doc[flds.TEXT] = doc[flds.TEXT][:MAX_TEXT]
+    if doc.get(flds.AUTHOR_EMAIL):
+        doc[flds.AUTHOR_EMAIL] = normalize_email(doc[flds.AUTHOR_EMAIL])
+    dbc.update(SEARCH_COLLECT, {flds.ID: _to_object_id(manu_id)}, doc,
+               upsert=True)
+
+
+def remove(manu_id: str) -> int:
+    return dbc.delete(SEARCH_COLLECT, {flds.ID: _to_object_id(manu_id)})
+
+
+def get_terms(query: str) -> list[str]:
+    """
+    Returns the words of a search, less those it excludes with a '-'.
+    """
+    return [word for minus, word in re.findall(r'(-?)(\w+)', query)
+            if not minus]
+
+
+def make_snippet(doc: dict, terms: list[str]) -> str:
+    """
+    Returns about SNIPPET_CHARS of the text, abstract or title around
+    the first place a search term starts a word, or the start of the
+    abstract if none does.
+    """
+    pattern = (re.compile('|'.join(rf'\b{re.escape(term)}' for term in terms),
+                          re.IGNORECASE)
+               if terms else None)
+    for field in (flds.TEXT, flds.ABSTRACT, flds.TITLE):
+        text = doc.get(field) or ''
+        found = pattern.search(text) if pattern else None
+        if found:
+            start = max(found.start() - SNIPPET_CHARS // 2, 0)
+            stop = start + SNIPPET_CHARS
+            return (('...' if start else '') + text[start:stop]
+                    + ('...' if stop < len(text) else ''))
+    text = doc.get(flds.ABSTRACT) or doc.get(flds.TEXT) or ''
+    return text[:SNIPPET_CHARS] + ('...' if len(text) > SNIPPET_CHARS else '')
+
+
+def search(query: str, state: str = None, author: str = None,
+           limit: int = None, offset: int = 0) -> list[dict]:
+    """
+    Returns manuscripts matching a text search, best first: their id,
+    title, author email, state, score and a snippet of where they match.
+    Title matches count most, then the abstract, then the text.
+    Results can be limited to a state and an author, and paged with
+    limit and offset.
+    """
+    if not query or not query.strip():
+        raise ValueError('Search query is empty')
+    filt = {'$text': {'$search': query}}
+    if state:
+        filt[flds.STATE] = state
+    if author:
+        filt[flds.AUTHOR_EMAIL] = normalize_email(author)
+    score = {'$meta': 'textScore'}
+    cursor = (dbc.read_cursor(SEARCH_COLLECT, filt, {SCORE: score})
+              .sort([(SCORE, score), (flds.ID, 1)])
+              .skip(offset or 0)
+              .limit(limit or DEFAULT_LIMIT))
+    terms = get_terms(query)
+    return [{
+        flds.ID: str(doc[flds.ID]),
+        flds.TITLE: doc.get(flds.TITLE),
+        flds.AUTHOR_EMAIL: doc.get(flds.AUTHOR_EMAIL),
+        flds.STATE: doc.get(flds.STATE),
+        SCORE: doc[SCORE],
+        SNIPPET: make_snippet(doc, terms),
+    } for doc in cursor]
+
+
+def rebuild() -> int:
+    """
+    Writes the search document of every manuscript from scratch.
+    Returns the number of manuscripts indexed.
+    """
+    count = 0
+    for manu in dbc.read_cursor(MANU_COLLECT):
+        text = manu.get(flds.TEXT)
+        if manu.get(flds.TEXT_ID):
+            text = bodies.read(manu[flds.TEXT_ID])
+        index(str(manu[flds.ID]), {**manu, flds.TEXT: text or ''})
+        count += 1
+    return count
+
+
+def ensure_indexes() -> int:
+    """
+    Adds the weighted text index searches run on.
+    Changes no documents, so returns 0.
+    """
+    dbc.create_index(SEARCH_COLLECT,
+                     [(field, 'text') for field in WEIGHTS],
+                     weights=WEIGHTS)
+    return 0
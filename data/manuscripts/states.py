@@ -0,0 +1,31 @@
+"""
+This module holds the manuscript state codes and the order they are listed in.
+It imports nothing, so modules that data.manuscripts.query itself
+imports can use them too. The workflow between them is in query.
+"""
+AUTHOR_REVIEW = 'AU_RVW'
+AUTHOR_REVISION = 'AU_REV'
+COPY_EDIT = 'CED'
+EDITOR_REVIEW = 'ED_RVW'
+FORMATTING = 'FMT'
+PUBLISHED = 'PUB'
+REFEREE_REVIEW = 'REF_RVW'
+REJECTED = 'REJ'
+SUBMITTED = 'SUB'
+WITHDRAWN = 'WDN'
+
+# Finished manuscripts; everything else is active.
+CLOSED_STATES = [PUBLISHED, REJECTED, WITHDRAWN]
+
+# The order active manuscripts are listed in; stored on each manuscript
+# as state_rank so the DB can sort on it.
+ACTIVE_STATE_ORDER = [
+    SUBMITTED, REFEREE_REVIEW, AUTHOR_REVISION, EDITOR_REVIEW, COPY_EDIT,
+    AUTHOR_REVIEW, FORMATTING,
+]
+STATE_RANKS = {state: rank for rank, state in enumerate(ACTIVE_STATE_ORDER)}
+CLOSED_RANK = len(ACTIVE_STATE_ORDER)
+
+
+def get_state_rank(state: str) -> int:
+    return STATE_RANKS.get(state, CLOSED_RANK)
@@ -0,0 +1,155 @@
+"""
+This module works out the editorial dashboard figures: how many
+manuscripts are in each state, how many active ones each referee and
+author has, and how long manuscripts stay in each state.
+Every figure comes from an aggregation pipeline run in the DB; nothing
+is computed by pulling manuscripts or history entries into Python.
+
+Results are cached for STATS_TTL seconds, except the state counts: they
+are taken again on every read, so moves, deletions and withdrawals show
+up right away. That is one $group over the state index.
+"""
+import os
+import threading
+import time
+
+import data.db_connect as dbc
+import data.manuscripts.fields as flds
+import data.manuscripts.history as hist
+import data.manuscripts.query as qry
+
+STATS_TTL = int(os.environ.get('STATS_TTL', 300))  # seconds
+PERCENTILES = [0.5, 0.75, 0.9]
+
+# Stat names
+STATE_COUNTS = 'state_counts'
+REFEREE_COUNTS = 'referee_counts'
+AUTHOR_COUNTS = 'author_counts'
+TIME_IN_STATE = 'time_in_state'
+MEDIAN = 'median'
+COUNT = 'count'
+COMPUTED_AT = 'computed_at'
+
+ACTIVE = {'$match': {flds.STATE: {'$nin': qry.CLOSED_STATES}}}
+LEFT_AT = 'left_at'
+
+cache = {}
+lock = threading.Lock()
+
+
+def percentile_name(p: float) -> str:
+    return f'p{round(p * 100)}'
+
+
+def _counts(pipeline: list[dict]) -> dict:
+    return {row[dbc.MONGO_ID]: row[COUNT]
+            for row in dbc.aggregate(qry.MANU_COLLECT, pipeline)
+            if row[dbc.MONGO_ID] is not None}
+
+
+def get_state_counts() -> dict:
+    """
+    Returns {state: manuscripts in it}.
+    Sorting on the state first lets the DB count from the state index
+    alone, without reading the manuscripts.
+    """
+    counts = dict.fromkeys(qry.VALID_STATES, 0)
+    counts.update(_counts([
+        {'$sort': {flds.STATE: 1}},
+        {'$group': {dbc.MONGO_ID: f'${flds.STATE}', COUNT: {'$sum': 1}}},
+    ]))
+    return counts
+
+
+def get_referee_counts() -> dict:
+    """
+    Returns {referee email: active manuscripts they referee}.
+    """
+    return _counts([
+        ACTIVE,
+        {'$unwind': f'${flds.REFEREES}'},
+        {'$group': {dbc.MONGO_ID: {'$toLower': f'${flds.REFEREES}'},
+                    COUNT: {'$sum': 1}}},
+    ])
+
+
+def get_author_counts() -> dict:
+    """
+    Returns {author email: active manuscripts they wrote}.
+    """
+    return _counts([
+        ACTIVE,
+        {'$group': {dbc.MONGO_ID: {'$toLower': f'${flds.AUTHOR_EMAIL}'},
+                    COUNT: {'$sum': 1}}},
+    ])
+
+
+def get_time_in_state() -> dict:
+    """
+    Returns {state: {median, percentiles, count}} of the seconds
+    manuscripts spent in each state before leaving it.
+    Each history entry is paired with the next one for its manuscript,
+    whose time is when the state was left; visits still under way are
+    not counted. Time folded into snapshots is not counted either.
+    """
+    duration = {'$subtract': [f'${LEFT_AT}', f'${hist.AT}']}
+    rows = dbc.aggregate(hist.HISTORY_COLLECT, [
+        {'$setWindowFields': {
+            'partitionBy': f'${hist.MANU_ID}',
+            'sortBy': {hist.AT: 1, hist.ID: 1},
+            'output': {LEFT_AT: {'$shift': {'output': f'${hist.AT}',
+                                            'by': 1}}},
+        }},
+        {'$match': {LEFT_AT: {'$ne': None}}},
+        {'$group': {
+            dbc.MONGO_ID: f'${hist.TO_STATE}',
+            MEDIAN: {'$median': {'input': duration,
+                                 'method': 'approximate'}},
+            'percentiles': {'$percentile': {'input': duration,
+                                            'p': PERCENTILES,
+                                            'method': 'approximate'}},
+            COUNT: {'$sum': 1},
+        }},
+    ])
+    times = {}
+    for row in rows:
+        times[row[dbc.MONGO_ID]] = {
+            MEDIAN: row[MEDIAN],
+            **{percentile_name(p): value
+               for p, value in zip(PERCENTILES, row['percentiles'])},
+            COUNT: row[COUNT],
+        }
+    return times
+
+
+def compute() -> dict:
+    """
+    Runs the cached pipelines and returns fresh stats.
+    """
+    return {
+        REFEREE_COUNTS: get_referee_counts(),
+        AUTHOR_COUNTS: get_author_counts(),
+        TIME_IN_STATE: get_time_in_state(),
+        COMPUTED_AT: time.time(),
+    }
+
+
+def get_stats(refresh: bool = False) -> dict:
+    """
+    Returns the dashboard stats, from the cache when it is fresh enough,
+    with the state counts as they are now.
+    """
+    global cache
+    with lock:
+        if (refresh or not cache
+                or time.time() - cache[COMPUTED_AT] > STATS_TTL):
+            cache = compute()
+        stats = dict(cache)
+    stats[STATE_COUNTS] = get_state_counts()
+    return stats
+
+
+def reset() -> None:
+    global cache
+    with lock:
+        cache = {}
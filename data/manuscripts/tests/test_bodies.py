@@ -0,0 +1,81 @@
+from unittest.mock import patch, MagicMock
+
+import pytest
+
+from bson import ObjectId
+
+import data.manuscripts.bodies as bodies
+
+TEXT = 'Once upon a time, there were three bears. ' * 10
+
+
+@pytest.fixture
+def chunk_store(monkeypatch):
+    """
+    Keeps saved chunks in a list, and serves reads by body id and chunk
+    number range the way the chunk query asks for them.
+    """
+    monkeypatch.setattr(bodies, 'CHUNK_SIZE', 16)
+    chunks = []
+
+    def read_cursor(collection, filt, projection=None):
+        nums = filt[bodies.NUM]
+        found = [chunk for chunk in chunks
+                 if chunk[bodies.BODY_ID] == filt[bodies.BODY_ID]
+                 and nums['$gte'] <= chunk[bodies.NUM]
+                 <= nums.get('$lte', chunk[bodies.NUM])]
+        cursor = MagicMock()
+        cursor.sort.return_value = sorted(found,
+                                          key=lambda c: c[bodies.NUM])
+        return cursor
+
+    with patch('data.db_connect.create_many',
+               side_effect=lambda collection, docs: chunks.extend(docs)):
+        with patch('data.db_connect.read_cursor', side_effect=read_cursor):
+            yield chunks
+
+
+def test_save_and_read(chunk_store):
+    body_id, size = bodies.save(TEXT)
+    assert size == len(TEXT.encode())
+    assert len(chunk_store) == -(-size // bodies.CHUNK_SIZE)
+    assert bodies.read(body_id) == TEXT
+
+
+def test_stream_range(chunk_store):
+    body_id, size = bodies.save(TEXT)
+    for start, stop in [(0, 5), (10, 40), (16, 32), (size - 3, size)]:
+        got = b''.join(bodies.stream(body_id, start, stop))
+        assert got == TEXT.encode()[start:stop]
+
+
+def test_stream_range_reads_only_needed_chunks(chunk_store):
+    body_id, _ = bodies.save(TEXT)
+    with patch('data.db_connect.read_cursor') as mock_cursor:
+        list(bodies.stream(body_id, 40, 50))
+    nums = mock_cursor.call_args.args[1][bodies.NUM]
+    assert nums == {'$gte': 2, '$lte': 3}
+
+
+def test_empty_body(chunk_store):
+    body_id, size = bodies.save('')
+    assert size == 0
+    assert bodies.read(body_id) == ''
+
+
+def test_get_hash():
+    assert bodies.get_hash(TEXT) == bodies.get_hash(TEXT)
+    assert bodies.get_hash(TEXT) != bodies.get_hash(TEXT + '!')
+
+
+def test_bad_body_id():
+    with pytest.raises(ValueError):
+        bodies.read('not an id')
+
+
+@patch('data.db_connect.delete_many', return_value=3)
+def test_delete_all(mock_delete):
+    body_ids = [str(ObjectId()), str(ObjectId())]
+    assert bodies.delete_all(body_ids) == 3
+    assert mock_delete.call_args.args[1] == {
+        bodies.BODY_ID: {'$in': [ObjectId(body_id) for body_id in body_ids]}}
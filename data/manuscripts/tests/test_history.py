@@ -0,0 +1,107 @@
+from unittest.mock import patch, MagicMock
+
+import pytest
+
+import data.manuscripts.history as hist
+
+MANU_ID = '0123456789abcdef01234567'
+
+
+def entry(from_state, to_state, at, action=None):
+    return {hist.MANU_ID: MANU_ID, hist.FROM_STATE: from_state,
+            hist.TO_STATE: to_state, hist.ACTION: action,
+            hist.ACTOR: None, hist.AT: at}
+
+
+ENTRIES = [
+    entry(None, 'SUB', 0),
+    entry('SUB', 'REF_RVW', 100, 'ARF'),
+    entry('REF_RVW', 'CED', 400, 'ACC'),
+]
+
+
+@patch('data.db_connect.create')
+def test_record(mock_create):
+    mock_create.return_value.inserted_id = 'abc'
+    assert hist.record(MANU_ID, 'SUB', 'REF_RVW', 'ARF', 'ed@nyu.edu',
+                       at=5) == 'abc'
+    doc = mock_create.call_args.args[1]
+    assert doc == {hist.MANU_ID: MANU_ID, hist.FROM_STATE: 'SUB',
+                   hist.TO_STATE: 'REF_RVW', hist.ACTION: 'ARF',
+                   hist.ACTOR: 'ed@nyu.edu', hist.AT: 5}
+
+
+@patch('data.db_connect.create_many')
+def test_record_many(mock_create_many):
+    assert hist.record_many(ENTRIES, session='s') == 3
+    mock_create_many.assert_called_once_with(hist.HISTORY_COLLECT, ENTRIES,
+                                             session='s')
+
+
+@patch('data.db_connect.create_many')
+def test_record_many_none(mock_create_many):
+    assert hist.record_many([]) == 0
+    mock_create_many.assert_not_called()
+
+
+@patch('data.db_connect.delete_many', return_value=4)
+def test_delete_all(mock_delete_many):
+    assert hist.delete_all([MANU_ID]) == 4
+    assert mock_delete_many.call_args.args[1] == {
+        hist.MANU_ID: {'$in': [MANU_ID]}}
+
+
+def test_summarize():
+    snapshot = hist.summarize(ENTRIES)
+    assert snapshot[hist.SNAPSHOT]
+    assert snapshot[hist.ENTRIES] == 3
+    assert snapshot[hist.FROM_STATE] is None
+    assert snapshot[hist.TO_STATE] == 'CED'
+    assert snapshot[hist.AT] == 400
+    assert snapshot[hist.STATE_TIMES] == {'SUB': 100, 'REF_RVW': 300}
+
+
+def test_summarize_folds_snapshots():
+    first = hist.summarize(ENTRIES[:2])
+    again = hist.summarize([first, ENTRIES[2]])
+    assert again == hist.summarize(ENTRIES)
+
+
+@patch('data.db_connect.in_transaction', side_effect=lambda func: func(None))
+@patch('data.db_connect.delete_many', return_value=3)
+@patch('data.db_connect.create')
+def test_compact(mock_create, mock_delete, mock_transaction):
+    entries = [{**doc, hist.ID: num} for num, doc in enumerate(ENTRIES)]
+    with patch('data.db_connect.read_cursor') as mock_cursor:
+        mock_cursor.return_value.sort.return_value = entries
+        assert hist.compact(MANU_ID, 1000) == 3
+    assert mock_create.call_args.args[1] == hist.summarize(entries)
+    assert mock_delete.call_args.args[1] == {hist.ID: {'$in': [0, 1, 2]}}
+
+
+def test_compact_nothing_to_do():
+    with patch('data.db_connect.read_cursor') as mock_cursor:
+        mock_cursor.return_value.sort.return_value = ENTRIES[:1]
+        assert hist.compact(MANU_ID, 1000) == 0
+
+
+def test_read_bad_after():
+    with pytest.raises(ValueError):
+        hist.read(MANU_ID, after='not an id')
+
+
+@patch('data.db_connect.read_one', return_value=None)
+def test_read_missing_after(mock_read_one):
+    with pytest.raises(ValueError):
+        hist.read(MANU_ID, after=MANU_ID)
+
+
+def test_read_page():
+    cursor = MagicMock()
+    cursor.sort.return_value.limit.return_value = []
+    with patch('data.db_connect.read_cursor',
+               return_value=cursor) as mock_cursor:
+        assert hist.read(MANU_ID, limit=5) == []
+    assert mock_cursor.call_args.args[1] == {hist.MANU_ID: MANU_ID}
+    cursor.sort.assert_called_once_with(hist.ORDER)
+    cursor.sort.return_value.limit.assert_called_once_with(5)
@@ -1,9 +1,13 @@
 import random
 import copy
 import pytest
+from unittest.mock import patch, MagicMock
 
 import data.manuscripts.query as mqry
+import data.manuscripts.bodies as bodies
 import data.manuscripts.fields as flds
+import data.manuscripts.history as hist
+import data.manuscripts.revisions as revs
 import data.people as ppl
 import data.roles as rls
 
@@ -17,6 +21,7 @@ TEST_TITLE = "Three Little Bears"
 TEST_AUTHOR_NAME = 'Joe Smith'
 TEST_REFEREE = 'bob@nyu.edu'
 TEST_NEW_REFEREE = 'alice@nyu.edu'
+TEST_EDITOR = 'carol@nyu.edu'
 TEST_TEXT = "Hi my name is Andy"
 TEST_ABSTRACT = "This is the Abstract"
 
@@ -148,7 +153,9 @@ def test_create_manuscript(temp_person):
     assert manuscript[flds.AUTHOR_EMAIL] == temp_person
     assert manuscript[flds.REFEREES] == [TEST_REFEREE]
     assert manuscript[flds.STATE] == mqry.SUBMITTED
-    assert manuscript[flds.TEXT] == TEST_TEXT
+    # the text lives in the body store, not the manuscript
+    assert flds.TEXT not in manuscript
+    assert mqry.bodies.read(manuscript[flds.TEXT_ID]) == TEST_TEXT
     assert manuscript[flds.ABSTRACT] == TEST_ABSTRACT
     assert isinstance(manuscript[flds.ID], str)
 
@@ -157,6 +164,46 @@ def test_create_manuscript(temp_person):
     assert mqry.dbc.read_one(mqry.MANU_COLLECT, {flds.ID: object_id}) is None
 
 
+@patch('data.manuscripts.search.index')
+@patch('data.manuscripts.referee_load.apply')
+@patch('data.manuscripts.history.record')
+@patch('data.manuscripts.query.add_revision')
+@patch('data.people.update')
+@patch('data.people.read_one', return_value={ppl.ROLES: [rls.AUTHOR_CODE]})
+@patch('data.people.exists', return_value=True)
+@patch('data.manuscripts.query.save_body', return_value={})
+@patch('data.db_connect.create',
+       return_value=MagicMock(inserted_id=ObjectId('0' * 24)))
+def test_create_manuscript_referee_list(mock_create, mock_save, mock_exists,
+                                        mock_read, mock_update, mock_rev,
+                                        mock_record, mock_apply, mock_index):
+    referees = ['Ref.One@nyu.edu', 'ref_two@nyu.edu']
+    manu_id = mqry.create_manuscript(TEST_TITLE, TEST_AUTHOR_NAME,
+                                     'cas_author@nyu.edu', referees,
+                                     mqry.SUBMITTED, TEST_TEXT, TEST_ABSTRACT)
+    assert manu_id == '0' * 24
+    assert mock_create.call_args.args[1][flds.REFEREES] == referees
+    mock_apply.assert_called_once()
+
+
+@patch('data.people.update')
+@patch('data.manuscripts.query.save_body')
+@patch('data.db_connect.create')
+def test_create_manuscript_checks_before_writing(mock_create, mock_save,
+                                                 mock_update):
+    with pytest.raises(ValueError):
+        mqry.create_manuscript(TEST_TITLE, TEST_AUTHOR_NAME,
+                               'cas_author@nyu.edu', ['not an email'],
+                               mqry.SUBMITTED, TEST_TEXT, TEST_ABSTRACT)
+    with pytest.raises(ValueError):
+        mqry.create_manuscript(TEST_TITLE, TEST_AUTHOR_NAME,
+                               'cas_author@nyu.edu', [], 'not a state',
+                               TEST_TEXT, TEST_ABSTRACT)
+    mock_save.assert_not_called()
+    mock_create.assert_not_called()
+    mock_update.assert_not_called()
+
+
 def test_update(temp_manu, temp_person):
     updated_id = mqry.update(
         temp_manu,
@@ -413,3 +460,457 @@ def test_valid_actions_editor_assign_ref(temp_person):
     finally:
         mqry.delete(manu_id)
         ppl.delete(author_email)
+
+
+def test_is_author_of_ignores_case():
+    manu = {flds.AUTHOR_EMAIL: 'an3299@Nyu.edu', flds.REFEREES: []}
+    assert mqry.is_author_of(manu, 'AN3299@nyu.edu')
+    assert not mqry.is_author_of(manu, 'someone@nyu.edu')
+
+
+def test_is_referee_of_ignores_case():
+    manu = {flds.AUTHOR_EMAIL: 'an3299@nyu.edu',
+            flds.REFEREES: ['Referee@NYU.edu']}
+    assert mqry.is_referee_of(manu, 'referee@nyu.edu')
+    assert not mqry.is_referee_of(manu, 'an3299@nyu.edu')
+
+
+def test_delete_person_pulls_referee(temp_referee, temp_ref_manu):
+    ppl.delete(temp_referee.upper())
+    manu = mqry.get_one_manu(temp_ref_manu)
+    assert temp_referee not in manu[flds.REFEREES]
+
+
+def test_delete_person_withdraws_authored(temp_person, temp_manu):
+    ppl.delete(temp_person, ppl.WITHDRAW_AUTHORED)
+    assert mqry.get_one_manu(temp_manu)[flds.STATE] == mqry.WITHDRAWN
+
+
+def test_delete_person_logs_withdrawal(temp_person, temp_manu):
+    ppl.delete(temp_person, ppl.WITHDRAW_AUTHORED)
+    last = hist.read(temp_manu)[-1]
+    assert last[hist.FROM_STATE] == mqry.SUBMITTED
+    assert last[hist.TO_STATE] == mqry.WITHDRAWN
+
+
+def test_delete_person_deletes_authored(temp_person, temp_manu):
+    text_id = mqry.get_one_manu(temp_manu, with_body=False)[flds.TEXT_ID]
+    ppl.delete(temp_person, ppl.DELETE_AUTHORED)
+    assert mqry.get_one_manu(temp_manu) is None
+    assert b''.join(bodies.stream(text_id)) == b''
+    assert hist.read(temp_manu) == []
+    assert revs.get_revisions(temp_manu) == []
+
+
+def test_delete_person_refuses_author(temp_person, temp_manu):
+    with pytest.raises(ValueError):
+        ppl.delete(temp_person, ppl.REFUSE_AUTHORED)
+    assert ppl.exists(temp_person)
+
+
+def test_delete_person_bad_policy(temp_person):
+    with pytest.raises(ValueError):
+        ppl.delete(temp_person, 'not a policy')
+
+
+def test_get_state_rank():
+    assert mqry.get_state_rank(mqry.SUBMITTED) == 0
+    assert (mqry.get_state_rank(mqry.SUBMITTED)
+            < mqry.get_state_rank(mqry.REFEREE_REVIEW)
+            < mqry.get_state_rank(mqry.FORMATTING)
+            < mqry.get_state_rank(mqry.PUBLISHED))
+
+
+@patch('data.people.get_cached_role_mask', return_value=0)
+def test_get_active_manuscripts_query(mock_mask):
+    cursor = MagicMock()
+    chain = cursor.return_value.collation.return_value.sort.return_value
+    chain.limit.return_value = iter([])
+    with patch('data.db_connect.read_cursor', cursor):
+        assert mqry.get_active_manuscripts('Author@NYU.edu', limit=5) == []
+    query = cursor.call_args.args[1]
+    assert query[flds.STATE] == {'$nin': mqry.CLOSED_STATES}
+    assert {flds.AUTHOR_EMAIL: 'author@nyu.edu'} in query['$or']
+    chain.limit.assert_called_once_with(5)
+
+
+@patch('data.people.get_cached_role_mask',
+       return_value=rls.to_mask([rls.ED_CODE]))
+def test_get_active_manuscripts_editor_query(mock_mask):
+    cursor = MagicMock()
+    cursor.return_value.collation.return_value.sort.return_value = iter([])
+    with patch('data.db_connect.read_cursor', cursor):
+        assert mqry.get_active_manuscripts('editor@nyu.edu') == []
+    # editors are not limited to their own manuscripts
+    assert '$or' not in cursor.call_args.args[1]
+
+
+def test_get_active_manuscripts_paged(temp_person, temp_manu):
+    person = ppl.read_one(temp_person)
+    ppl.update(person[ppl.NAME], person[ppl.AFFILIATION], temp_person,
+               [rls.AUTHOR_CODE])
+    second = mqry.create_manuscript(TEST_TITLE, TEST_AUTHOR_NAME, temp_person,
+                                    '', mqry.SUBMITTED, TEST_TEXT,
+                                    TEST_ABSTRACT)
+    try:
+        first_page = mqry.get_active_manuscripts(temp_person, limit=1)
+        assert [m[flds.ID] for m in first_page] == [temp_manu]
+        next_page = mqry.get_active_manuscripts(temp_person, limit=1,
+                                                after=temp_manu)
+        assert [m[flds.ID] for m in next_page] == [second]
+    finally:
+        mqry.delete(second)
+
+
+def test_update_keeps_unchanged_body(temp_manu, temp_person):
+    before = mqry.get_one_manu(temp_manu, with_body=False)
+    mqry.update(temp_manu, TEST_TITLE, TEST_AUTHOR_NAME, temp_person,
+                [TEST_REFEREE], mqry.REFEREE_REVIEW, TEST_TEXT,
+                TEST_ABSTRACT)
+    after = mqry.get_one_manu(temp_manu, with_body=False)
+    assert after[flds.TEXT_ID] == before[flds.TEXT_ID]
+    assert flds.TEXT not in after
+
+
+def test_update_adds_revision(temp_manu, temp_person):
+    first = mqry.get_one_manu(temp_manu, with_body=False)[flds.REVISIONS]
+    mqry.update(temp_manu, TEST_TITLE, TEST_AUTHOR_NAME, temp_person,
+                [TEST_REFEREE], mqry.SUBMITTED, TEST_TEXT + '\n\nMore.',
+                TEST_ABSTRACT)
+    mqry.update(temp_manu, TEST_TITLE, TEST_AUTHOR_NAME, temp_person,
+                [TEST_REFEREE], mqry.SUBMITTED, TEST_TEXT + '\n\nMore.',
+                TEST_ABSTRACT)  # unchanged text, so no new revision
+    revisions = mqry.get_one_manu(temp_manu, with_body=False)[flds.REVISIONS]
+    assert len(first) == 1
+    assert revisions[0] == first[0]
+    assert len(revisions) == 2
+    assert revs.read(temp_manu, revisions[0]) == TEST_TEXT
+    assert revs.read(temp_manu, revisions[1]) == TEST_TEXT + '\n\nMore.'
+
+
+def test_update_state(temp_manu):
+    mqry.update_state(temp_manu, mqry.REFEREE_REVIEW, [TEST_NEW_REFEREE])
+    manu = mqry.get_one_manu(temp_manu)
+    assert manu[flds.STATE] == mqry.REFEREE_REVIEW
+    assert manu[flds.STATE_RANK] == mqry.get_state_rank(mqry.REFEREE_REVIEW)
+    assert manu[flds.REFEREES] == [TEST_NEW_REFEREE]
+    assert manu[flds.TEXT] == TEST_TEXT
+
+
+def test_update_state_bad_state(temp_manu):
+    with pytest.raises(ValueError):
+        mqry.update_state(temp_manu, 'not a state')
+
+
+def test_update_state_conflict(temp_manu):
+    with pytest.raises(mqry.ManuscriptConflict):
+        mqry.update_state(temp_manu, mqry.REFEREE_REVIEW,
+                          expected_state=mqry.COPY_EDIT)
+
+
+def test_transition(temp_manu):
+    new_state, version = mqry.transition(temp_manu, mqry.ACTION_ASSIGN_REF,
+                                         TEST_NEW_REFEREE, 0, TEST_EDITOR)
+    assert new_state == mqry.REFEREE_REVIEW
+    assert version == 1
+    history = hist.read(temp_manu)
+    assert [entry[hist.TO_STATE] for entry in history] == [
+        mqry.SUBMITTED, mqry.REFEREE_REVIEW]
+    assert history[-1][hist.ACTION] == mqry.ACTION_ASSIGN_REF
+    assert history[-1][hist.ACTOR] == TEST_EDITOR
+    manu = mqry.get_one_manu(temp_manu, with_body=False)
+    assert mqry.get_version(manu) == 1
+    with pytest.raises(mqry.ManuscriptConflict):
+        mqry.transition(temp_manu, mqry.ACTION_ACCEPT, version=0)
+
+
+CAS_ID = '0123456789abcdef01234567'
+CAS_MANU = {
+    flds.ID: CAS_ID,
+    flds.AUTHOR_EMAIL: 'cas_author@nyu.edu',
+    flds.REFEREES: [],
+    flds.STATE: mqry.SUBMITTED,
+    flds.VERSION: 2,
+}
+
+
+@patch('data.manuscripts.query.exists', return_value=True)
+@patch('data.db_connect.update', return_value=MagicMock(matched_count=0))
+@patch('data.manuscripts.query.get_one_manu', return_value=CAS_MANU)
+def test_transition_lost_race(mock_get_one, mock_update, mock_exists):
+    with pytest.raises(mqry.ManuscriptConflict):
+        mqry.transition(CAS_ID, mqry.ACTION_ASSIGN_REF, TEST_NEW_REFEREE)
+    filt = mock_update.call_args.args[1]
+    assert filt == {flds.ID: ObjectId(CAS_ID), flds.STATE: mqry.SUBMITTED,
+                    flds.VERSION: 2}
+    assert CAS_MANU[flds.REFEREES] == []
+
+
+@patch('data.db_connect.update')
+@patch('data.manuscripts.query.get_one_manu', return_value=CAS_MANU)
+def test_transition_stale_version(mock_get_one, mock_update):
+    with pytest.raises(mqry.ManuscriptConflict):
+        mqry.transition(CAS_ID, mqry.ACTION_REJECT, version=1)
+    mock_update.assert_not_called()
+
+
+def test_patch_title(temp_manu):
+    mqry.patch(temp_manu, {flds.TITLE: 'Patched Title'})
+    manu = mqry.get_one_manu(temp_manu)
+    assert manu[flds.TITLE] == 'Patched Title'
+    assert manu[flds.TEXT] == TEST_TEXT
+    assert mqry.get_version(manu) == 1
+
+
+@patch('data.manuscripts.search.index')
+@patch('data.manuscripts.history.record')
+@patch('data.manuscripts.query.get_one_manu', return_value=CAS_MANU)
+@patch('data.db_connect.update', return_value=MagicMock(matched_count=1))
+def test_patch_state_only(mock_update, mock_get_one, mock_record,
+                          mock_index):
+    mqry.patch(CAS_ID, {flds.STATE: mqry.COPY_EDIT}, version=2)
+    args, kwargs = mock_update.call_args
+    assert args[1] == {flds.ID: ObjectId(CAS_ID), flds.VERSION: 2,
+                       flds.STATE: mqry.SUBMITTED}
+    assert args[2] == {flds.STATE: mqry.COPY_EDIT,
+                       flds.STATE_RANK: mqry.get_state_rank(mqry.COPY_EDIT)}
+    assert kwargs['inc_fields'] == {flds.VERSION: 1}
+    assert not kwargs['unset_fields']
+    mock_record.assert_called_once_with(CAS_ID, mqry.SUBMITTED,
+                                        mqry.COPY_EDIT)
+    mock_index.assert_called_once_with(CAS_ID, {flds.STATE: mqry.COPY_EDIT})
+
+
+@patch('data.manuscripts.search.index')
+@patch('data.manuscripts.referee_load.apply')
+@patch('data.manuscripts.query.get_one_manu', return_value=CAS_MANU)
+@patch('data.db_connect.update', return_value=MagicMock(matched_count=1))
+def test_patch_referees_pins_read_version(mock_update, mock_get_one,
+                                          mock_apply, mock_index):
+    referees = ['cas_ref@nyu.edu']
+    assert mqry.patch(CAS_ID, {flds.REFEREES: referees}) == 3
+    assert mock_update.call_args.args[1] == {flds.ID: ObjectId(CAS_ID),
+                                             flds.VERSION: 2}
+    # the loads move from the document the write was pinned to
+    mock_apply.assert_called_once_with(
+        CAS_MANU, {**CAS_MANU, flds.REFEREES: referees})
+
+
+@patch('data.manuscripts.query.exists', return_value=True)
+@patch('data.manuscripts.query.get_one_manu', return_value=CAS_MANU)
+@patch('data.db_connect.update', return_value=MagicMock(matched_count=0))
+def test_patch_lost_race_without_version(mock_update, mock_get_one,
+                                         mock_exists):
+    with pytest.raises(mqry.ManuscriptConflict):
+        mqry.patch(CAS_ID, {flds.REFEREES: ['cas_ref@nyu.edu']})
+
+
+@patch('data.db_connect.update')
+def test_patch_bad_fields(mock_update):
+    with pytest.raises(ValueError):
+        mqry.patch(CAS_ID, {})
+    with pytest.raises(ValueError):
+        mqry.patch(CAS_ID, {'no_such_field': 1})
+    with pytest.raises(ValueError):
+        mqry.patch(CAS_ID, {flds.STATE: 'not a state'})
+    with pytest.raises(ValueError):
+        mqry.patch(CAS_ID, {flds.REFEREES: 'not a list'})
+    mock_update.assert_not_called()
+
+
+def test_stream_inline_text():
+    manu = {flds.TEXT: TEST_TEXT}
+    assert mqry.get_text_size(manu) == len(TEST_TEXT.encode())
+    assert b''.join(mqry.stream_text(manu, 3, 7)) == TEST_TEXT.encode()[3:7]
+
+
+CTX_AUTHOR = 'ctx_author@nyu.edu'
+CTX_REFEREE = 'ctx_referee@nyu.edu'
+CTX_MANU = {
+    flds.ID: 'ctx123',
+    flds.AUTHOR_EMAIL: CTX_AUTHOR,
+    flds.REFEREES: [CTX_REFEREE],
+    flds.STATE: mqry.REFEREE_REVIEW,
+}
+
+
+def test_context_referee_actions():
+    ctx = mqry.ManuscriptContext(CTX_MANU, CTX_REFEREE,
+                                 rls.to_mask([rls.RE_CODE]))
+    assert ctx.is_referee and not ctx.is_author
+    assert mqry.can_choose_action(ctx)
+    assert mqry.get_valid_actions(ctx) == [mqry.ACTION_SUBMIT_REVIEW]
+    assert mqry.get_valid_states(ctx) == []
+
+
+def test_context_editor_states():
+    ctx = mqry.ManuscriptContext(CTX_MANU, 'ctx_editor@nyu.edu',
+                                 rls.to_mask([rls.ED_CODE]))
+    assert mqry.can_move_action(ctx)
+    states = mqry.get_valid_states(ctx)
+    assert mqry.REFEREE_REVIEW not in states
+    assert mqry.SUBMITTED in states
+
+
+@patch('data.people.get_cached_role_mask',
+       return_value=rls.to_mask([rls.RE_CODE]))
+@patch('data.manuscripts.query.get_one_manu', return_value=CTX_MANU)
+def test_valid_actions_fetch_once(mock_get_one, mock_mask):
+    mqry.get_valid_actions('ctx123', CTX_REFEREE)
+    mock_get_one.assert_called_once()
+    mock_mask.assert_called_once()
+
+
+@patch('data.manuscripts.query.get_one_manu', return_value=None)
+def test_context_no_manuscript(mock_get_one):
+    with pytest.raises(ValueError):
+        mqry.get_valid_actions('ctx123', CTX_REFEREE)
+
+
+@patch('data.people.get_cached_role_mask',
+       return_value=rls.to_mask([rls.RE_CODE]))
+def test_valid_actions_bulk(mock_mask):
+    other_manu = {**CTX_MANU, flds.ID: 'ctx456', flds.REFEREES: []}
+    with patch('data.manuscripts.query.get_manus',
+               return_value=[CTX_MANU, other_manu]) as mock_get:
+        actions = mqry.get_valid_actions_bulk(CTX_REFEREE,
+                                              ['ctx123', 'ctx456'])
+    mock_get.assert_called_once_with(['ctx123', 'ctx456'])
+    mock_mask.assert_called_once()
+    assert actions == {'ctx123': [mqry.ACTION_SUBMIT_REVIEW], 'ctx456': []}
+
+
+@patch('data.people.get_cached_role_mask', return_value=0)
+def test_valid_actions_bulk_active(mock_mask):
+    with patch('data.manuscripts.query.get_active_manuscripts',
+               return_value=[]) as mock_active:
+        assert mqry.get_valid_actions_bulk(CTX_REFEREE) == {}
+    mock_active.assert_called_once_with(CTX_REFEREE)
+
+
+@patch('data.people.get_cached_role_mask', return_value=None)
+def test_valid_actions_bulk_no_user(mock_mask):
+    with pytest.raises(ValueError):
+        mqry.get_valid_actions_bulk('nobody@nyu.edu', ['ctx123'])
+
+
+def test_get_manus_bad_id():
+    with pytest.raises(ValueError):
+        mqry.get_manus(['not an id'])
+
+
+def test_role_actions_table():
+    editor = rls.to_mask([rls.ED_CODE])
+    assert (mqry.ROLE_ACTIONS[(editor, mqry.SUBMITTED)]
+            == (mqry.ACTION_ASSIGN_REF, mqry.ACTION_REJECT))
+    assert mqry.ROLE_ACTIONS[(editor, mqry.PUBLISHED)] == ()
+    assert len(mqry.ROLE_ACTIONS) == (rls.ALL_MASK + 1) * len(mqry.STATE_TABLE)
+    with pytest.raises(TypeError):
+        mqry.ROLE_ACTIONS[(editor, mqry.PUBLISHED)] = (mqry.ACTION_DONE,)
+
+
+def test_valid_actions_editor_author():
+    ctx = mqry.ManuscriptContext({**CTX_MANU, flds.STATE: mqry.SUBMITTED},
+                                 CTX_MANU[flds.AUTHOR_EMAIL],
+                                 rls.to_mask([rls.ED_CODE, rls.AUTHOR_CODE]))
+    assert mqry.get_valid_actions(ctx) == [mqry.ACTION_WITHDRAW]
+
+
+def test_check_workflow():
+    mqry.check_workflow()
+    bad = {rls.RE_CODE: {mqry.SUBMITTED: [mqry.ACTION_SUBMIT_REVIEW]}}
+    with patch.dict(mqry.ROLE_STATE_ACTIONS, bad):
+        with pytest.raises(ValueError):
+            mqry.check_workflow()
+
+
+BULK_IDS = ['0123456789abcdef0123456a', '0123456789abcdef0123456b',
+            '0123456789abcdef0123456c', '0123456789abcdef0123456d']
+BULK_MANUS = [
+    {flds.ID: BULK_IDS[0], flds.STATE: mqry.FORMATTING, flds.REFEREES: [],
+     flds.VERSION: 1},
+    {flds.ID: BULK_IDS[1], flds.STATE: mqry.SUBMITTED, flds.REFEREES: []},
+    {flds.ID: BULK_IDS[2], flds.STATE: mqry.SUBMITTED, flds.REFEREES: [],
+     flds.VERSION: 4},
+]
+
+
+def bulk_tokens(mock_bulk) -> list[str]:
+    writes = mock_bulk.call_args.args[1]
+    return [write._doc['$set'][flds.WRITE_ID] for write in writes]
+
+
+@patch('data.manuscripts.search.index')
+@patch('data.manuscripts.referee_load.apply')
+@patch('data.manuscripts.history.record')
+@patch('data.db_connect.bulk_write')
+def test_handle_actions(mock_bulk, mock_record, mock_load, mock_index):
+    def read_back(ids):
+        token = bulk_tokens(mock_bulk)[0]
+        return [{**BULK_MANUS[0], flds.STATE: mqry.PUBLISHED,
+                 flds.VERSION: 2, flds.WRITE_ID: token},
+                # someone else moved this one first
+                {**BULK_MANUS[1], flds.STATE: mqry.REFEREE_REVIEW,
+                 flds.VERSION: 1}]
+
+    items = [
+        {flds.ID: BULK_IDS[0], flds.ACTION: mqry.ACTION_DONE},
+        {flds.ID: BULK_IDS[1], flds.ACTION: mqry.ACTION_REJECT},
+        {flds.ID: BULK_IDS[2], flds.ACTION: mqry.ACTION_DONE},
+        {flds.ID: BULK_IDS[2], flds.ACTION: mqry.ACTION_REJECT,
+         flds.VERSION: 3},
+        {flds.ID: BULK_IDS[3], flds.ACTION: mqry.ACTION_REJECT},
+        {flds.ID: 'bad id', flds.ACTION: mqry.ACTION_REJECT},
+    ]
+    reads = iter([lambda ids: BULK_MANUS, read_back])
+    with patch('data.manuscripts.query.get_manus',
+               side_effect=lambda ids: next(reads)(ids)) as mock_get:
+        outcomes = mqry.handle_actions(items, TEST_EDITOR)
+
+    assert mock_get.call_count == 2
+    assert [outcome[mqry.OUTCOME] for outcome in outcomes] == [
+        mqry.DONE, mqry.CONFLICT, mqry.INVALID, mqry.CONFLICT,
+        mqry.NOT_FOUND, mqry.INVALID]
+    assert outcomes[0][flds.STATE] == mqry.PUBLISHED
+    assert outcomes[0][flds.VERSION] == 2
+
+    writes, = mock_bulk.call_args.args[1:]
+    assert mock_bulk.call_args.kwargs['ordered'] is False
+    assert [write._filter for write in writes] == [
+        {flds.ID: ObjectId(BULK_IDS[0]), flds.VERSION: 1,
+         flds.STATE: mqry.FORMATTING},
+        {flds.ID: ObjectId(BULK_IDS[1]), flds.VERSION: {'$in': [0, None]},
+         flds.STATE: mqry.SUBMITTED},
+    ]
+    mock_record.assert_called_once_with(BULK_IDS[0], mqry.FORMATTING,
+                                        mqry.PUBLISHED, mqry.ACTION_DONE,
+                                        TEST_EDITOR)
+
+
+@patch('data.manuscripts.search.index')
+@patch('data.manuscripts.referee_load.apply')
+@patch('data.manuscripts.history.record')
+@patch('data.db_connect.bulk_write')
+def test_handle_actions_same_base_version(mock_bulk, mock_record, mock_load,
+                                          mock_index):
+    # Another request rejected the manuscript from the same version first.
+    # It left the state and version this write would have, but its own
+    # token, so only that request may report it done.
+    theirs = {**BULK_MANUS[2], flds.STATE: mqry.REJECTED, flds.VERSION: 5,
+              flds.WRITE_ID: 'their token'}
+    items = [{flds.ID: BULK_IDS[2], flds.ACTION: mqry.ACTION_REJECT,
+              flds.VERSION: 4}]
+    with patch('data.manuscripts.query.get_manus',
+               side_effect=[[BULK_MANUS[2]], [theirs]]):
+        outcomes = mqry.handle_actions(items, TEST_EDITOR)
+    assert outcomes[0][mqry.OUTCOME] == mqry.CONFLICT
+    assert bulk_tokens(mock_bulk)[0] != 'their token'
+    mock_record.assert_not_called()
+    mock_load.assert_not_called()
+
+
+@patch('data.db_connect.bulk_write')
+def test_handle_actions_nothing_valid(mock_bulk):
+    outcomes = mqry.handle_actions([{flds.ID: None}])
+    assert outcomes[0][mqry.OUTCOME] == mqry.INVALID
+    mock_bulk.assert_not_called()
@@ -0,0 +1,72 @@
+from unittest.mock import patch
+
+import data.manuscripts.fields as flds
+import data.manuscripts.query as qry
+import data.manuscripts.referee_load as load
+
+MANU = {flds.STATE: 'REF_RVW', flds.REFEREES: ['Bob@nyu.edu', 'al@nyu.edu']}
+
+
+def test_active_referees():
+    assert load.get_active_referees(MANU) == {'bob@nyu.edu', 'al@nyu.edu'}
+    assert load.get_active_referees({**MANU, flds.STATE: 'PUB'}) == set()
+    assert load.get_active_referees(None) == set()
+    assert load.get_active_referees({flds.STATE: 'SUB',
+                                     flds.REFEREES: 'x@nyu.edu'}) == {
+        'x@nyu.edu'}
+
+
+def changes(mock_update):
+    return sorted((call.args[1][flds.ID], call.args[2]['$inc'][load.COUNT])
+                  for call in mock_update.call_args_list)
+
+
+@patch('data.db_connect.update_many')
+def test_assign_ref(mock_update):
+    load.apply(MANU, {**MANU, flds.REFEREES: [*MANU[flds.REFEREES],
+                                              'cy@nyu.edu']})
+    assert changes(mock_update) == [('cy@nyu.edu', 1)]
+    assert mock_update.call_args.kwargs['upsert']
+
+
+@patch('data.db_connect.update_many')
+def test_delete_ref(mock_update):
+    load.apply(MANU, {**MANU, flds.REFEREES: ['al@nyu.edu']})
+    assert changes(mock_update) == [('bob@nyu.edu', -1)]
+
+
+@patch('data.db_connect.update_many')
+def test_terminal_transition_releases_all(mock_update):
+    load.apply(MANU, {**MANU, flds.STATE: 'REJ'})
+    assert changes(mock_update) == [('al@nyu.edu', -1), ('bob@nyu.edu', -1)]
+
+
+@patch('data.db_connect.update_many')
+def test_unchanged_writes_nothing(mock_update):
+    load.apply(MANU, {**MANU, flds.STATE: 'AU_REV'})
+    mock_update.assert_not_called()
+
+
+def test_get_loads_defaults_to_zero():
+    docs = [{flds.ID: 'bob@nyu.edu', load.COUNT: 2}]
+    with patch('data.db_connect.read_cursor', return_value=docs) as mock:
+        loads = load.get_loads(['Bob@nyu.edu', 'al@nyu.edu'])
+    assert loads == {'bob@nyu.edu': 2, 'al@nyu.edu': 0}
+    assert mock.call_args.args[1] == {
+        flds.ID: {'$in': ['bob@nyu.edu', 'al@nyu.edu']}}
+
+
+@patch('data.manuscripts.referee_load.get_loads',
+       return_value={'al@nyu.edu': 3, 'cy@nyu.edu': 0, 'di@nyu.edu': 1})
+@patch('data.people.get_role_holders',
+       return_value=['al@nyu.edu', 'Bob@nyu.edu', 'cy@nyu.edu',
+                     'di@nyu.edu', 'au@nyu.edu'])
+@patch('data.manuscripts.query.get_one_manu',
+       return_value={**MANU, flds.AUTHOR_EMAIL: 'AU@nyu.edu',
+                     flds.REFEREES: ['bob@nyu.edu']})
+def test_suggest_referees(mock_get_one, mock_holders, mock_loads):
+    suggestions = qry.suggest_referees('123', 2)
+    mock_loads.assert_called_once_with(['al@nyu.edu', 'cy@nyu.edu',
+                                        'di@nyu.edu'])
+    assert suggestions == [{'email': 'cy@nyu.edu', load.COUNT: 0},
+                           {'email': 'di@nyu.edu', load.COUNT: 1}]
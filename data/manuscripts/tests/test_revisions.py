@@ -0,0 +1,132 @@
+import time
+from unittest.mock import patch, MagicMock
+
+import pytest
+
+from bson import ObjectId
+
+import data.manuscripts.bodies as bodies
+import data.manuscripts.revisions as revs
+
+MANU_ID = '0123456789abcdef01234567'
+REVISION_ID = 'fedcba9876543210fedcba98'
+TEXT = 'Once upon a time.\n\nThere were three bears.\n  \n\nThe end.\n'
+
+
+def test_split_joins_back():
+    chunks = revs.split(TEXT)
+    assert ''.join(chunks) == TEXT
+    assert chunks == ['Once upon a time.\n\n',
+                      'There were three bears.\n  \n\n',
+                      'The end.\n']
+
+
+def test_split_empty():
+    assert revs.split('') == []
+
+
+def test_split_cuts_long_paragraphs(monkeypatch):
+    monkeypatch.setattr(revs, 'MAX_CHUNK', 4)
+    assert revs.split('abcdefghij') == ['abcd', 'efgh', 'ij']
+
+
+def test_unchanged_paragraphs_share_keys():
+    old = revs.split(TEXT)
+    new = revs.split(TEXT.replace('three', 'four'))
+    assert revs.get_key(old[0]) == revs.get_key(new[0])
+    assert revs.get_key(old[1]) != revs.get_key(new[1])
+    assert revs.get_key(old[2]) == revs.get_key(new[2])
+
+
+@patch('data.db_connect.create',
+       return_value=MagicMock(inserted_id=ObjectId(REVISION_ID)))
+@patch('data.db_connect.bulk_write')
+def test_save(mock_bulk, mock_create):
+    text = 'Same.\n\nSame.\n\n'
+    assert revs.save(MANU_ID, text) == REVISION_ID
+    writes = mock_bulk.call_args.args[1]
+    assert len(writes) == 1  # the repeated paragraph is stored once
+    doc = mock_create.call_args.args[1]
+    # a reused chunk keeps its data but is stamped, like a new one
+    assert writes[0]._doc == {'$setOnInsert': {revs.DATA: 'Same.\n\n'},
+                              '$set': {revs.REFERENCED_AT: doc[revs.AT]}}
+    assert writes[0]._upsert
+    assert doc[revs.MANU_ID] == MANU_ID
+    assert doc[revs.CHUNKS] == [revs.get_key('Same.\n\n')] * 2
+    assert doc[revs.HASH] == bodies.get_hash(text)
+    assert doc[revs.SIZE] == len(text)
+
+
+@patch('data.db_connect.create',
+       return_value=MagicMock(inserted_id=ObjectId(REVISION_ID)))
+@patch('data.db_connect.bulk_write')
+def test_save_empty(mock_bulk, mock_create):
+    revs.save(MANU_ID, None)
+    mock_bulk.assert_not_called()
+    assert mock_create.call_args.args[1][revs.CHUNKS] == []
+
+
+@patch('data.db_connect.read_cursor')
+@patch('data.db_connect.read_one')
+def test_read(mock_read_one, mock_cursor):
+    chunks = revs.split(TEXT)
+    keys = [revs.get_key(chunk) for chunk in chunks]
+    mock_read_one.return_value = {revs.CHUNKS: keys}
+    mock_cursor.return_value = [{revs.ID: key, revs.DATA: chunk}
+                                for key, chunk in reversed(list(zip(keys,
+                                                                    chunks)))]
+    assert revs.read(MANU_ID, REVISION_ID) == TEXT
+    assert mock_read_one.call_args.args[1] == {
+        revs.ID: ObjectId(REVISION_ID), revs.MANU_ID: MANU_ID}
+
+
+@patch('data.db_connect.read_one', return_value=None)
+def test_read_missing(mock_read_one):
+    with pytest.raises(ValueError):
+        revs.read(MANU_ID, REVISION_ID)
+
+
+@patch('data.db_connect.read_cursor', return_value=[])
+@patch('data.db_connect.read_one',
+       return_value={revs.CHUNKS: [revs.get_key('Gone.')]})
+def test_read_missing_chunk(mock_read_one, mock_cursor):
+    with pytest.raises(ValueError):
+        revs.read(MANU_ID, REVISION_ID)
+
+
+@patch('data.db_connect.delete_many', return_value=3)
+def test_delete_all(mock_delete):
+    assert revs.delete_all([MANU_ID]) == 3
+    assert mock_delete.call_args.args[1] == {
+        revs.MANU_ID: {'$in': [MANU_ID]}}
+
+
+def test_read_bad_id():
+    with pytest.raises(ValueError):
+        revs.read(MANU_ID, 'not an id')
+
+
+@patch('data.manuscripts.revisions.GC_BATCH', 2)
+@patch('data.db_connect.delete_many', side_effect=[2, 0])
+@patch('data.db_connect.aggregate',
+       return_value=[{revs.ID: 'k1'}, {revs.ID: 'k2'}, {revs.ID: 'k3'}])
+def test_collect_garbage(mock_aggregate, mock_delete):
+    assert revs.collect_garbage(grace=60) == 2
+    collection, pipeline = mock_aggregate.call_args.args
+    assert collection == revs.CHUNK_COLLECT
+    cutoff = pipeline[0]['$match'][revs.REFERENCED_AT]['$not']['$gte']
+    assert cutoff <= time.time() - 60
+    assert any('$lookup' in stage for stage in pipeline)
+    # orphans go in batches, each still only if not stamped since
+    filters = [call.args[1] for call in mock_delete.call_args_list]
+    assert [filt[revs.ID]['$in'] for filt in filters] == [['k1', 'k2'],
+                                                          ['k3']]
+    assert all(filt[revs.REFERENCED_AT] == {'$not': {'$gte': cutoff}}
+               for filt in filters)
+
+
+@patch('data.db_connect.delete_many')
+@patch('data.db_connect.aggregate', return_value=[])
+def test_collect_garbage_nothing(mock_aggregate, mock_delete):
+    assert revs.collect_garbage() == 0
+    mock_delete.assert_not_called()
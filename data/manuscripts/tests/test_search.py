@@ -0,0 +1,79 @@
+from unittest.mock import patch, MagicMock
+
+import pytest
+
+from bson import ObjectId
+
+import data.manuscripts.fields as flds
+import data.manuscripts.search as srch
+
+MANU_ID = '0123456789abcdef01234567'
+TEXT = ('The three bears came home to find their porridge eaten. '
+        'Someone had been sitting in their chairs. ') * 5
+
+
+@patch('data.db_connect.update')
+def test_index_searchable_fields_only(mock_update):
+    srch.index(MANU_ID, {flds.TITLE: 'Bears', flds.REFEREES: ['x@nyu.edu'],
+                         flds.AUTHOR_EMAIL: ' Au@NYU.edu '})
+    filt, doc = mock_update.call_args.args[1:3]
+    assert filt == {flds.ID: ObjectId(MANU_ID)}
+    assert doc == {flds.TITLE: 'Bears', flds.AUTHOR_EMAIL: 'au@nyu.edu'}
+    assert mock_update.call_args.kwargs['upsert']
+
+
+@patch('data.db_connect.update')
+def test_index_nothing_searchable(mock_update):
+    srch.index(MANU_ID, {flds.REFEREES: []})
+    mock_update.assert_not_called()
+
+
+@patch('data.db_connect.update')
+def test_index_caps_text(mock_update, monkeypatch):
+    monkeypatch.setattr(srch, 'MAX_TEXT', 10)
+    srch.index(MANU_ID, {flds.TEXT: TEXT})
+    assert mock_update.call_args.args[2][flds.TEXT] == TEXT[:10]
+
+
+def test_get_terms():
+    assert srch.get_terms('porridge -chairs "three bears"') == [
+        'porridge', 'three', 'bears']
+
+
+def test_make_snippet():
+    snippet = srch.make_snippet({flds.TEXT: TEXT}, ['porridge'])
+    assert 'porridge' in snippet
+    assert len(snippet) <= srch.SNIPPET_CHARS + 6
+
+
+def test_make_snippet_no_match():
+    doc = {flds.ABSTRACT: 'A short abstract', flds.TEXT: TEXT}
+    assert srch.make_snippet(doc, ['goldilocks']) == 'A short abstract'
+
+
+def test_search():
+    cursor = MagicMock()
+    chained = cursor.sort.return_value.skip.return_value.limit
+    chained.return_value = [{flds.ID: ObjectId(MANU_ID),
+                             flds.TITLE: 'Bears',
+                             flds.TEXT: TEXT,
+                             flds.STATE: 'SUB',
+                             flds.AUTHOR_EMAIL: 'au@nyu.edu',
+                             srch.SCORE: 1.5}]
+    with patch('data.db_connect.read_cursor',
+               return_value=cursor) as mock_read:
+        results = srch.search('porridge', 'SUB', 'AU@nyu.edu', 5, 10)
+    filt = mock_read.call_args.args[1]
+    assert filt == {'$text': {'$search': 'porridge'}, flds.STATE: 'SUB',
+                    flds.AUTHOR_EMAIL: 'au@nyu.edu'}
+    cursor.sort.return_value.skip.assert_called_once_with(10)
+    chained.assert_called_once_with(5)
+    assert results[0][flds.ID] == MANU_ID
+    assert results[0][srch.SCORE] == 1.5
+    assert 'porridge' in results[0][srch.SNIPPET]
+    assert flds.TEXT not in results[0]
+
+
+def test_search_empty():
+    with pytest.raises(ValueError):
+        srch.search('  ')
@@ -0,0 +1,92 @@
+from unittest.mock import patch
+
+import pytest
+
+import data.db_connect as dbc
+import data.manuscripts.history as hist
+import data.manuscripts.query as qry
+import data.manuscripts.stats as stats
+
+PIPELINE_RESULTS = {
+    qry.MANU_COLLECT: [
+        [{dbc.MONGO_ID: 'ref@nyu.edu', stats.COUNT: 1}],
+        [{dbc.MONGO_ID: 'au@nyu.edu', stats.COUNT: 2}],
+        [{dbc.MONGO_ID: qry.SUBMITTED, stats.COUNT: 2},
+         {dbc.MONGO_ID: qry.PUBLISHED, stats.COUNT: 1}],
+    ],
+    hist.HISTORY_COLLECT: [
+        [{dbc.MONGO_ID: qry.SUBMITTED, stats.MEDIAN: 60.0,
+          'percentiles': [60.0, 90.0, 120.0], stats.COUNT: 3}],
+    ],
+}
+
+
+@pytest.fixture
+def pipelines():
+    """
+    Serves each collection's canned pipeline results in turn.
+    """
+    stats.reset()
+    results = {name: list(rows) for name, rows in PIPELINE_RESULTS.items()}
+
+    def aggregate(collection, pipeline):
+        return results[collection].pop(0)
+
+    with patch('data.db_connect.aggregate', side_effect=aggregate) as mock:
+        yield mock
+    stats.reset()
+
+
+def test_compute(pipelines):
+    result = stats.get_stats()
+    assert result[stats.STATE_COUNTS][qry.SUBMITTED] == 2
+    assert result[stats.STATE_COUNTS][qry.COPY_EDIT] == 0
+    assert result[stats.REFEREE_COUNTS] == {'ref@nyu.edu': 1}
+    assert result[stats.AUTHOR_COUNTS] == {'au@nyu.edu': 2}
+    assert result[stats.TIME_IN_STATE][qry.SUBMITTED] == {
+        stats.MEDIAN: 60.0, 'p50': 60.0, 'p75': 90.0, 'p90': 120.0,
+        stats.COUNT: 3}
+
+
+def test_time_in_state_pipeline(pipelines):
+    stats.get_stats()
+    history_calls = [call for call in pipelines.call_args_list
+                     if call.args[0] == hist.HISTORY_COLLECT]
+    pipeline = history_calls[0].args[1]
+    assert '$setWindowFields' in pipeline[0]
+    group = pipeline[-1]['$group']
+    assert group['percentiles']['$percentile']['p'] == stats.PERCENTILES
+
+
+def test_cached_stats_count_states_again(pipelines):
+    first = stats.get_stats()
+    counts = [{dbc.MONGO_ID: qry.SUBMITTED, stats.COUNT: 1},
+              {dbc.MONGO_ID: qry.REFEREE_REVIEW, stats.COUNT: 1}]
+    with patch('data.db_connect.aggregate', return_value=counts) as mock:
+        second = stats.get_stats()
+    # only the state counts run; the rest comes from the cache
+    mock.assert_called_once()
+    assert mock.call_args.args[0] == qry.MANU_COLLECT
+    assert '$group' in mock.call_args.args[1][-1]
+    assert second[stats.STATE_COUNTS][qry.SUBMITTED] == 1
+    assert second[stats.STATE_COUNTS][qry.REFEREE_REVIEW] == 1
+    assert second[stats.COMPUTED_AT] == first[stats.COMPUTED_AT]
+    assert second[stats.AUTHOR_COUNTS] == first[stats.AUTHOR_COUNTS]
+
+
+def test_state_counts_sort_on_the_index():
+    with patch('data.db_connect.aggregate', return_value=[]) as mock:
+        counts = stats.get_state_counts()
+    assert mock.call_args.args[1][0] == {'$sort': {qry.flds.STATE: 1}}
+    assert counts[qry.SUBMITTED] == 0
+
+
+def test_refresh_after_ttl(pipelines, monkeypatch):
+    stats.get_stats()
+    monkeypatch.setattr(stats, 'STATS_TTL', -1)
+    with patch('data.manuscripts.stats.compute',
+               return_value={stats.COMPUTED_AT: 0}) as mock_compute, \
+            patch('data.manuscripts.stats.get_state_counts',
+                  return_value={}):
+        stats.get_stats()
+    mock_compute.assert_called_once()
@@ -0,0 +1,84 @@
+"""
+This module runs one-off data migrations against the journal DB.
+Usage: python -m data.migrate [migration ...]
+With no arguments it lists the available migrations.
+"""
+import sys
+
+import data.account as acc
+import data.db_connect as dbc
+import data.name_sync as sync
+import data.people as ppl
+import data.manuscripts.bodies as bodies
+import data.manuscripts.history as hist
+import data.manuscripts.referee_load as load
+import data.manuscripts.revisions as revs
+import data.manuscripts.search as srch
+import data.manuscripts.query as qry
+
+ROLE_MASKS = 'role_masks'
+EMAIL_INDEXES = 'email_indexes'
+STATE_RANKS = 'state_ranks'
+MANU_INDEXES = 'manuscript_indexes'
+SPLIT_BODIES = 'split_bodies'
+BODY_INDEXES = 'body_indexes'
+HISTORY_INDEXES = 'history_indexes'
+SEARCH_INDEXES = 'search_indexes'
+SEARCH_REBUILD = 'search_rebuild'
+REFEREE_LOADS = 'referee_loads'
+REVISION_INDEXES = 'revision_indexes'
+REVISIONS = 'revisions'
+NAME_SYNC_RESUME = 'name_sync_resume'
+
+
+def ensure_email_indexes() -> int:
+    """
+    Stores the normalized email key on people and accounts that lack it,
+    then adds unique indexes on it. Lookups match on that key, so this
+    has to run before records written earlier can be found again.
+    Returns the number of documents updated.
+    """
+    count = 0
+    for collection in (ppl.PEOPLE_COLLECT, acc.ACCOUNT_COLLECT):
+        count += ppl.backfill_email_keys(collection)
+        dbc.create_index(collection, ppl.EMAIL_KEY, unique=True)
+    return count
+
+
+MIGRATIONS = {
+    ROLE_MASKS: ppl.backfill_role_masks,
+    EMAIL_INDEXES: ensure_email_indexes,
+    STATE_RANKS: qry.backfill_state_ranks,
+    MANU_INDEXES: qry.ensure_indexes,
+    BODY_INDEXES: bodies.ensure_indexes,
+    SPLIT_BODIES: qry.split_bodies,
+    HISTORY_INDEXES: hist.ensure_indexes,
+    SEARCH_INDEXES: srch.ensure_indexes,
+    SEARCH_REBUILD: srch.rebuild,
+    REFEREE_LOADS: load.rebuild,
+    REVISION_INDEXES: revs.ensure_indexes,
+    REVISIONS: qry.backfill_revisions,
+    NAME_SYNC_RESUME: sync.resume,
+}
+
+
+def run(name: str) -> int:
+    """
+    Runs a single migration by name.
+    Returns the number of documents it changed.
+    """
+    if name not in MIGRATIONS:
+        raise ValueError(f'No such migration: {name}')
+    return MIGRATIONS[name]()
+
+
+def main():
+    names = sys.argv[1:]
+    if not names:
+        print(f'Available migrations: {", ".join(MIGRATIONS)}')
+    for name in names:
+        print(f'{name}: {run(name)} documents updated')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""
+This module copies a person's new name onto the manuscripts they wrote.
+Manuscripts keep the author's name next to author_email, so a rename
+leaves them stale. people.update schedules a job here, and a background
+thread rewrites the copies in batches of NAME_SYNC_BATCH, pausing
+NAME_SYNC_PAUSE seconds between batches so a prolific author's rename
+doesn't spike write load.
+Each job's progress is kept in the name_sync collection, one document
+per email key, so any worker can report it with get_status(). Jobs a
+restarted worker never finished stay there as queued or running, and
+resume() runs them.
+"""
+import os
+import queue
+import threading
+import time
+
+import data.db_connect as dbc
+import data.manuscripts.fields as flds
+
+MANU_COLLECT = 'manuscripts'
+SYNC_COLLECT = 'name_sync'
+
+BATCH_SIZE = int(os.environ.get('NAME_SYNC_BATCH', 100))
+BATCH_PAUSE = float(os.environ.get('NAME_SYNC_PAUSE', 0.1))  # seconds
+
+# Status fields
+ID = '_id'  # the email key
+STATE = 'state'
+NAME = 'name'
+UPDATED = 'updated'
+ERROR = 'error'
+
+# Job states
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+UNFINISHED = [QUEUED, RUNNING]
+
+jobs = queue.Queue()
+lock = threading.Lock()
+worker = None
+
+
+def _set_status(email: str, **fields) -> None:
+    dbc.update(SYNC_COLLECT, {ID: email}, fields, upsert=True)
+
+
+def get_status(email: str) -> dict:
+    """
+    Returns the latest job status for an email key, or None if no rename
+    was ever scheduled for it.
+    """
+    status = dbc.read_one(SYNC_COLLECT, {ID: email})
+    if status:
+        del status[ID]
+    return status
+
+
+def run_job(email: str, name: str) -> int:
+    """
+    Sets the author name on every manuscript written by email, one batch
+    at a time, and returns how many were changed.
+    Batches walk the author's manuscripts in _id order. Only those still
+    showing another name are written, so a job can be re-run, or
+    overtaken by a later rename, safely.
+    """
+    authored = {flds.AUTHOR_EMAIL: email}
+    updated = 0
+    while True:
+        ids = [doc[flds.ID] for doc in
+               dbc.read_cursor(MANU_COLLECT, authored, {flds.ID: 1})
+               .collation(dbc.CASE_INSENSITIVE)
+               .sort(flds.ID).limit(BATCH_SIZE)]
+        if not ids:
+            return updated
+        # emails are matched ignoring case above; names must not be
+        updated += dbc.update_many(MANU_COLLECT,
+                                   {flds.ID: {'$in': ids},
+                                    flds.AUTHOR: {'$ne': name}},
+                                   {'$set': {flds.AUTHOR: name}})
+        _set_status(email, **{UPDATED: updated})
+        if len(ids) < BATCH_SIZE:
+            return updated
+        authored = {flds.AUTHOR_EMAIL: email, flds.ID: {'$gt': ids[-1]}}
+        time.sleep(BATCH_PAUSE)
+
+
+def _run(email: str, name: str) -> None:
+    """
+    Runs one job, recording how it went.
+    """
+    try:
+        status = get_status(email)
+        if not status or status[NAME] != name:
+            return  # a later rename is queued behind this one
+        _set_status(email, **{STATE: RUNNING})
+        updated = run_job(email, name)
+        _set_status(email, **{STATE: DONE, UPDATED: updated})
+    except Exception as err:
+        _set_status(email, **{STATE: FAILED, ERROR: str(err)})
+
+
+def work() -> None:
+    """
+    The background thread: runs queued jobs one at a time, forever.
+    """
+    while True:
+        email, name = jobs.get()
+        try:
+            _run(email, name)
+        finally:
+            jobs.task_done()
+
+
+def resume() -> int:
+    """
+    Runs, in this process, every job left queued or running by a worker
+    that stopped before finishing it. Jobs are safe to re-run.
+    Returns how many jobs were run.
+    """
+    unfinished = list(dbc.read_cursor(SYNC_COLLECT,
+                                      {STATE: {'$in': UNFINISHED}}))
+    for status in unfinished:
+        _run(status[ID], status[NAME])
+    return len(unfinished)
+
+
+def schedule(email: str, name: str) -> None:
+    """
+    Queues a rename of email's manuscripts to name, starting the
+    background thread on first use.
+    """
+    global worker
+    _set_status(email, **{STATE: QUEUED, NAME: name, UPDATED: 0,
+                          ERROR: None})
+    jobs.put((email, name))
+    with lock:
+        if worker is None:
+            worker = threading.Thread(target=work, daemon=True)
+            worker.start()
+
+
+def wait() -> None:
+    """
+    Blocks until every queued job has finished.
+    """
+    jobs.join()
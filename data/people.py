@@ -1,10 +1,28 @@
 """
 This module interfaces to our user data.
 """
+import os
 import re   # Module for regular expressions, used for validating email format.
+import time
+
+from collections import OrderedDict
+
+from typing import Union
 
 import data.roles as rls
 import data.db_connect as dbc
+import data.manuscripts.fields as flds
+import data.email_filter as emf
+import data.identity_map as imap
+import data.manuscripts.bodies as bodies
+import data.manuscripts.history as hist
+import data.manuscripts.referee_load as load
+import data.manuscripts.revisions as revs
+import data.manuscripts.search as srch
+import data.manuscripts.states as sts
+import data.name_sync as names
+import data.records as recs
+from data.emails import normalize_email
 
 
 # Fields for person data
@@ -12,16 +30,35 @@ NAME = 'name'
 ROLES = 'roles'
 AFFILIATION = 'affiliation'
 EMAIL = 'email'
+EMAIL_KEY = 'email_key'  # normalized EMAIL that lookups match on
+ROLE_MASK = 'role_mask'  # cached bitmask of ROLES, see data.roles
 MH_FIELDS = [NAME, AFFILIATION]  # Fields for masthead records
 
 TEST_EMAIL = 'ejc369@nyu.edu'
 DEL_EMAIL = 'delete@nyu.edu'
 
 PEOPLE_COLLECT = 'people'
+MANU_COLLECT = 'manuscripts'
+
+# What deleting a person does to the manuscripts they wrote.
+WITHDRAW_AUTHORED = 'withdraw'  # withdraw the ones still in progress
+DELETE_AUTHORED = 'delete'      # delete them all
+REFUSE_AUTHORED = 'refuse'      # refuse to delete an author
+AUTHORED_POLICIES = [WITHDRAW_AUTHORED, DELETE_AUTHORED, REFUSE_AUTHORED]
+AUTHORED_POLICY = os.environ.get('AUTHORED_MANU_POLICY', WITHDRAW_AUTHORED)
 
 client = dbc.connect_db()
 print(f'{client=}')
 
+# Per-process cache of resolved role masks: {email: (mask, expires_at)}.
+# Writes through this module invalidate their entry; the TTL bounds how
+# long another worker's change can go unnoticed. It holds at most
+# ROLE_CACHE_SIZE emails and drops the least recently used one first.
+ROLE_CACHE_TTL = float(os.environ.get('ROLE_CACHE_TTL', 60))
+ROLE_CACHE_SIZE = int(os.environ.get('ROLE_CACHE_SIZE', 10_000))
+role_cache = OrderedDict()
+roles_changed_at = {}
+
 
 EMAIL_FORMAT = (
             r'^[A-Za-z0-9]+'            # Start with alnum characters
@@ -71,6 +108,32 @@ def is_valid_person(name: str, affiliation: str, email: str,
     return True
 
 
+class Person(recs.Record):
+    """
+    A person, as stored in the people collection.
+    """
+    __slots__ = (NAME, AFFILIATION, EMAIL, EMAIL_KEY, ROLES, ROLE_MASK)
+    COLLECTION = PEOPLE_COLLECT
+    KEY = EMAIL
+
+    def __init__(self, name: str, affiliation: str, email: str,
+                 roles: list[str] = None):
+        roles = roles or []
+        is_valid_person(name, affiliation, email, roles)
+        self.name = name.strip()
+        self.affiliation = affiliation.strip()
+        self.email = email.strip()
+        self.email_key = normalize_email(email)
+        self.roles = list(roles)
+        self.role_mask = rls.to_mask(roles)
+
+    def mh_rec(self) -> dict:
+        """
+        Returns the masthead record for this person.
+        """
+        return {fld: getattr(self, fld, '') for fld in get_mh_fields()}
+
+
 def read() -> dict[str, dict]:
     """
     Reads all people data from the database.
@@ -78,8 +141,15 @@ def read() -> dict[str, dict]:
         A dictionary where each key is an email, and the value is a dictionary
         of person data.
     """
-    people = dbc.read_dict(PEOPLE_COLLECT, EMAIL)
-    return people
+    return Person.read_keyed()
+
+
+def get_role_holders(role: str) -> list[str]:
+    """
+    Returns the emails of everyone with the given role.
+    """
+    return [person[EMAIL] for person in
+            dbc.read_cursor(PEOPLE_COLLECT, {ROLES: role}, {EMAIL: 1})]
 
 
 def read_one(email: str) -> dict:
@@ -88,7 +158,12 @@ def read_one(email: str) -> dict:
     Returns:
         A dictionary if the email exists, otherwise None.
     """
-    return dbc.read_one(PEOPLE_COLLECT, {EMAIL: email})
+    key = normalize_email(email)
+    person = imap.get(PEOPLE_COLLECT, key)
+    if person is imap.MISSING:
+        person = dbc.read_one(PEOPLE_COLLECT, {EMAIL_KEY: key})
+        imap.put(PEOPLE_COLLECT, key, person)
+    return person
 
 
 def exists(email: str) -> bool:
@@ -98,20 +173,131 @@ def exists(email: str) -> bool:
     return read_one(email) is not None
 
 
-def delete(email: str) -> int:
+def is_email_taken(email: str) -> bool:
+    """
+    The duplicate check run before creating a person.
+    Emails the Bloom filter has never seen are answered without a lookup.
+    The filter only knows this process's writes, so it can miss a person
+    added elsewhere; the unique email_key index still refuses those.
+    """
+    if not emf.might_contain(PEOPLE_COLLECT, normalize_email(email)):
+        return False
+    found = exists(email)
+    if not found:
+        emf.record_false_positive()
+    return found
+
+
+def delete(email: str, policy: str = None) -> int:
     """
-    Deletes a person by email from the database.
+    Deletes a person by email from the database, along with the
+    references manuscripts hold to them, in one transaction.
+    See cascade_delete() for what happens to the manuscripts.
     """
-    return dbc.delete(PEOPLE_COLLECT, {EMAIL: email})
+    key = normalize_email(email)
+    deleted = dbc.in_transaction(
+        lambda session: cascade_delete(key, policy, session))
+    forget(key, deleted)
+    return deleted
+
+
+def cascade_delete(email: str, policy: str = None, session=None) -> int:
+    """
+    Runs the writes for deleting a person, in the caller's session:
+        - they are pulled from every referee list in one update,
+        - the manuscripts they wrote are withdrawn, deleted, or make
+          the delete fail, depending on policy (AUTHORED_POLICY).
+    Manuscripts store emails as typed, so they are matched ignoring case.
+    Referee loads, and the search documents, bodies, histories and
+    revisions of the manuscripts written, are kept in step; each
+    withdrawal is logged with no action or actor.
+    Returns the count of people deleted.
+    """
+    key = normalize_email(email)
+    policy = policy or AUTHORED_POLICY
+    if policy not in AUTHORED_POLICIES:
+        raise ValueError(f'Invalid authored manuscript policy: {policy}')
+
+    authored = {flds.AUTHOR_EMAIL: key}
+    if policy == REFUSE_AUTHORED:
+        if dbc.count(MANU_COLLECT, authored, collation=dbc.CASE_INSENSITIVE,
+                     session=session, limit=1):
+            raise ValueError(f'Person is the author of manuscripts: {email}')
+
+    dbc.update_many(MANU_COLLECT, {flds.REFEREES: key},
+                    {'$pull': {flds.REFEREES: key},
+                     '$inc': {flds.VERSION: 1}},
+                    collation=dbc.CASE_INSENSITIVE, session=session)
+    load.forget(key, session=session)
+    closing = []
+    if policy != REFUSE_AUTHORED:
+        closing = list(dbc.read_cursor(
+            MANU_COLLECT,
+            {**authored, flds.STATE: {'$nin': sts.CLOSED_STATES}},
+            {flds.STATE: 1, flds.REFEREES: 1}, session=session)
+            .collation(dbc.CASE_INSENSITIVE))
+    for manu in closing:
+        load.apply(manu, None, session=session)
+    if policy == WITHDRAW_AUTHORED:
+        dbc.update_many(MANU_COLLECT,
+                        {**authored,
+                         flds.STATE: {'$nin': sts.CLOSED_STATES}},
+                        {'$set': {flds.STATE: sts.WITHDRAWN,
+                                  flds.STATE_RANK:
+                                  sts.get_state_rank(sts.WITHDRAWN)},
+                         '$inc': {flds.VERSION: 1}},
+                        collation=dbc.CASE_INSENSITIVE, session=session)
+        hist.record_many([hist.make_entry(str(manu[flds.ID]),
+                                          manu[flds.STATE], sts.WITHDRAWN)
+                          for manu in closing], session=session)
+        # search documents hold the author email already normalized
+        dbc.update_many(srch.SEARCH_COLLECT,
+                        {**authored,
+                         flds.STATE: {'$nin': sts.CLOSED_STATES}},
+                        {'$set': {flds.STATE: sts.WITHDRAWN}},
+                        session=session)
+    elif policy == DELETE_AUTHORED:
+        doomed = list(dbc.read_cursor(MANU_COLLECT, authored,
+                                      {flds.TEXT_ID: 1}, session=session)
+                      .collation(dbc.CASE_INSENSITIVE))
+        dbc.delete_many(MANU_COLLECT, authored,
+                        collation=dbc.CASE_INSENSITIVE, session=session)
+        text_ids = [manu[flds.TEXT_ID] for manu in doomed
+                    if manu.get(flds.TEXT_ID)]
+        if text_ids:
+            bodies.delete_all(text_ids, session=session)
+        doomed_ids = [str(manu[flds.ID]) for manu in doomed]
+        hist.delete_all(doomed_ids, session=session)
+        revs.delete_all(doomed_ids, session=session)
+        dbc.delete_many(srch.SEARCH_COLLECT, authored, session=session)
+    return dbc.delete(PEOPLE_COLLECT, {EMAIL_KEY: key}, session=session)
+
+
+def forget(email: str, deleted: int) -> None:
+    """
+    Drops what this process remembers about a person once their delete
+    has committed.
+    """
+    key = normalize_email(email)
+    invalidate_roles(key, roles_changed=True)
+    imap.evict_collection(MANU_COLLECT)
+    if deleted:
+        emf.remove(PEOPLE_COLLECT, key)
 
 
 def delete_role(email: str, role: str) -> None:
     """
     Deletes a specific role for a person by email.
+    The cached role mask is rewritten in the same update.
     """
-    person = exists(email)
+    person = read_one(email)
     if person:
-        status = dbc.delete_role(PEOPLE_COLLECT, {EMAIL: email}, {ROLES: role})
+        roles = [code for code in person.get(ROLES, []) if code != role]
+        status = dbc.delete_role(PEOPLE_COLLECT,
+                                 {EMAIL_KEY: normalize_email(email)},
+                                 {ROLES: role},
+                                 set_fields={ROLE_MASK: rls.to_mask(roles)})
+        invalidate_roles(email, roles_changed=status)
         if status:
             print('Role successfully deleted')
         else:
@@ -126,16 +312,17 @@ def create(name: str, affiliation: str, email: str, roles: list[str]) -> str:
     Raises ValueError if missing/empty fields or the email already exists.
     People can have no roles
     """
-    if exists(email):
+    if is_email_taken(email):
         raise ValueError(f'Adding duplicate email: {email=}')
 
-    if is_valid_person(name, affiliation, email, roles):
-
-        person = {NAME: name.strip(), AFFILIATION: affiliation.strip(),
-                  EMAIL: email.strip(), ROLES: roles}
+    person = Person(name, affiliation, email, roles).to_json()
+    try:
         dbc.create(PEOPLE_COLLECT, person)
-        return email
-    return None
+    except dbc.DuplicateKeyError:
+        raise ValueError(f'Adding duplicate email: {email=}')
+    emf.add(PEOPLE_COLLECT, person[EMAIL_KEY])
+    invalidate_roles(email)
+    return email
 
 
 def update(name: str, affiliation: str, email: str, roles: list[str]) -> str:
@@ -143,17 +330,27 @@ def update(name: str, affiliation: str, email: str, roles: list[str]) -> str:
     Updates an existing person's details in the database.
     Raises ValueError if the person does not exist.
     """
-    if not exists(email):
+    old_person = read_one(email)
+    if not old_person:
         raise ValueError(f'Updating non-existent person: {email=}')
 
-    is_valid_person(name, affiliation, email, roles)
-
-    person = {NAME: name.strip(), AFFILIATION: affiliation.strip(),
-              EMAIL: email.strip(), ROLES: roles}
-    dbc.update(PEOPLE_COLLECT, {EMAIL: email}, person)
+    person = Person(name, affiliation, email, roles).to_json()
+    dbc.update(PEOPLE_COLLECT, {EMAIL_KEY: person[EMAIL_KEY]}, person)
+    invalidate_roles(email, get_role_mask(old_person) != person[ROLE_MASK])
+    if old_person.get(NAME) != person[NAME]:
+        # manuscripts keep a copy of the author's name
+        names.schedule(person[EMAIL_KEY], person[NAME])
     return email
 
 
+def get_name_sync_status(email: str) -> dict:
+    """
+    Returns how far copying the person's latest name onto their
+    manuscripts has got, or None if they weren't renamed.
+    """
+    return names.get_status(normalize_email(email))
+
+
 def has_role(person: dict, role: str) -> bool:
     """
     Checks if a person has a specific role.
@@ -161,6 +358,88 @@ def has_role(person: dict, role: str) -> bool:
     return role in person.get(ROLES, [])
 
 
+def get_role_mask(person: dict) -> int:
+    """
+    Returns the person's role bitmask.
+    Uses the cached mask when the record has one, and computes it from
+    the role list for records written before masks existed.
+    """
+    mask = person.get(ROLE_MASK)
+    if mask is None:
+        mask = rls.to_mask(person.get(ROLES, []))
+    return mask
+
+
+def get_cached_role_mask(email: str) -> Union[int, None]:
+    """
+    Returns the role mask for the person with this email, or None if
+    there is no such person.
+    Only a cache miss or an expired entry goes to the DB.
+    """
+    key = normalize_email(email)
+    now = time.monotonic()
+    entry = role_cache.get(key)
+    if entry and entry[1] > now:
+        role_cache.move_to_end(key)
+        return entry[0]
+    person = read_one(email)
+    mask = get_role_mask(person) if person else None
+    role_cache[key] = (mask, now + ROLE_CACHE_TTL)
+    role_cache.move_to_end(key)
+    while len(role_cache) > ROLE_CACHE_SIZE:
+        role_cache.popitem(last=False)
+    return mask
+
+
+def invalidate_roles(email: str, roles_changed: bool = False) -> None:
+    """
+    Drops the cached role mask for a person, and their record from the
+    request's identity map.
+    If their roles actually changed, also records when, so credentials
+    issued before the change can be refused.
+    """
+    key = normalize_email(email)
+    role_cache.pop(key, None)
+    imap.evict(PEOPLE_COLLECT, key)
+    if roles_changed:
+        roles_changed_at[key] = time.time()
+
+
+def get_roles_changed_at(email: str) -> float:
+    """
+    Returns when this process last saw the person's roles change, or 0.
+    """
+    return roles_changed_at.get(normalize_email(email), 0)
+
+
+def backfill_role_masks() -> int:
+    """
+    Stores the role mask on every person record that lacks one.
+    Returns the number of records updated.
+    """
+    count = 0
+    for person in dbc.read_cursor(PEOPLE_COLLECT, {ROLE_MASK: None},
+                                  {EMAIL: 1, ROLES: 1}):
+        mask = rls.to_mask(person.get(ROLES, []))
+        dbc.update(PEOPLE_COLLECT, {EMAIL: person[EMAIL]}, {ROLE_MASK: mask})
+        count += 1
+    return count
+
+
+def backfill_email_keys(collection: str = PEOPLE_COLLECT) -> int:
+    """
+    Stores the normalized email key on every record in the collection
+    that lacks one.
+    Returns the number of records updated.
+    """
+    count = 0
+    for doc in dbc.read_cursor(collection, {EMAIL_KEY: None}, {EMAIL: 1}):
+        dbc.update(collection, {dbc.MONGO_ID: doc[dbc.MONGO_ID]},
+                   {EMAIL_KEY: normalize_email(doc[EMAIL])})
+        count += 1
+    return count
+
+
 def get_mh_fields() -> list[str]:
     """
     Returns fields to include in masthead records.
@@ -184,15 +463,11 @@ def get_masthead() -> dict[str, list[dict]]:
     """
     masthead = {}
     mh_roles = rls.get_masthead_roles()
+    people = Person.read_all({ROLES: {'$in': list(mh_roles)}})
     for mh_role, text in mh_roles.items():
         print(f'{mh_role=}')
-        people_w_role = []
-        people = read()
-        for email, person in people.items():
-            if has_role(person, mh_role):
-                rec = create_mh_rec(person)
-                people_w_role.append(rec)
-        masthead[text] = people_w_role
+        masthead[text] = [person.mh_rec() for person in people
+                          if mh_role in getattr(person, ROLES, [])]
     return masthead
 
 
@@ -0,0 +1,144 @@
+"""
+This module provides the base for compact record types.
+A record lists its document fields in __slots__, so it carries no
+per-object __dict__. Record types that code builds by hand validate
+their fields in __init__.
+Fields a document doesn't have stay unset, so to_json() gives back the
+same keys the document had.
+Each record type lives next to the module that owns its collection
+(people.Person, text.TextEntry, manuscripts.query.Manuscript).
+
+Full-collection reads go through read_keyed(), which asks Mongo for the
+record's fields only and builds the keyed dictionary the endpoints
+return in one pass over the cursor.
+benchmark() compares holding and serializing records against the plain
+dictionaries dbc.read_dict() returns.
+"""
+import json
+import time
+import tracemalloc
+
+from bson import ObjectId
+
+import data.db_connect as dbc
+
+
+class Record:
+    """
+    Base class for all records.
+    Subclasses list their document keys in __slots__, in the order we
+    want them serialized, name the collection they live in, and the
+    field full-collection reads are keyed by.
+    """
+    __slots__ = ()
+    COLLECTION = None
+    KEY = None
+
+    @classmethod
+    def get_projection(cls) -> dict:
+        projection = {key: 1 for key in cls.__slots__}
+        if dbc.MONGO_ID not in projection:
+            projection[dbc.MONGO_ID] = 0
+        return projection
+
+    @classmethod
+    def from_bson(cls, doc: dict) -> 'Record':
+        """
+        Builds a record from a document read from Mongo.
+        Documents in the DB were validated when they were written, so this
+        path fills the slots directly and skips __init__ validation.
+        """
+        rec = cls.__new__(cls)
+        for key in cls.__slots__:
+            if key not in doc:
+                continue
+            val = doc[key]
+            if isinstance(val, ObjectId):
+                val = str(val)
+            setattr(rec, key, val)
+        return rec
+
+    @classmethod
+    def read_all(cls, filt: dict = None) -> list:
+        """
+        Streams the matching documents of the collection into records,
+        fetching only the record's fields.
+        """
+        return [cls.from_bson(doc) for doc in
+                dbc.read_cursor(cls.COLLECTION, filt, cls.get_projection())]
+
+    @classmethod
+    def read_keyed(cls, filt: dict = None) -> dict:
+        """
+        Returns {KEY: JSON-ready record} for the matching documents.
+        """
+        return {rec.get_key(): rec.to_json() for rec in cls.read_all(filt)}
+
+    def get_key(self):
+        return getattr(self, self.KEY)
+
+    def to_json(self) -> dict:
+        """
+        Returns the record's set fields as a JSON-ready dictionary.
+        """
+        return {key: getattr(self, key) for key in self.__slots__
+                if hasattr(self, key)}
+
+    def __eq__(self, other) -> bool:
+        if type(other) is not type(self):
+            return NotImplemented
+        return self.to_json() == other.to_json()
+
+    def __repr__(self) -> str:
+        vals = ', '.join(f'{key}={val!r}'
+                         for key, val in self.to_json().items())
+        return f'{type(self).__name__}({vals})'
+
+
+def _dict_path(docs: list[dict], key: str) -> dict:
+    """
+    What dbc.read_dict() does: convert the id in place and re-key the
+    documents into a dictionary.
+    """
+    ret = {}
+    for doc in docs:
+        doc = dict(doc)
+        dbc.convert_mongo_id(doc)
+        ret[doc[key]] = doc
+    return ret
+
+
+def _measure(build, dump, docs: list[dict]) -> tuple:
+    tracemalloc.start()
+    start = time.perf_counter()
+    held = build(docs)
+    built = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    start = time.perf_counter()
+    json.dumps(dump(held))
+    dumped = time.perf_counter() - start
+    return peak, built, dumped
+
+
+def benchmark(cls, docs: list[dict]) -> dict:
+    """
+    Compares plain dictionaries against records of type cls for a
+    full-collection read of docs: peak memory per object while they are
+    held, build time, and JSON serialization time.
+    """
+    paths = {
+        'dict': (lambda ds: _dict_path(ds, cls.KEY), lambda held: held),
+        'record': (lambda ds: [cls.from_bson(doc) for doc in ds],
+                   lambda held: {rec.get_key(): rec.to_json()
+                                 for rec in held}),
+    }
+    results = {}
+    for name, (build, dump) in paths.items():
+        peak, built, dumped = _measure(build, dump, docs)
+        results[name] = {
+            'peak_bytes_per_obj': peak / max(len(docs), 1),
+            'build_secs': built,
+            'dump_secs': dumped,
+        }
+    return results
@@ -1,7 +1,7 @@
 """
 This module manages person roles for a journal.
 """
-from copy import deepcopy
+from types import MappingProxyType
 
 AUTHOR_CODE = 'AU'
 CE_CODE = 'CE'
@@ -20,53 +20,80 @@ ROLES = {
 
 MH_ROLES = [CE_CODE, ED_CODE, ME_CODE]
 
+# Read-only registry, built once at import.
+ROLES_VIEW = MappingProxyType(ROLES)
+MH_ROLES_VIEW = MappingProxyType({code: text for code, text in ROLES.items()
+                                  if code in MH_ROLES})
+ROLE_CODES = tuple(ROLES)
+
+# Each role gets one bit, so a set of roles is a single int.
+ROLE_BITS = MappingProxyType({code: 1 << i
+                              for i, code in enumerate(ROLE_CODES)})
+
 
 def get_roles() -> dict:
     """
     Returns a copy of the ROLES dictionary.
+    The values are strings, so a shallow copy is enough.
     """
-    return deepcopy(ROLES)
+    return dict(ROLES_VIEW)
 
 
 def get_role_codes() -> list:
     """
     Returns a list of all role codes from the ROLES dictionary.
     """
-    return list(ROLES.keys())
+    return list(ROLE_CODES)
 
 
 def role_in_mh_roles(role: str) -> bool:
     """
     Checks if a given role code is part of the masthead roles.
     """
-    return role in MH_ROLES
+    return role in MH_ROLES_VIEW
 
 
 def get_masthead_roles() -> dict:
     """
-    Filters and returns only the masthead roles from the ROLES dictionary.
-    Non-masthead roles are removed from the result.
+    Returns only the masthead roles from the ROLES dictionary.
     """
-    mh_roles = get_roles()
-    del_mh_roles = []
+    return dict(MH_ROLES_VIEW)
 
-    # Identify roles to delete (those not in masthead roles).
-    for role in mh_roles:
-        if not role_in_mh_roles(role):
-            del_mh_roles.append(role)
 
-    # Remove the identified non-masthead roles.
-    for del_role in del_mh_roles:
-        del mh_roles[del_role]
+def is_valid(code: str) -> bool:
+    """
+    Validates if a given code exists in the ROLES dictionary.
+    """
+    return code in ROLES_VIEW
 
-    return mh_roles
 
+def to_mask(codes) -> int:
+    """
+    Encodes an iterable of role codes as a bitmask.
+    Unknown codes contribute nothing.
+    """
+    mask = 0
+    for code in codes or []:
+        mask |= ROLE_BITS.get(code, 0)
+    return mask
 
-def is_valid(code: str) -> bool:
+
+def from_mask(mask: int) -> list:
     """
-    Validates if a given code exists in the ROLES dictionary.
+    Decodes a bitmask back into a list of role codes.
+    """
+    return [code for code, bit in ROLE_BITS.items() if mask & bit]
+
+
+def has_any(mask: int, wanted: int) -> bool:
+    """
+    Checks if a role mask has any of the roles in `wanted`.
     """
-    return code in ROLES
+    return bool(mask & wanted)
+
+
+MH_MASK = to_mask(MH_ROLES)
+ALL_MASK = to_mask(ROLE_CODES)
 
 
 def main():
@@ -1,3 +1,7 @@
+import threading
+from concurrent.futures.process import BrokenProcessPool
+from unittest.mock import MagicMock, patch
+
 import pytest
 
 import data.db_connect as dbc
@@ -101,3 +105,63 @@ def test_is_valid_password_invalid():
     # No digit
     with pytest.raises(ValueError):
         acc.is_valid_password('abcdefgh')
+
+
+def test_hash_and_check_password():
+    hashed = acc.hash_password(TEST_PASSWORD, rounds=4)
+    assert acc.get_rounds(hashed) == 4
+    assert acc.check_password(TEST_PASSWORD, hashed)
+    assert not acc.check_password('WrongPassword1', hashed)
+
+
+def test_needs_rehash():
+    hashed = acc.hash_password(TEST_PASSWORD, rounds=4)
+    assert acc.needs_rehash(hashed) == (acc.BCRYPT_ROUNDS != 4)
+
+
+def test_hash_pool_full():
+    with patch('data.account.hash_slots', threading.BoundedSemaphore(1)) \
+            as slots:
+        slots.acquire()
+        with pytest.raises(acc.PasswordServiceBusy):
+            acc.hash_password(TEST_PASSWORD, rounds=4)
+
+
+def test_hash_pool_rebuilt_when_broken():
+    broken, fresh = MagicMock(), MagicMock()
+    broken.submit.return_value.result.side_effect = BrokenProcessPool()
+    fresh.submit.return_value.result.return_value = b'hashed'
+    with patch('data.account.hash_pool', broken), \
+            patch('data.account.ProcessPoolExecutor', return_value=fresh):
+        assert acc.hash_password(TEST_PASSWORD, rounds=4) == 'hashed'
+        assert acc.hash_pool is fresh
+    broken.shutdown.assert_called_once_with(wait=False)
+
+
+def test_login_rehashes(temp_account):
+    with patch('data.account.BCRYPT_ROUNDS', 4):
+        acc.login(temp_account, TEST_PASSWORD)
+        assert acc.get_rounds(acc.get_password(temp_account)) == 4
+
+
+@patch('data.account.change_password',
+       side_effect=acc.PasswordServiceBusy(acc.BUSY_MSG))
+@patch('data.account.needs_rehash', return_value=True)
+@patch('data.account.check_password', return_value=True)
+@patch('data.account.read_account',
+       return_value={EMAIL: TEST_EMAIL, acc.PASSWORD: 'hashed'})
+def test_login_rehash_busy(mock_read, mock_check, mock_needs, mock_change):
+    assert acc.login(TEST_EMAIL, TEST_PASSWORD)
+    mock_change.assert_called_once_with(TEST_PASSWORD, TEST_EMAIL)
+
+
+@patch('data.db_connect.delete')
+@patch('data.people.cascade_delete', side_effect=ValueError('author'))
+@patch('data.db_connect.in_transaction', side_effect=lambda func: func(None))
+@patch('data.account.read_account', return_value={EMAIL: TEST_EMAIL})
+def test_delete_user_refused(mock_read, mock_transaction, mock_cascade,
+                             mock_delete):
+    # without a transaction, a refused cascade must leave the account
+    with pytest.raises(ValueError):
+        acc.delete_user(TEST_EMAIL, 'refuse')
+    mock_delete.assert_not_called()
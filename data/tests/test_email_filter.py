@@ -0,0 +1,57 @@
+from unittest.mock import patch
+
+import pytest
+
+import data.email_filter as emf
+
+KNOWN_EMAIL = 'known@nyu.edu'
+NEW_EMAIL = 'brand_new@nyu.edu'
+
+
+@pytest.fixture(autouse=True)
+def seeded_filter():
+    emf.reset()
+    docs = {emf.PEOPLE_COLLECT: [{emf.EMAIL_KEY: KNOWN_EMAIL}],
+            emf.ACCOUNT_COLLECT: []}
+    with patch('data.db_connect.read_cursor',
+               side_effect=lambda collect, *args: iter(docs[collect])):
+        assert emf.seed() == 1
+    yield
+    emf.reset()
+
+
+def test_known_email_might_be_present():
+    assert emf.might_contain(emf.PEOPLE_COLLECT, KNOWN_EMAIL)
+
+
+def test_new_email_is_absent():
+    assert not emf.might_contain(emf.PEOPLE_COLLECT, NEW_EMAIL)
+    # collections are tracked separately
+    assert not emf.might_contain(emf.ACCOUNT_COLLECT, KNOWN_EMAIL)
+
+
+def test_add_and_remove():
+    emf.add(emf.ACCOUNT_COLLECT, NEW_EMAIL)
+    assert emf.might_contain(emf.ACCOUNT_COLLECT, NEW_EMAIL)
+    emf.remove(emf.ACCOUNT_COLLECT, NEW_EMAIL)
+    assert not emf.might_contain(emf.ACCOUNT_COLLECT, NEW_EMAIL)
+    # removing one email leaves the others in place
+    assert emf.might_contain(emf.PEOPLE_COLLECT, KNOWN_EMAIL)
+
+
+def test_false_positive_rate():
+    emf.might_contain(emf.PEOPLE_COLLECT, NEW_EMAIL)
+    emf.might_contain(emf.PEOPLE_COLLECT, KNOWN_EMAIL)
+    emf.record_false_positive()
+    stats = emf.get_stats()
+    assert stats[emf.CHECKS] == 2
+    assert stats[emf.NEGATIVES] == 1
+    assert stats[emf.FALSE_POSITIVE_RATE] == 0.5
+
+
+def test_seeds_on_first_check():
+    emf.reset()
+    with patch('data.db_connect.read_cursor',
+               return_value=iter([])) as mock_cursor:
+        assert not emf.might_contain(emf.PEOPLE_COLLECT, KNOWN_EMAIL)
+    assert mock_cursor.called
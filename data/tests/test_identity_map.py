@@ -0,0 +1,52 @@
+from unittest.mock import patch
+
+import data.identity_map as imap
+import data.people as ppl
+
+TEST_EMAIL = 'imap_person@nyu.edu'
+TEST_PERSON = {ppl.EMAIL: TEST_EMAIL, ppl.ROLES: ['ED']}
+
+
+def test_no_scope():
+    imap.end()
+    imap.put(ppl.PEOPLE_COLLECT, TEST_EMAIL, TEST_PERSON)
+    assert imap.get(ppl.PEOPLE_COLLECT, TEST_EMAIL) is imap.MISSING
+
+
+def test_scope():
+    imap.begin()
+    try:
+        imap.put(ppl.PEOPLE_COLLECT, TEST_EMAIL, None)
+        assert imap.get(ppl.PEOPLE_COLLECT, TEST_EMAIL) is None
+        imap.evict(ppl.PEOPLE_COLLECT, TEST_EMAIL)
+        assert imap.get(ppl.PEOPLE_COLLECT, TEST_EMAIL) is imap.MISSING
+    finally:
+        imap.end()
+
+
+@patch('data.db_connect.read_one', return_value=TEST_PERSON)
+def test_read_one_fetches_once(mock_read_one):
+    imap.begin()
+    try:
+        assert ppl.read_one(TEST_EMAIL) == TEST_PERSON
+        assert ppl.read_one(TEST_EMAIL) == TEST_PERSON
+        mock_read_one.assert_called_once()
+        ppl.invalidate_roles(TEST_EMAIL)
+        ppl.read_one(TEST_EMAIL)
+        assert mock_read_one.call_count == 2
+    finally:
+        imap.end()
+
+
+def test_evict_collection():
+    imap.begin()
+    try:
+        imap.put(ppl.PEOPLE_COLLECT, TEST_EMAIL, TEST_PERSON)
+        imap.put(ppl.MANU_COLLECT, 'manu1', {})
+        imap.put(ppl.MANU_COLLECT, 'manu2', {})
+        imap.evict_collection(ppl.MANU_COLLECT)
+        assert imap.get(ppl.MANU_COLLECT, 'manu1') is imap.MISSING
+        assert imap.get(ppl.MANU_COLLECT, 'manu2') is imap.MISSING
+        assert imap.get(ppl.PEOPLE_COLLECT, TEST_EMAIL) == TEST_PERSON
+    finally:
+        imap.end()
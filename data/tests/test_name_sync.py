@@ -0,0 +1,111 @@
+from unittest.mock import patch, MagicMock
+
+import pytest
+
+import data.name_sync as names
+import data.manuscripts.fields as flds
+
+TEST_EMAIL = 'renamed@nyu.edu'
+NEW_NAME = 'Joan Smith'
+
+
+def cursor_of(*batches):
+    """
+    A stand-in for read_cursor() whose chained calls yield one batch of
+    manuscript ids per call.
+    """
+    cursor = MagicMock()
+    chain = cursor.return_value.collation.return_value.sort.return_value
+    chain.limit.side_effect = [
+        iter([{flds.ID: manu_id} for manu_id in batch]) for batch in batches]
+    return cursor
+
+
+@pytest.fixture(autouse=True)
+def small_batches(monkeypatch):
+    monkeypatch.setattr(names, 'BATCH_SIZE', 2)
+    monkeypatch.setattr(names, 'BATCH_PAUSE', 0)
+
+
+@pytest.fixture(autouse=True)
+def statuses():
+    """
+    Keeps the name_sync collection in a dict, as any worker would see it.
+    """
+    docs = {}
+
+    def update(collection, filt, fields, upsert=False):
+        assert collection == names.SYNC_COLLECT
+        docs.setdefault(filt[names.ID], {names.ID: filt[names.ID]}).update(
+            fields)
+
+    def read_one(collection, filt):
+        doc = docs.get(filt[names.ID])
+        return dict(doc) if doc else None
+
+    with patch('data.db_connect.update', side_effect=update):
+        with patch('data.db_connect.read_one', side_effect=read_one):
+            yield docs
+
+
+def test_run_job_batches():
+    cursor = cursor_of([1, 2], [3])
+    with patch('data.db_connect.read_cursor', cursor):
+        with patch('data.db_connect.update_many',
+                   side_effect=[2, 1]) as mock_update:
+            assert names.run_job(TEST_EMAIL, NEW_NAME) == 3
+    assert mock_update.call_count == 2
+    # the second batch starts after the last id of the first
+    second_filter = cursor.call_args_list[1].args[1]
+    assert second_filter[flds.ID] == {'$gt': 2}
+
+
+def test_run_job_nothing_to_do():
+    with patch('data.db_connect.read_cursor', cursor_of([])):
+        with patch('data.db_connect.update_many') as mock_update:
+            assert names.run_job(TEST_EMAIL, NEW_NAME) == 0
+    mock_update.assert_not_called()
+
+
+@patch('data.name_sync.run_job', return_value=5)
+def test_schedule_reports_status(mock_run_job):
+    names.schedule(TEST_EMAIL, NEW_NAME)
+    names.wait()
+    status = names.get_status(TEST_EMAIL)
+    assert status[names.STATE] == names.DONE
+    assert status[names.UPDATED] == 5
+    mock_run_job.assert_called_once_with(TEST_EMAIL, NEW_NAME)
+
+
+@patch('data.name_sync.run_job', side_effect=RuntimeError('DB down'))
+def test_failed_job_status(mock_run_job):
+    names.schedule(TEST_EMAIL, NEW_NAME)
+    names.wait()
+    status = names.get_status(TEST_EMAIL)
+    assert status[names.STATE] == names.FAILED
+    assert status[names.ERROR] == 'DB down'
+
+
+def test_no_status():
+    assert names.get_status('never_renamed@nyu.edu') is None
+
+
+def test_status_seen_by_another_worker(statuses):
+    statuses[TEST_EMAIL] = {names.ID: TEST_EMAIL, names.STATE: names.DONE,
+                            names.NAME: NEW_NAME, names.UPDATED: 3}
+    assert names.get_status(TEST_EMAIL) == {
+        names.STATE: names.DONE, names.NAME: NEW_NAME, names.UPDATED: 3}
+
+
+@patch('data.name_sync.run_job', return_value=4)
+def test_resume(mock_run_job, statuses):
+    statuses[TEST_EMAIL] = {names.ID: TEST_EMAIL, names.STATE: names.QUEUED,
+                            names.NAME: NEW_NAME, names.UPDATED: 0}
+    with patch('data.db_connect.read_cursor',
+               return_value=iter([dict(statuses[TEST_EMAIL])])) as cursor:
+        assert names.resume() == 1
+    assert cursor.call_args.args[1] == {
+        names.STATE: {'$in': names.UNFINISHED}}
+    mock_run_job.assert_called_once_with(TEST_EMAIL, NEW_NAME)
+    assert statuses[TEST_EMAIL][names.STATE] == names.DONE
+    assert statuses[TEST_EMAIL][names.UPDATED] == 4
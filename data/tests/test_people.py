@@ -1,5 +1,8 @@
+from unittest.mock import patch
+
 import pytest
 
+import data.db_connect as dbc
 import data.people as ppl
 from data.roles import TEST_CODE as TEST_ROLE_CODE
 
@@ -189,3 +192,84 @@ def test_not_is_valid_person():
             'test@example.com',
             ['BAD CODE'],
         )
+
+
+def test_create_stores_role_mask(temp_person):
+    person_rec = ppl.read_one(temp_person)
+    assert person_rec[ppl.ROLE_MASK] == ppl.rls.to_mask([TEST_ROLE_CODE])
+
+
+def test_delete_role_updates_mask(temp_person):
+    ppl.delete_role(temp_person, TEST_ROLE_CODE)
+    person_rec = ppl.read_one(temp_person)
+    assert person_rec[ppl.ROLE_MASK] == 0
+
+
+def test_get_role_mask_without_cached_mask():
+    person = {ppl.ROLES: [TEST_ROLE_CODE]}
+    assert ppl.get_role_mask(person) == ppl.rls.to_mask([TEST_ROLE_CODE])
+
+
+@patch('data.people.ROLE_CACHE_SIZE', 2)
+@patch('data.people.role_cache', new_callable=ppl.OrderedDict)
+@patch('data.people.read_one', return_value={ppl.ROLE_MASK: 1})
+def test_role_cache_evicts_least_recent(mock_read, mock_cache):
+    ppl.get_cached_role_mask('a@nyu.edu')
+    ppl.get_cached_role_mask('b@nyu.edu')
+    ppl.get_cached_role_mask('a@nyu.edu')  # a is now the most recent
+    ppl.get_cached_role_mask('c@nyu.edu')
+    assert list(mock_cache) == ['a@nyu.edu', 'c@nyu.edu']
+    assert mock_read.call_count == 3
+
+
+@patch('data.db_connect.delete', return_value=1)
+@patch('data.manuscripts.history.record_many')
+@patch('data.manuscripts.referee_load.apply')
+@patch('data.manuscripts.referee_load.forget')
+@patch('data.db_connect.read_cursor')
+@patch('data.db_connect.update_many')
+def test_cascade_withdraw_sets_rank(mock_update, mock_cursor, mock_forget,
+                                    mock_apply, mock_record, mock_delete):
+    manu = {'_id': 'm1', ppl.flds.STATE: ppl.sts.SUBMITTED,
+            ppl.flds.REFEREES: []}
+    mock_cursor.return_value.collation.return_value = [manu]
+    assert ppl.cascade_delete(ppl.DEL_EMAIL, ppl.WITHDRAW_AUTHORED) == 1
+    withdraw = mock_update.call_args_list[1].args[2]['$set']
+    assert withdraw[ppl.flds.STATE] == ppl.sts.WITHDRAWN
+    assert withdraw[ppl.flds.STATE_RANK] == ppl.sts.CLOSED_RANK
+
+
+def test_normalize_email():
+    assert ppl.normalize_email(' An3299@Nyu.EDU ') == 'an3299@nyu.edu'
+
+
+def test_create_stores_email_key(temp_person):
+    person_rec = ppl.read_one(temp_person.upper())
+    assert person_rec[ppl.EMAIL_KEY] == ppl.normalize_email(temp_person)
+
+
+def test_create_case_variant_is_duplicate(temp_person):
+    with pytest.raises(ValueError):
+        ppl.create('Joe Smith', 'NYU', temp_person.upper(), [TEST_ROLE_CODE])
+
+
+@patch('data.email_filter.might_contain', return_value=False)
+@patch('data.db_connect.read_one', return_value={ppl.EMAIL: ADD_EMAIL})
+def test_exists_ignores_stale_filter(mock_read_one, mock_might_contain):
+    # someone another worker created, that this filter never saw
+    assert ppl.exists(ADD_EMAIL)
+    mock_might_contain.assert_not_called()
+
+
+@patch('data.email_filter.might_contain', return_value=False)
+@patch('data.db_connect.read_one')
+def test_is_email_taken_skips_lookup(mock_read_one, mock_might_contain):
+    assert not ppl.is_email_taken(ADD_EMAIL)
+    mock_read_one.assert_not_called()
+
+
+@patch('data.email_filter.might_contain', return_value=False)
+@patch('data.db_connect.create', side_effect=dbc.DuplicateKeyError('dup'))
+def test_create_with_stale_filter(mock_create, mock_might_contain):
+    with pytest.raises(ValueError):
+        ppl.create('Joe Smith', 'NYU', ADD_EMAIL, VALID_ROLES)
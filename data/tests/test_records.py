@@ -0,0 +1,115 @@
+from unittest.mock import patch
+
+import pytest
+
+from bson import ObjectId
+
+import data.records as recs
+import data.people as ppl
+import data.text as txt
+import data.manuscripts.fields as flds
+import data.manuscripts.query as qry
+
+TEST_NAME = 'Ann Author'
+TEST_AFFILIATION = 'NYU'
+TEST_EMAIL = 'Ann.Author@NYU.edu'
+
+PERSON_DOC = {
+    '_id': ObjectId(),
+    ppl.NAME: TEST_NAME,
+    ppl.AFFILIATION: TEST_AFFILIATION,
+    ppl.EMAIL: TEST_EMAIL,
+    ppl.EMAIL_KEY: 'ann.author@nyu.edu',
+    ppl.ROLES: ['ED'],
+    ppl.ROLE_MASK: 1,
+}
+
+MANU_ID = ObjectId()
+MANU_DOC = {
+    flds.ID: MANU_ID,
+    flds.TITLE: 'A Title',
+    flds.AUTHOR: TEST_NAME,
+    flds.AUTHOR_EMAIL: TEST_EMAIL,
+    flds.REFEREES: [],
+    flds.STATE: qry.SUBMITTED,
+    flds.VERSION: 2,
+}
+
+
+def test_person_strips_and_derives():
+    person = ppl.Person(f' {TEST_NAME} ', f' {TEST_AFFILIATION} ',
+                        TEST_EMAIL, ['ED'])
+    assert person.name == TEST_NAME
+    assert person.affiliation == TEST_AFFILIATION
+    assert person.email_key == 'ann.author@nyu.edu'
+    assert person.role_mask == ppl.rls.to_mask(['ED'])
+
+
+def test_person_validates():
+    with pytest.raises(ValueError):
+        ppl.Person('', TEST_AFFILIATION, TEST_EMAIL)
+    with pytest.raises(ValueError):
+        ppl.Person(TEST_NAME, TEST_AFFILIATION, 'not an email')
+
+
+def test_no_dict():
+    person = ppl.Person.from_bson(PERSON_DOC)
+    assert not hasattr(person, '__dict__')
+
+
+def test_from_bson_skips_mongo_id():
+    person = ppl.Person.from_bson(PERSON_DOC)
+    assert '_id' not in person.to_json()
+    assert person.to_json()[ppl.EMAIL] == TEST_EMAIL
+
+
+def test_from_bson_leaves_missing_fields_out():
+    manu = qry.Manuscript.from_bson(MANU_DOC)
+    as_json = manu.to_json()
+    assert as_json[flds.ID] == str(MANU_ID)
+    assert flds.ABSTRACT not in as_json
+    assert flds.TEXT_ID not in as_json
+
+
+def test_projection():
+    projection = qry.Manuscript.get_projection()
+    assert projection[flds.ID] == 1
+    assert flds.TEXT not in projection
+    assert ppl.Person.get_projection()['_id'] == 0
+
+
+def test_mh_rec():
+    person = ppl.Person.from_bson(PERSON_DOC)
+    assert person.mh_rec() == {ppl.NAME: TEST_NAME,
+                               ppl.AFFILIATION: TEST_AFFILIATION}
+
+
+def test_text_entry_validates():
+    with pytest.raises(ValueError):
+        txt.TextEntry('key', '', 'text')
+    entry = txt.TextEntry('key', 'Title', 'Some text')
+    assert txt.TextEntry.from_bson(entry.to_json()) == entry
+
+
+@patch('data.db_connect.read_cursor', return_value=[MANU_DOC])
+def test_read_keyed(mock_cursor):
+    manus = qry.get_manuscripts()
+    assert list(manus) == [str(MANU_ID)]
+    assert manus[str(MANU_ID)][flds.VERSION] == 2
+    assert mock_cursor.call_args.args[2] == qry.Manuscript.get_projection()
+
+
+@patch('data.db_connect.read_cursor', return_value=[PERSON_DOC])
+def test_masthead_reads_people_once(mock_cursor):
+    masthead = ppl.get_masthead()
+    assert mock_cursor.call_count == 1
+    assert {ppl.NAME: TEST_NAME, ppl.AFFILIATION: TEST_AFFILIATION} \
+        in masthead[ppl.rls.get_masthead_roles()['ED']]
+
+
+def test_benchmark():
+    docs = [{**MANU_DOC, flds.ID: ObjectId()} for _ in range(50)]
+    results = recs.benchmark(qry.Manuscript, docs)
+    for path in ['dict', 'record']:
+        assert results[path]['peak_bytes_per_obj'] > 0
+        assert results[path]['dump_secs'] >= 0
@@ -59,3 +59,26 @@ def test_roles_is_copy():
     original['TEST'] = 'Test'
     new = rls.get_roles()
     assert 'TEST' not in new
+
+
+def test_roles_view_is_read_only():
+    with pytest.raises(TypeError):
+        rls.ROLES_VIEW['TEST'] = 'Test'
+
+
+def test_role_bits_unique():
+    bits = list(rls.ROLE_BITS.values())
+    assert len(set(bits)) == len(rls.ROLES)
+    for bit in bits:
+        assert bit & (bit - 1) == 0
+
+
+def test_to_mask_round_trip():
+    codes = [rls.ED_CODE, rls.RE_CODE]
+    assert sorted(rls.from_mask(rls.to_mask(codes))) == sorted(codes)
+    assert rls.to_mask(['NOT A VALID ROLE']) == 0
+
+
+def test_has_any():
+    assert rls.has_any(rls.to_mask([rls.ME_CODE]), rls.MH_MASK)
+    assert not rls.has_any(rls.to_mask([rls.AUTHOR_CODE]), rls.MH_MASK)
@@ -3,6 +3,7 @@ This module interfaces to our text data.
 """
 
 import data.db_connect as dbc
+import data.records as recs
 
 # Fields
 KEY = 'key'
@@ -14,11 +15,28 @@ TEXT_COLLECTION = 'text'
 client = dbc.connect_db()
 
 
+class TextEntry(recs.Record):
+    """
+    A page of text, as stored in the text collection.
+    """
+    __slots__ = (KEY, TITLE, TEXT)
+    COLLECTION = TEXT_COLLECTION
+    KEY = KEY
+
+    def __init__(self, key: str, title: str, text: str):
+        if not key or not title or not text:
+            raise ValueError("Key, title, and text must all be provided and "
+                             "non-empty.")
+        self.key = key
+        self.title = title
+        self.text = text
+
+
 def read() -> dict:
     """
     Reads all text entries from the database and returns them as a dictionary.
     """
-    return dbc.read_dict(TEXT_COLLECTION, KEY)
+    return TextEntry.read_keyed()
 
 
 def read_one(key: str) -> dict:
@@ -35,14 +53,11 @@ def create(key: str, title: str, text: str) -> dict:
     """
     Creates a new text entry in the database.
     """
-    if not key or not title or not text:
-        raise ValueError("Key, title, and text must all be provided and "
-                         "non-empty.")
+    doc = TextEntry(key, title, text).to_json()
 
     if dbc.read_one(TEXT_COLLECTION, {KEY: key}):
         raise ValueError(f"Key '{key}' already exists in the database.")
 
-    doc = {KEY: key, TITLE: title, TEXT: text}
     dbc.create(TEXT_COLLECTION, doc)
     inserted_doc = dbc.read_one(TEXT_COLLECTION, {KEY: key})
     return dbc.convert_mongo_id(inserted_doc)
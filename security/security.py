@@ -3,6 +3,7 @@ This module is for security access control based on roles.
 """
 
 import data.people as ppl
+import data.roles as rls
 
 # Action Constants
 CREATE = 'create'
@@ -38,23 +39,56 @@ PERMISSION_RULES = {
 }
 
 
+def compile_rules(rules: dict) -> dict:
+    """
+    Compiles {feature: {action: [roles]}} into {(feature, action): mask}.
+    """
+    return {(feature, action): rls.to_mask(roles)
+            for feature, actions in rules.items()
+            for action, roles in actions.items()}
+
+
+def compile_state_rules(role_states: dict) -> dict:
+    """
+    Compiles {role: [states]} into {state: mask of roles allowed there}.
+    """
+    state_masks = {}
+    for role, states in role_states.items():
+        for state in states:
+            mask = state_masks.get(state, 0)
+            state_masks[state] = mask | rls.ROLE_BITS[role]
+    return state_masks
+
+
+COMPILED_RULES = compile_rules(PERMISSION_RULES)
+
+
+def get_user_mask(user_email: str) -> int:
+    """
+    Returns the user's role mask, or 0 if there is no such user.
+    Served from the people role cache when it is warm.
+    """
+    return ppl.get_cached_role_mask(user_email) or 0
+
+
 def is_permitted(feature: str, action: str, user_email: str) -> bool:
     """
     Checks if a user is allowed to perform the specified action on a feature.
-    Looks up the required roles and checks if the user has any of them.
+    Features and actions with no rule are disallowed by default.
     """
-    # If the feature/action is not protected, disallow by default
-    if feature not in PERMISSION_RULES:
-        return False
-    if action not in PERMISSION_RULES[feature]:
+    required_mask = COMPILED_RULES.get((feature, action))
+    if not required_mask:
         return False
+    return rls.has_any(get_user_mask(user_email), required_mask)
 
-    required_roles = PERMISSION_RULES[feature][action]
-    user = ppl.read_one(user_email)
-    if not user:
-        return False
 
-    for role in required_roles:
-        if ppl.has_role(user, role):
-            return True
-    return False
+def get_feature_permissions(user_mask: int) -> dict:
+    """
+    Returns {feature: {action: bool}} for every protected feature/action,
+    evaluated against a role mask.
+    """
+    perms = {}
+    for (feature, action), required_mask in COMPILED_RULES.items():
+        perms.setdefault(feature, {})[action] = rls.has_any(user_mask,
+                                                            required_mask)
+    return perms
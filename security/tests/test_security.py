@@ -1,3 +1,5 @@
+from unittest.mock import patch
+
 import pytest
 
 import security.security as sec
@@ -49,3 +51,34 @@ def test_unprotected_feature(temp_editor):
 
 def test_unprotected_action(temp_editor):
     assert not sec.is_permitted(sec.TEXT, sec.READ, temp_editor)
+
+
+def test_compile_rules():
+    compiled = sec.compile_rules({sec.TEXT: {sec.UPDATE: [EDITOR_ROLE]}})
+    assert compiled == {(sec.TEXT, sec.UPDATE): sec.rls.to_mask([EDITOR_ROLE])}
+
+
+def test_compile_state_rules():
+    compiled = sec.compile_state_rules({EDITOR_ROLE: ['SUB'],
+                                        AUTHOR_ROLE: ['SUB', 'AU_RVW']})
+    assert compiled['SUB'] == sec.rls.to_mask([EDITOR_ROLE, AUTHOR_ROLE])
+    assert compiled['AU_RVW'] == sec.rls.to_mask([AUTHOR_ROLE])
+
+
+def test_is_permitted_warm_cache(temp_editor):
+    assert sec.is_permitted(sec.TEXT, sec.UPDATE, temp_editor)
+    with patch('data.people.read_one') as mock_read_one:
+        assert sec.is_permitted(sec.TEXT, sec.UPDATE, temp_editor)
+        mock_read_one.assert_not_called()
+
+
+def test_cache_invalidated_on_update(temp_editor):
+    assert sec.is_permitted(sec.TEXT, sec.UPDATE, temp_editor)
+    ppl.update('Test Editor', 'NYU', temp_editor, [AUTHOR_ROLE])
+    assert not sec.is_permitted(sec.TEXT, sec.UPDATE, temp_editor)
+
+
+def test_cache_invalidated_on_delete_role(temp_editor):
+    assert sec.is_permitted(sec.TEXT, sec.UPDATE, temp_editor)
+    ppl.delete_role(temp_editor, EDITOR_ROLE)
+    assert not sec.is_permitted(sec.TEXT, sec.UPDATE, temp_editor)
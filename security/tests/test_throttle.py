@@ -0,0 +1,79 @@
+import time
+from unittest.mock import patch
+
+import pytest
+
+import security.throttle as thr
+
+TEST_EMAIL = 'throttle_user@nyu.edu'
+TEST_CLIENT = '10.0.0.1'
+
+
+@pytest.fixture(autouse=True)
+def throttle_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(thr, 'THROTTLE_DB',
+                        str(tmp_path / 'throttle.sqlite3'))
+
+
+def fail(times: int, email: str = TEST_EMAIL, client: str = TEST_CLIENT):
+    for _ in range(times):
+        thr.record_failure(email, client)
+
+
+def test_not_locked_at_first():
+    assert thr.retry_after(TEST_EMAIL, TEST_CLIENT) == 0
+    assert not thr.is_locked(TEST_EMAIL, TEST_CLIENT)
+
+
+def test_email_lockout():
+    fail(thr.MAX_EMAIL_FAILURES - 1)
+    assert not thr.is_locked(TEST_EMAIL, TEST_CLIENT)
+    fail(1)
+    wait = thr.retry_after(TEST_EMAIL, TEST_CLIENT)
+    assert 0 < wait <= thr.WINDOW + 1
+    # the email stays locked from any client, in any case
+    assert thr.is_locked(TEST_EMAIL.upper(), '10.0.0.2')
+
+
+def test_client_lockout():
+    for i in range(thr.MAX_CLIENT_FAILURES):
+        thr.record_failure(f'user{i}@nyu.edu', TEST_CLIENT)
+    assert thr.is_locked('someone_new@nyu.edu', TEST_CLIENT)
+    assert not thr.is_locked('someone_new@nyu.edu', '10.0.0.2')
+
+
+def test_lockout_expires():
+    fail(thr.MAX_EMAIL_FAILURES)
+    later = time.time() + thr.WINDOW + 1
+    with patch('time.time', return_value=later):
+        assert not thr.is_locked(TEST_EMAIL, TEST_CLIENT)
+
+
+def test_success_resets_email():
+    fail(thr.MAX_EMAIL_FAILURES - 1)
+    thr.record_success(TEST_EMAIL)
+    fail(1)
+    assert not thr.is_locked(TEST_EMAIL, TEST_CLIENT)
+
+
+def test_clear():
+    fail(thr.MAX_EMAIL_FAILURES)
+    thr.clear()
+    assert not thr.is_locked(TEST_EMAIL, TEST_CLIENT)
+
+
+def test_schema_set_up_once():
+    thr.record_failure(TEST_EMAIL, TEST_CLIENT)
+    statements = []
+    real_connect = thr.sqlite3.connect
+
+    def traced_connect(*args, **kwargs):
+        conn = real_connect(*args, **kwargs)
+        conn.set_trace_callback(statements.append)
+        return conn
+
+    with patch('security.throttle.sqlite3.connect', traced_connect):
+        thr.is_locked(TEST_EMAIL, TEST_CLIENT)
+    assert statements
+    assert not [sql for sql in statements
+                if sql.startswith(('PRAGMA', 'CREATE'))]
@@ -0,0 +1,64 @@
+import time
+
+import pytest
+
+import security.tokens as tok
+import data.people as ppl
+
+TEST_EMAIL = 'token_user@nyu.edu'
+ROLES = ['ED', 'AU']
+
+
+def test_issue_and_verify():
+    claims = tok.verify(tok.issue(TEST_EMAIL, ROLES))
+    assert claims[tok.EMAIL] == TEST_EMAIL
+    assert claims[tok.ROLES] == ROLES
+
+
+def test_tampered_token():
+    token = tok.issue(TEST_EMAIL, [])
+    forged = tok.issue(TEST_EMAIL, ROLES)
+    payload = forged.split('.')[0]
+    signature = token.split('.')[1]
+    with pytest.raises(ValueError):
+        tok.verify(f'{payload}.{signature}')
+
+
+def test_bare_email_is_not_a_token():
+    with pytest.raises(ValueError):
+        tok.verify(TEST_EMAIL)
+    with pytest.raises(ValueError):
+        tok.verify('')
+
+
+def test_expired_token():
+    with pytest.raises(ValueError, match='expired'):
+        tok.verify(tok.issue(TEST_EMAIL, ROLES, ttl=-1))
+
+
+def test_revoked_by_role_change():
+    token = tok.issue(TEST_EMAIL, ROLES)
+    time.sleep(0.001)
+    ppl.invalidate_roles(TEST_EMAIL, roles_changed=True)
+    with pytest.raises(ValueError, match='revoked'):
+        tok.verify(token)
+    # a token issued after the change is fine
+    assert tok.verify(tok.issue(TEST_EMAIL, ROLES))
+
+
+def test_load_secret(monkeypatch):
+    monkeypatch.setenv(tok.ENV_TOKEN_SECRET, 'shared')
+    assert tok.load_secret() == b'shared'
+
+
+def test_load_secret_unset_locally(monkeypatch):
+    monkeypatch.delenv(tok.ENV_TOKEN_SECRET, raising=False)
+    monkeypatch.setenv('CLOUD_MONGO', '0')
+    assert len(tok.load_secret()) == 32
+
+
+def test_load_secret_unset_when_deployed(monkeypatch):
+    monkeypatch.delenv(tok.ENV_TOKEN_SECRET, raising=False)
+    monkeypatch.setenv('CLOUD_MONGO', '1')
+    with pytest.raises(RuntimeError):
+        tok.load_secret()
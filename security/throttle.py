@@ -0,0 +1,129 @@
+"""
+This module throttles login attempts to protect bcrypt CPU.
+Failed attempts are counted per email and per client address over a
+sliding window. Once either count reaches its limit, further attempts
+are refused until the oldest failures age out of the window, without
+any hashing or DB lookup.
+
+The counts live in a small SQLite file on local disk, so every gunicorn
+worker on the machine shares them.
+Entries older than the window are purged as new ones are written, so
+lockouts expire on their own.
+"""
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import closing
+
+import data.people as ppl
+
+ENV_THROTTLE_DB = 'THROTTLE_DB'
+
+THROTTLE_DB = os.environ.get(ENV_THROTTLE_DB,
+                             os.path.join(tempfile.gettempdir(),
+                                          'login_throttle.sqlite3'))
+WINDOW = int(os.environ.get('LOGIN_WINDOW', 15 * 60))  # seconds
+MAX_EMAIL_FAILURES = int(os.environ.get('LOGIN_MAX_EMAIL_FAILURES', 5))
+MAX_CLIENT_FAILURES = int(os.environ.get('LOGIN_MAX_CLIENT_FAILURES', 20))
+
+EMAIL_KIND = 'email'
+CLIENT_KIND = 'client'
+
+LIMITS = {
+    EMAIL_KIND: MAX_EMAIL_FAILURES,
+    CLIENT_KIND: MAX_CLIENT_FAILURES,
+}
+
+LOCKED_MSG = 'Too many failed logins. Please try again later.'
+
+# The store this process has already set up, see ensure_schema().
+schema_ready_for = None
+schema_lock = threading.Lock()
+
+
+def ensure_schema() -> None:
+    """
+    Switches the store to WAL and creates the table, once per process.
+    WAL mode is kept in the file itself, so later connections needn't
+    set it again.
+    """
+    global schema_ready_for
+    with schema_lock:
+        if schema_ready_for == THROTTLE_DB:
+            return
+        with closing(sqlite3.connect(THROTTLE_DB, timeout=5,
+                                     isolation_level=None)) as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS failures '
+                         '(kind TEXT, subject TEXT, at REAL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS failures_subject '
+                         'ON failures (kind, subject, at)')
+        schema_ready_for = THROTTLE_DB
+
+
+def connect() -> sqlite3.Connection:
+    """
+    Opens the shared store.
+    A connection per call keeps this safe across threads and processes.
+    """
+    ensure_schema()
+    return sqlite3.connect(THROTTLE_DB, timeout=5, isolation_level=None)
+
+
+def _subjects(email: str, client: str) -> list[tuple]:
+    subjects = [(EMAIL_KIND, ppl.normalize_email(email))]
+    if client:
+        subjects.append((CLIENT_KIND, client))
+    return subjects
+
+
+def retry_after(email: str, client: str = None) -> int:
+    """
+    Returns 0 if a login attempt may go ahead, otherwise how many seconds
+    until the oldest counted failure leaves the window.
+    """
+    now = time.time()
+    wait = 0
+    with closing(connect()) as conn:
+        for kind, subject in _subjects(email, client):
+            rows = conn.execute(
+                'SELECT at FROM failures WHERE kind = ? AND subject = ? '
+                'AND at > ? ORDER BY at DESC LIMIT ?',
+                (kind, subject, now - WINDOW, LIMITS[kind])).fetchall()
+            if len(rows) >= LIMITS[kind]:
+                wait = max(wait, int(rows[-1][0] + WINDOW - now) + 1)
+    return wait
+
+
+def is_locked(email: str, client: str = None) -> bool:
+    return retry_after(email, client) > 0
+
+
+def record_failure(email: str, client: str = None) -> None:
+    """
+    Counts a failed login against the email and the client.
+    """
+    now = time.time()
+    with closing(connect()) as conn:
+        conn.execute('DELETE FROM failures WHERE at <= ?', (now - WINDOW,))
+        conn.executemany('INSERT INTO failures VALUES (?, ?, ?)',
+                         [(kind, subject, now)
+                          for kind, subject in _subjects(email, client)])
+
+
+def record_success(email: str) -> None:
+    """
+    A good login clears the failures counted against that email.
+    Failures counted against the client stay, so one valid account
+    can't be used to reset a client that is guessing at others.
+    """
+    with closing(connect()) as conn:
+        conn.execute('DELETE FROM failures WHERE kind = ? AND subject = ?',
+                     (EMAIL_KIND, ppl.normalize_email(email)))
+
+
+def clear() -> None:
+    with closing(connect()) as conn:
+        conn.execute('DELETE FROM failures')
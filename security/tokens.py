@@ -0,0 +1,102 @@
+"""
+This module issues and verifies signed bearer tokens.
+A token carries the user's email, role codes and an expiry time, signed
+with HMAC-SHA256, so checking who a caller is and what roles they hold
+needs no DB lookup.
+
+Tokens are short lived (TOKEN_TTL seconds) so role changes made in
+another worker take effect within one TTL. Role changes seen by this
+process revoke older tokens immediately.
+Set TOKEN_SECRET in the env, shared by every worker. Deployed servers
+refuse to start without it; elsewhere each process makes up its own
+secret, with a warning, and tokens only verify in the process that
+issued them.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import time
+
+import data.db_connect as dbc
+import data.people as ppl
+
+# Claim names
+EMAIL = 'email'
+ROLES = 'roles'
+ISSUED_AT = 'iat'
+EXPIRES = 'exp'
+
+ENV_TOKEN_SECRET = 'TOKEN_SECRET'
+ENV_TOKEN_TTL = 'TOKEN_TTL'
+
+TOKEN_TTL = int(os.environ.get(ENV_TOKEN_TTL, 15 * 60))
+
+INVALID_TOKEN_MSG = 'Invalid token.'
+EXPIRED_TOKEN_MSG = 'Token has expired.'
+REVOKED_TOKEN_MSG = 'Token was revoked by a role change.'
+NO_SECRET_MSG = (f'{ENV_TOKEN_SECRET} is not set, so tokens will only '
+                 'verify in the process that issued them.')
+
+
+def load_secret() -> bytes:
+    """
+    Returns the signing secret from the env.
+    A deployed server (CLOUD_MONGO=1) runs several workers that must all
+    sign alike, so it refuses to start without one.
+    """
+    secret = os.environ.get(ENV_TOKEN_SECRET, '').encode()
+    if secret:
+        return secret
+    if os.environ.get(dbc.ENV_CLOUD_MONGO, dbc.LOCAL) == dbc.CLOUD:
+        raise RuntimeError(NO_SECRET_MSG)
+    print(f'Warning: {NO_SECRET_MSG}')
+    return secrets.token_bytes(32)
+
+
+SECRET = load_secret()
+
+
+def _encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode()
+
+
+def _decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def _sign(payload: str) -> str:
+    digest = hmac.new(SECRET, payload.encode(), hashlib.sha256).digest()
+    return _encode(digest)
+
+
+def issue(email: str, roles: list[str], ttl: int = TOKEN_TTL) -> str:
+    """
+    Returns a signed token for the user, valid for `ttl` seconds.
+    """
+    now = time.time()
+    claims = {EMAIL: email, ROLES: list(roles), ISSUED_AT: now,
+              EXPIRES: now + ttl}
+    payload = _encode(json.dumps(claims, separators=(',', ':')).encode())
+    return f'{payload}.{_sign(payload)}'
+
+
+def verify(token: str) -> dict:
+    """
+    Checks a token's signature, expiry and revocation.
+    Returns its claims, or raises ValueError if the token is not good.
+    """
+    payload, _, signature = (token or '').partition('.')
+    if not payload or not hmac.compare_digest(signature, _sign(payload)):
+        raise ValueError(INVALID_TOKEN_MSG)
+    try:
+        claims = json.loads(_decode(payload))
+    except ValueError:
+        raise ValueError(INVALID_TOKEN_MSG)
+    if claims[EXPIRES] < time.time():
+        raise ValueError(EXPIRED_TOKEN_MSG)
+    if claims[ISSUED_AT] < ppl.get_roles_changed_at(claims[EMAIL]):
+        raise ValueError(REVOKED_TOKEN_MSG)
+    return claims
@@ -3,11 +3,12 @@ This is the file containing all of the endpoints for our flask app.
 The endpoint called `endpoints` will return all available endpoints.
 """
 
-from flask import Flask, request
+from flask import Flask, Response, g, jsonify, request
 from flask_restx import Resource, Api, fields  # Namespace, fields
 from flask_cors import CORS
 
 import werkzeug.exceptions as wz
+from werkzeug.datastructures import ContentRange
 from http import HTTPStatus
 
 import data.people as ppl
@@ -16,11 +17,22 @@ import data.manuscripts.form_filler as ff
 import data.text as txt
 import data.manuscripts.query as qry
 import data.manuscripts.fields as flds
+import data.manuscripts.history as hist
+import data.manuscripts.referee_load as load
+import data.manuscripts.revisions as revs
+import data.manuscripts.search as srch
+import data.manuscripts.stats as stats
 import data.roles as rls
 import data.account as acc
+import data.email_filter as emf
+import data.identity_map as imap
 
 import security.security as sec
+import security.throttle as thr
+import security.tokens as tok
 
+import functools
+import hashlib
 import subprocess
 
 from dotenv import load_dotenv
@@ -35,6 +47,7 @@ load_dotenv()
 ERROR_FILE = os.getenv("ERROR_FILE")
 
 ACCOUNT_EP = '/account'
+AFTER = 'after'
 DATE = '2024-09-24'
 DATE_RESP = 'Date'
 EDITOR = 'ejc369@nyu.edu'
@@ -44,27 +57,38 @@ ENDPOINT_RESP = 'Available endpoints'
 FORM_EP = '/form'
 HELLO_EP = '/hello'
 HELLO_RESP = 'hello'
+LIMIT = 'limit'
 LOGIN_EP = '/login'
 MASTHEAD = 'Masthead'
 MESSAGE = 'Message'
+METRICS_EP = '/metrics'
+OFFSET = 'offset'
 PEOPLE_CREATE_FORM = 'People Add Form'
 PEOPLE_EP = '/people'
 PUBLISHER = 'Palgave'
 PUBLISHER_RESP = 'Publisher'
 QUERY_EP = '/query'
+REFRESH = 'refresh'
 REGISTER_EP = '/register'
 REPO_NAME = 'mmankwgzrz'
 REPO_NAME_EP = '/authors'
 REPO_NAME_RESP = 'Repository Name'
 RETURN = 'return'
+RETRY_AFTER = 1  # seconds, for 503s
 ROLES_EP = '/roles'
+SEARCH_QUERY = 'q'
 TEXT_EP = '/text'
+TEXT_MIMETYPE = 'text/plain; charset=utf-8'
 TITLE = 'The Journal of API Technology'
 TITLE_EP = '/title'
 TITLE_RESP = 'Title'
+TOKEN = 'token'
 LOG_DIR = '/var/log'
 DELETED = 'Deleted'
 PEOPLE = 'people'
+PERMISSIONS_EP = '/permissions'
+CAPS_FEATURES = 'features'
+CAPS_STATES = 'states'
 
 QUERY_CREATE_FLDS = api.model('CreateQueryEntry', {
     flds.TITLE: fields.String,
@@ -128,11 +152,25 @@ MANU_ACTION_FLDS = api.model('ManuscriptAction', {
     flds.REFEREES: fields.String,
 })
 
+MANU_ACTIONS_BULK_FLDS = api.model('ManuscriptActionsBulk', {
+    flds.ACTIONS: fields.List(fields.Nested(api.model('BulkAction', {
+        flds.ID: fields.String,
+        flds.ACTION: fields.String,
+        flds.REFEREES: fields.String,
+        flds.VERSION: fields.Integer,
+    }))),
+})
+
 MANU_STATE_FLDS = api.model('ManuscriptState', {
     flds.ID: fields.String,
     flds.STATE: fields.String,
 })
 
+VALID_ACTIONS_BULK_FLDS = api.model('ValidActionsBulk', {
+    flds.USER_EMAIL: fields.String,
+    flds.MANU_IDS: fields.List(fields.String),
+})
+
 LOGIN_FLDS = api.model('Login', {
     acc.EMAIL: fields.String,
     acc.PASSWORD: fields.String,
@@ -149,6 +187,88 @@ CHANGE_ACC_PW_FLDS = api.model('ChangeAccountPW', {
 })
 
 
+@app.before_request
+def open_identity_map():
+    """
+    Each request gets its own identity map, so the data layer fetches a
+    given person or manuscript at most once while serving it.
+    """
+    imap.begin()
+
+
+@app.teardown_request
+def close_identity_map(exc):
+    imap.end()
+
+
+def login_required(func):
+    """
+    Resolves the caller from the Authorization bearer token once, before
+    the endpoint runs, and keeps their claims in flask.g.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        auth_header = request.headers.get('Authorization')
+        if not auth_header or not auth_header.startswith('Bearer '):
+            raise wz.Unauthorized('Missing or invalid Authorization header. '
+                                  'Please log back in.')
+        try:
+            g.claims = tok.verify(auth_header.split(' ')[1].strip())
+        except ValueError as err:
+            raise wz.Unauthorized(f'{err} Please log back in.')
+        return func(*args, **kwargs)
+    return wrapper
+
+
+def if_match_version() -> int:
+    """
+    Returns the manuscript version an If-Match header asks for, or None.
+    A manuscript's ETag is its version, so the header may name only one.
+    """
+    if not request.if_match or request.if_match.star_tag:
+        return None
+    tags = request.if_match.as_set(include_weak=True)
+    if len(tags) != 1:
+        raise wz.BadRequest('If-Match must name a single manuscript '
+                            'version.')
+    try:
+        return int(tags.pop())
+    except ValueError:
+        raise wz.BadRequest('If-Match must name a manuscript version.')
+
+
+def conflict_error(err: Exception, version: int) -> wz.HTTPException:
+    """
+    A write that lost to another change fails its If-Match precondition
+    (412) if the client sent one, and is a plain conflict (409) if not.
+    """
+    if version is None:
+        return wz.Conflict(str(err))
+    return wz.PreconditionFailed(str(err))
+
+
+def version_etag(version: int) -> dict:
+    return {'ETag': f'"{version}"'}
+
+
+def requester_email() -> str:
+    return g.claims[tok.EMAIL]
+
+
+def requester_mask() -> int:
+    return rls.to_mask(g.claims[tok.ROLES])
+
+
+def check_self_or_editor(email: str) -> None:
+    """
+    Only the person themselves or a masthead editor may modify a person.
+    """
+    if ppl.normalize_email(requester_email()) == ppl.normalize_email(email):
+        return
+    if not rls.has_any(requester_mask(), rls.MH_MASK):
+        raise wz.Unauthorized('You are unauthorized to modify another user.')
+
+
 @api.route('/log/error')
 class ErrorLog(Resource):
     """
@@ -161,6 +281,15 @@ class ErrorLog(Resource):
         return {'error_log': result.stdout.strip()}
 
 
+@api.route(f'{METRICS_EP}/email_filter')
+class EmailFilterMetrics(Resource):
+    """
+    Reports how well the email Bloom filter is saving DB lookups.
+    """
+    def get(self):
+        return emf.get_stats()
+
+
 @api.route(HELLO_EP)
 class HelloWorld(Resource):
     """
@@ -228,6 +357,8 @@ class Login(Resource):
     """
     @api.response(HTTPStatus.OK, 'Success')
     @api.response(HTTPStatus.BAD_REQUEST, 'Invalid request')
+    @api.response(HTTPStatus.TOO_MANY_REQUESTS, 'Too many failed logins')
+    @api.response(HTTPStatus.SERVICE_UNAVAILABLE, 'Too many logins')
     @api.expect(LOGIN_FLDS)
     def post(self):
         """
@@ -239,12 +370,23 @@ class Login(Resource):
         if not email or not password:
             raise wz.BadRequest('Both email and password are required.')
 
+        # refuse locked-out attempts before paying for bcrypt or the DB
+        wait = thr.retry_after(email, request.remote_addr)
+        if wait:
+            raise wz.TooManyRequests(thr.LOCKED_MSG, retry_after=wait)
+
         try:
             acc.login(email, password)
+            thr.record_success(email)
+            roles = rls.from_mask(ppl.get_cached_role_mask(email) or 0)
             return {
                 MESSAGE: 'Login success!',
+                TOKEN: tok.issue(email, roles),
             }, HTTPStatus.OK
+        except acc.PasswordServiceBusy as err:
+            raise wz.ServiceUnavailable(str(err), retry_after=RETRY_AFTER)
         except ValueError as err:
+            thr.record_failure(email, request.remote_addr)
             raise wz.BadRequest(f'{str(err)}')
 
 
@@ -255,6 +397,7 @@ class Register(Resource):
     """
     @api.response(HTTPStatus.OK, 'Success')
     @api.response(HTTPStatus.BAD_REQUEST, 'Invalid request')
+    @api.response(HTTPStatus.SERVICE_UNAVAILABLE, 'Too many logins')
     @api.expect(REGISTER_FLDS)
     def post(self):
         """
@@ -271,6 +414,8 @@ class Register(Resource):
             return {
                 MESSAGE: f'Sign up success for {email}!',
             }, HTTPStatus.OK
+        except acc.PasswordServiceBusy as err:
+            raise wz.ServiceUnavailable(str(err), retry_after=RETRY_AFTER)
         except ValueError as err:
             raise wz.BadRequest(f'{str(err)}')
 
@@ -284,35 +429,15 @@ class Account(Resource):
     @api.response(HTTPStatus.NOT_FOUND, 'No such account.')
     @api.response(HTTPStatus.UNAUTHORIZED, 'Missing or invalid '
                   'Authorization header. Please log back in.')
+    @login_required
     def delete(self, email):
         """
         Deletes the user account.
         """
-        # extract Bearer email
-        auth_header = request.headers.get('Authorization')
-        if not auth_header or not auth_header.startswith('Bearer '):
-            raise wz.Unauthorized('Missing or invalid Authorization header. '
-                                  'Please log back in.')
-        bearer_email = auth_header.split(' ')[1].strip()
-        if not bearer_email:
-            raise wz.Unauthorized('Missing email in Authorization header. '
-                                  'Please log back in.')
-        # check if Bearer email matches the email in the route
-        if bearer_email != email:
-            # if not, check if Bearer email belongs to an editor
-            requester = ppl.read_one(bearer_email)
-            if not requester:
-                raise wz.NotFound(f"""Email not found:
-                                      {bearer_email}""")
-            roles = requester.get(flds.ROLES, [])
-            if not any(role in rls.MH_ROLES for role in roles):
-                raise wz.Unauthorized(
-                    """You are unauthorized to modify another user.""")
-
+        check_self_or_editor(email)
         try:
-            acc.delete(email)
-            # delete from people collection too
-            ppl.delete(email)
+            # the account, the person and their manuscript references
+            acc.delete_user(email)
             return {
                 MESSAGE: f'Successfully deleted account: {email}',
             }, HTTPStatus.OK
@@ -330,25 +455,22 @@ class AccountPassword(Resource):
     @api.response(HTTPStatus.NOT_FOUND, 'No such person.')
     @api.response(HTTPStatus.UNAUTHORIZED, 'Missing or invalid '
                   'Authorization header. Please log back in.')
+    @api.response(HTTPStatus.SERVICE_UNAVAILABLE, 'Too many logins')
     @api.expect(CHANGE_ACC_PW_FLDS)
+    @login_required
     def post(self):
         """
         Updates the user's password.
         """
-        # extract Bearer email
-        auth_header = request.headers.get('Authorization')
-        if not auth_header or not auth_header.startswith('Bearer '):
-            raise wz.Unauthorized('Missing or invalid Authorization header. '
-                                  'Please log back in.')
-        bearer_email = auth_header.split(' ')[1].strip()
-        if not bearer_email:
-            raise wz.Unauthorized('Missing email in Authorization header. '
-                                  'Please log back in.')
+        bearer_email = requester_email()
 
-        # first confirm the old password is correct
-        if not acc.check_password(request.json.get(flds.OLD_PASSWORD),
-                                  acc.get_password(bearer_email)):
-            raise wz.Unauthorized('Your old password is incorrect.')
+        try:
+            # first confirm the old password is correct
+            if not acc.check_password(request.json.get(flds.OLD_PASSWORD),
+                                      acc.get_password(bearer_email)):
+                raise wz.Unauthorized('Your old password is incorrect.')
+        except acc.PasswordServiceBusy as err:
+            raise wz.ServiceUnavailable(str(err), retry_after=RETRY_AFTER)
         try:
             # check that new password is valid
             acc.is_valid_password(request.json.get(flds.NEW_PASSWORD))
@@ -357,12 +479,14 @@ class AccountPassword(Resource):
                                    bearer_email):
                 return {MESSAGE: "Successfully updated password."}
             raise wz.NotFound("Email not found.")
+        except acc.PasswordServiceBusy as err:
+            raise wz.ServiceUnavailable(str(err), retry_after=RETRY_AFTER)
         except ValueError as e:
             # rethrow the error
             raise wz.BadRequest(str(e))
 
 
-@api.route('/permissions')
+@api.route(PERMISSIONS_EP)
 class Permissions(Resource):
     """
     Check if a user has permission to perform a specific action on a feature.
@@ -391,6 +515,35 @@ class Permissions(Resource):
         return {"permitted": allowed}
 
 
+@api.route(f'{PERMISSIONS_EP}/me')
+class MyPermissions(Resource):
+    """
+    Return the caller's complete capability map in one response.
+    """
+    @api.response(HTTPStatus.OK, 'Capability map')
+    @api.response(HTTPStatus.NOT_MODIFIED, 'Capabilities unchanged')
+    @api.response(HTTPStatus.UNAUTHORIZED, 'Missing or invalid '
+                  'Authorization header. Please log back in.')
+    @login_required
+    def get(self):
+        """
+        Feature permissions plus the actions the caller's roles allow in
+        each manuscript state.
+        The ETag is derived from the caller's roles, so clients can
+        revalidate with If-None-Match.
+        """
+        user_mask = requester_mask()
+
+        capabilities = {
+            ppl.ROLES: rls.from_mask(user_mask),
+            CAPS_FEATURES: sec.get_feature_permissions(user_mask),
+            CAPS_STATES: qry.get_state_actions(user_mask),
+        }
+        resp = jsonify(capabilities)
+        resp.set_etag(hashlib.sha1(resp.get_data()).hexdigest())
+        return resp.make_conditional(request)
+
+
 @api.route('/query/can_choose_action')
 class CanChooseAction(Resource):
     """
@@ -489,29 +642,15 @@ class Person(Resource):
 
     @api.response(HTTPStatus.OK, 'Success')
     @api.response(HTTPStatus.NOT_FOUND, 'No such person.')
+    @api.response(HTTPStatus.BAD_REQUEST, 'Person may not be deleted.')
     @api.response(HTTPStatus.UNAUTHORIZED, 'Authorization header missing')
+    @login_required
     def delete(self, email):
-        # extract Bearer email
-        auth_header = request.headers.get('Authorization')
-        if not auth_header or not auth_header.startswith('Bearer '):
-            raise wz.NotFound('Missing or invalid Authorization header')
-        bearer_email = auth_header.split(' ')[1].strip()
-        if not bearer_email:
-            raise wz.Unauthorized('No email found in Bearer token.')
-
-        # check if Bearer email matches the email in the route
-        if bearer_email != email:
-            # if not, check if Bearer email belongs to an editor
-            requester = ppl.read_one(bearer_email)
-            if not requester:
-                raise wz.NotFound(f"""Requester email not found:
-                                      {bearer_email}""")
-            roles = requester.get('roles', [])
-            if not any(role in roles for role in (
-                    rls.ED_CODE, rls.ME_CODE, rls.CE_CODE)):
-                raise wz.Unauthorized("""You are unauthorized to modify
-                                      another user""")
-        ret = ppl.delete(email)
+        check_self_or_editor(email)
+        try:
+            ret = ppl.delete(email)
+        except ValueError as err:
+            raise wz.BadRequest(f'Could not delete person: {str(err)}')
         if ret > 0:
             return {DELETED: ret}
         else:
@@ -522,30 +661,12 @@ class Person(Resource):
     @api.response(HTTPStatus.NOT_ACCEPTABLE, 'Invalid data')
     @api.response(HTTPStatus.UNAUTHORIZED, 'Authorization header missing')
     @api.expect(PEOPLE_UPDATE_FLDS)
+    @login_required
     def put(self, email):
         """
         Update a person's details.
         """
-        # extract Bearer email
-        auth_header = request.headers.get('Authorization')
-        if not auth_header or not auth_header.startswith('Bearer '):
-            raise wz.Unauthorized('You must log in to perform this action.')
-        bearer_email = auth_header.split(' ')[1].strip()
-        if not bearer_email:
-            raise wz.Unauthorized('You must log in to perform this action.')
-        # check if Bearer email matches the email in the route
-        if bearer_email != email:
-            # if not, check if Bearer email belongs to an editor
-            requester = ppl.read_one(bearer_email)
-            if not requester:
-                raise wz.NotFound(f"""Requester email not found:
-                                      {bearer_email}""")
-            roles = requester.get('roles', [])
-            if not any(role in roles for role in (
-                    rls.ED_CODE, rls.ME_CODE, rls.CE_CODE)):
-                raise wz.Unauthorized("""You are unauthorized to modify
-                                      another user""")
-
+        check_self_or_editor(email)
         try:
             person = ppl.read_one(email)
             if not person:
@@ -565,6 +686,21 @@ class Person(Resource):
             raise wz.NotAcceptable(f'Could not update person: {str(err)}')
 
 
+@api.route(f'{PEOPLE_EP}/<email>/name_sync')
+class PersonNameSync(Resource):
+    """
+    Reports the background job copying a renamed person's name onto
+    their manuscripts.
+    """
+    @api.response(HTTPStatus.OK, 'Success')
+    @api.response(HTTPStatus.NOT_FOUND, 'No rename in progress.')
+    def get(self, email):
+        status = ppl.get_name_sync_status(email)
+        if not status:
+            raise wz.NotFound(f'No rename scheduled for: {email}')
+        return status
+
+
 @api.route(f'{PEOPLE_EP}/create')
 class PeopleCreate(Resource):
     """
@@ -582,10 +718,6 @@ class PeopleCreate(Resource):
             affiliation = request.json.get(ppl.AFFILIATION)
             email = request.json.get(ppl.EMAIL)
             roles = request.json.get(ppl.ROLES, [])
-
-            if ppl.exists(email):
-                raise wz.NotAcceptable(f'Email is already in use: {email}')
-
             ret = ppl.create(name, affiliation, email, roles)
             return {
                 MESSAGE: 'Person added!',
@@ -595,6 +727,19 @@ class PeopleCreate(Resource):
             raise wz.NotAcceptable(f'Could not add person: {str(err)}')
 
 
+@api.route(f'{PEOPLE_EP}/referees/load')
+class RefereeLoad(Resource):
+    """
+    How many active manuscripts each referee holds.
+    """
+    def get(self):
+        """
+        Returns {referee email: active manuscripts}, for everyone with
+        the referee role.
+        """
+        return load.get_loads(ppl.get_role_holders(rls.RE_CODE))
+
+
 @api.route(f'{PEOPLE_EP}/role/<role>')
 class PeopleByRole(Resource):
     def get(self, role):
@@ -669,7 +814,8 @@ class QueryEntry(Resource):
             raise wz.BadRequest(f"Invalid ObjectId: {id}")
         else:
             if manuscript:
-                return manuscript
+                return (manuscript, HTTPStatus.OK,
+                        version_etag(qry.get_version(manuscript)))
             else:
                 raise wz.NotFound(f'No such manuscript: {id}')
 
@@ -704,6 +850,34 @@ class QueryEntry(Resource):
             RETURN: updated_manu
         }
 
+    @api.response(HTTPStatus.OK, 'Success')
+    @api.response(HTTPStatus.BAD_REQUEST, 'Invalid data')
+    @api.response(HTTPStatus.NOT_FOUND, 'No such manuscript.')
+    @api.response(HTTPStatus.CONFLICT, 'The manuscript changed meanwhile')
+    @api.response(HTTPStatus.PRECONDITION_FAILED,
+                  'The manuscript changed since the If-Match version')
+    @api.expect(QUERY_UPDATE_FLDS)
+    def patch(self, id):
+        """
+        Update only the fields sent.
+        Send If-Match with the manuscript's ETag to change only the
+        version you saw. The response carries the new ETag.
+        """
+        version = if_match_version()
+        if not qry.exists(id):
+            raise wz.NotFound(f'No such manuscript with id: {id}')
+        try:
+            new_version = qry.patch(id, request.json or {}, version)
+        except qry.ManuscriptConflict as err:
+            raise conflict_error(err, version)
+        except ValueError as err:
+            raise wz.BadRequest(str(err))
+
+        return {
+            MESSAGE: 'Manuscript updated successfully',
+            RETURN: id
+        }, HTTPStatus.OK, version_etag(new_version)
+
     @api.response(HTTPStatus.OK, 'Success')
     @api.response(HTTPStatus.NOT_FOUND, 'No such manuscript.')
     def delete(self, id):
@@ -720,6 +894,116 @@ class QueryEntry(Resource):
             return {DELETED: deleted_count}
 
 
+@api.route(f'{QUERY_EP}/<id>/text')
+class QueryText(Resource):
+    """
+    Streams a manuscript's text, whole or by byte range.
+    """
+    @api.response(HTTPStatus.OK, 'Success')
+    @api.response(HTTPStatus.PARTIAL_CONTENT, 'The requested range')
+    @api.response(HTTPStatus.NOT_FOUND, 'No such manuscript.')
+    @api.response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE,
+                  'Range is outside the text.')
+    def get(self, id):
+        """
+        Returns the text as UTF-8; honours a single Range: bytes=... header.
+        """
+        try:
+            manu = qry.get_one_manu(id, with_body=False)
+        except ValueError:
+            raise wz.BadRequest(f"Invalid ObjectId: {id}")
+        if not manu:
+            raise wz.NotFound(f'No such manuscript: {id}')
+
+        size = qry.get_text_size(manu)
+        start, stop = 0, size
+        if request.range:
+            span = request.range.range_for_length(size)
+            if span is None:
+                raise wz.RequestedRangeNotSatisfiable(length=size)
+            start, stop = span
+        resp = Response(qry.stream_text(manu, start, stop),
+                        mimetype=TEXT_MIMETYPE)
+        resp.accept_ranges = 'bytes'
+        resp.content_length = stop - start
+        if request.range:
+            resp.status_code = HTTPStatus.PARTIAL_CONTENT
+            resp.content_range = ContentRange('bytes', start, stop, size)
+        return resp
+
+
+@api.route(f'{QUERY_EP}/<id>/referee_suggestions')
+class RefereeSuggestions(Resource):
+    """
+    Suggests the least-loaded referees for a manuscript.
+    """
+    @api.response(HTTPStatus.OK, 'Success')
+    @api.response(HTTPStatus.NOT_FOUND, 'No such manuscript.')
+    @api.doc(params={LIMIT: 'The most referees to suggest'})
+    def get(self, id):
+        """
+        Returns eligible referees, fewest active manuscripts first.
+        """
+        try:
+            return qry.suggest_referees(id, request.args.get(LIMIT, type=int))
+        except ValueError as err:
+            raise wz.NotFound(str(err))
+
+
+@api.route(f'{QUERY_EP}/<id>/history')
+class QueryHistory(Resource):
+    """
+    Pages through a manuscript's workflow history.
+    """
+    @api.response(HTTPStatus.OK, 'Success')
+    @api.response(HTTPStatus.BAD_REQUEST, 'Bad page request')
+    @api.doc(params={
+        LIMIT: 'The most entries to return',
+        AFTER: 'The ID of the last entry of the previous page',
+    })
+    def get(self, id):
+        """
+        Returns the manuscript's transitions, oldest first.
+        """
+        limit = request.args.get(LIMIT, type=int)
+        after = request.args.get(AFTER)
+        try:
+            return hist.read(id, limit, after)
+        except ValueError as err:
+            raise wz.BadRequest(str(err))
+
+
+@api.route(f'{QUERY_EP}/<id>/revisions')
+class QueryRevisions(Resource):
+    """
+    Lists the versions of a manuscript's text.
+    """
+    @api.response(HTTPStatus.OK, 'Success')
+    def get(self, id):
+        """
+        Returns the manuscript's revisions, oldest first, without text.
+        """
+        return revs.get_revisions(id)
+
+
+@api.route(f'{QUERY_EP}/<id>/revisions/<revision_id>')
+class QueryRevision(Resource):
+    """
+    Fetches one version of a manuscript's text.
+    """
+    @api.response(HTTPStatus.OK, 'Success')
+    @api.response(HTTPStatus.NOT_FOUND, 'No such revision.')
+    def get(self, id, revision_id):
+        """
+        Returns the revision's text as UTF-8.
+        """
+        try:
+            text = revs.read(id, revision_id)
+        except ValueError as err:
+            raise wz.NotFound(str(err))
+        return Response(text, mimetype=TEXT_MIMETYPE)
+
+
 @api.route(f'{QUERY_EP}/create')
 class QueryCreate(Resource):
     """
@@ -761,31 +1045,60 @@ class HandleAction(Resource):
     """
     @api.response(HTTPStatus.OK, 'Success')
     @api.response(HTTPStatus.NOT_ACCEPTABLE, 'Not acceptable')
+    @api.response(HTTPStatus.CONFLICT, 'The manuscript changed meanwhile')
+    @api.response(HTTPStatus.PRECONDITION_FAILED,
+                  'The manuscript changed since the If-Match version')
+    @api.response(HTTPStatus.UNAUTHORIZED, 'Missing or invalid '
+                  'Authorization header. Please log back in.')
     @api.expect(MANU_ACTION_FLDS)
+    @login_required
     def put(self):
         """
         Handle query action and receive the next state for a manuscript.
+        Send If-Match with the manuscript's ETag to act only on the
+        version you saw. The caller is recorded as the actor.
         """
+        version = if_match_version()
         try:
             id = request.json.get(flds.ID)
-            manu = qry.get_one_manu(id)
-            curr_state = manu[flds.STATE]
             action = request.json.get(flds.ACTION)
             ref = request.json.get(flds.REFEREES)
-            new_state = qry.handle_action(curr_state, action,
-                                          manu=manu, ref=ref)
-
-            qry.update(manu[flds.ID], manu[flds.TITLE], manu[flds.AUTHOR],
-                       manu[flds.AUTHOR_EMAIL],
-                       manu[flds.REFEREES], new_state, manu[flds.TEXT],
-                       manu[flds.ABSTRACT])
-
+            new_state, new_version = qry.transition(id, action, ref, version,
+                                                    requester_email())
+        except qry.ManuscriptConflict as err:
+            raise conflict_error(err, version)
         except Exception as err:
             raise wz.NotAcceptable(f'Bad input: {err=}')
         return {
             MESSAGE: 'Action received!',
             RETURN: new_state,
-        }
+        }, HTTPStatus.OK, version_etag(new_version)
+
+
+@api.route(f'{QUERY_EP}/handle_action/bulk')
+class HandleActionBulk(Resource):
+    """
+    Take actions on many manuscripts in one request.
+    """
+    @api.response(HTTPStatus.OK, 'One outcome per action')
+    @api.response(HTTPStatus.BAD_REQUEST, 'No list of actions')
+    @api.response(HTTPStatus.UNAUTHORIZED, 'Missing or invalid '
+                  'Authorization header. Please log back in.')
+    @api.expect(MANU_ACTIONS_BULK_FLDS)
+    @login_required
+    def put(self):
+        """
+        Each action names a manuscript id, the action, and optionally a
+        referee and the manuscript version it was chosen against.
+        Returns, in order, whether each was done, conflicted with
+        another change, was invalid or named no manuscript.
+        The caller is recorded as the actor.
+        """
+        actions = (request.json or {}).get(flds.ACTIONS)
+        if (not isinstance(actions, list)
+                or not all(isinstance(action, dict) for action in actions)):
+            raise wz.BadRequest(f'Expected a list of {flds.ACTIONS}.')
+        return qry.handle_actions(actions, requester_email())
 
 
 @api.route(f'{QUERY_EP}/handle_state')
@@ -795,24 +1108,33 @@ class HandleState(Resource):
     """
     @api.response(HTTPStatus.OK, 'Sucess')
     @api.response(HTTPStatus.NOT_ACCEPTABLE, "Couldn't switch state!")
+    @api.response(HTTPStatus.CONFLICT, 'The manuscript changed meanwhile')
+    @api.response(HTTPStatus.PRECONDITION_FAILED,
+                  'The manuscript changed since the If-Match version')
+    @api.response(HTTPStatus.UNAUTHORIZED, 'Missing or invalid '
+                  'Authorization header. Please log back in.')
     @api.expect(MANU_STATE_FLDS)
+    @login_required
     def put(self):
         """
         Handle state switch for the editor's move ability.
+        Send If-Match with the manuscript's ETag to move only the version
+        you saw. The caller is recorded as the actor.
         """
+        version = if_match_version()
         try:
             id = request.json.get(flds.ID)
             new_state = request.json.get(flds.STATE)
-            manu = qry.get_one_manu(id)
-            qry.update(manu[flds.ID], manu[flds.TITLE], manu[flds.AUTHOR],
-                       manu[flds.AUTHOR_EMAIL], manu[flds.REFEREES], new_state,
-                       manu[flds.TEXT], manu[flds.ABSTRACT])
+            new_state, new_version = qry.move(id, new_state, version,
+                                              requester_email())
+        except qry.ManuscriptConflict as e:
+            raise conflict_error(e, version)
         except Exception as e:
             raise wz.NotAcceptable(f'Bad input: {e=}')
         return {
             MESSAGE: 'State updated!',
             RETURN: new_state,
-        }
+        }, HTTPStatus.OK, version_etag(new_version)
 
 
 @api.route(f'{QUERY_EP}/active/<email>')
@@ -822,15 +1144,23 @@ class QueryActive(Resource):
     """
     @api.response(HTTPStatus.OK, 'Success')
     @api.response(HTTPStatus.NOT_FOUND, 'User not found.')
+    @api.doc(params={
+        LIMIT: 'The most manuscripts to return',
+        AFTER: 'The ID of the last manuscript of the previous page',
+    })
     def get(self, email):
         """
-        Returns manuscripts based on user role and relation.
+        Returns manuscripts based on user role and relation, in workflow
+        order, a page at a time if a limit is given.
         """
         if not ppl.exists(email):
             raise wz.NotFound(f"No such user: {email}")
 
+        limit = request.args.get(LIMIT, type=int)
+        after = request.args.get(AFTER)
         try:
-            active_manuscripts = qry.get_active_manuscripts(email)
+            active_manuscripts = qry.get_active_manuscripts(email, limit,
+                                                            after)
         except Exception as err:
             raise wz.NotAcceptable(
                 f"Error retrieving active manuscripts: {err}"
@@ -839,6 +1169,51 @@ class QueryActive(Resource):
         return active_manuscripts
 
 
+@api.route(f'{QUERY_EP}/search')
+class QuerySearch(Resource):
+    """
+    Full-text search over manuscript titles, abstracts and texts.
+    """
+    @api.response(HTTPStatus.OK, 'Success')
+    @api.response(HTTPStatus.BAD_REQUEST, 'No search terms')
+    @api.doc(params={
+        SEARCH_QUERY: 'The words to search for',
+        flds.STATE: 'Only manuscripts in this state',
+        flds.AUTHOR_EMAIL: 'Only manuscripts by this author',
+        LIMIT: 'The most results to return',
+        OFFSET: 'How many results to skip',
+    })
+    def get(self):
+        """
+        Returns matching manuscripts, best first, each with a snippet of
+        where it matched.
+        """
+        try:
+            return srch.search(request.args.get(SEARCH_QUERY),
+                               request.args.get(flds.STATE),
+                               request.args.get(flds.AUTHOR_EMAIL),
+                               request.args.get(LIMIT, type=int),
+                               request.args.get(OFFSET, 0, type=int))
+        except ValueError as err:
+            raise wz.BadRequest(str(err))
+
+
+@api.route(f'{QUERY_EP}/stats')
+class QueryStats(Resource):
+    """
+    Editorial dashboard counts and turnaround times.
+    """
+    @api.response(HTTPStatus.OK, 'Success')
+    @api.doc(params={REFRESH: 'Set to true to skip the cache'})
+    def get(self):
+        """
+        Manuscripts per state, active manuscripts per referee and author,
+        and the median and percentile seconds spent in each state.
+        """
+        refresh = request.args.get(REFRESH, '').lower() == 'true'
+        return stats.get_stats(refresh)
+
+
 @api.route(f'{QUERY_EP}/states')
 class State(Resource):
     """
@@ -883,6 +1258,30 @@ class ValidActions(Resource):
             raise wz.BadRequest(str(e))
 
 
+@api.route(f'{QUERY_EP}/valid_actions/bulk')
+class ValidActionsBulk(Resource):
+    @api.response(HTTPStatus.OK, 'Success')
+    @api.response(HTTPStatus.BAD_REQUEST, 'Bad user or manuscript ids')
+    @api.expect(VALID_ACTIONS_BULK_FLDS)
+    def post(self):
+        """
+        Returns {manuscript id: [valid actions]} for a list of manuscripts,
+        or for all the user's active manuscripts if no list is given.
+        """
+        user_email = request.json.get(flds.USER_EMAIL)
+        manu_ids = request.json.get(flds.MANU_IDS)
+
+        if not user_email:
+            raise wz.BadRequest("Missing user_email")
+        if manu_ids is not None and not isinstance(manu_ids, list):
+            raise wz.BadRequest("manu_ids must be a list")
+
+        try:
+            return qry.get_valid_actions_bulk(user_email, manu_ids)
+        except ValueError as e:
+            raise wz.BadRequest(str(e))
+
+
 @api.route(f'{QUERY_EP}/valid_states')
 class ValidStates(Resource):
     @api.doc(params={
@@ -1,10 +1,16 @@
 from http.client import (
     BAD_REQUEST,
+    CONFLICT,
     FORBIDDEN,
     NOT_ACCEPTABLE,
     NOT_FOUND,
+    NOT_MODIFIED,
     OK,
+    PARTIAL_CONTENT,
+    PRECONDITION_FAILED,
+    REQUESTED_RANGE_NOT_SATISFIABLE,
     SERVICE_UNAVAILABLE,
+    TOO_MANY_REQUESTS,
     UNAUTHORIZED,
 )  
 
@@ -19,10 +25,19 @@ from data.manuscripts import query
 from data.manuscripts import fields as flds
 
 import security.security as sec
+import security.tokens as tok
 
 import server.endpoints as ep
 
 TEST_CLIENT = ep.app.test_client()
+EDITOR_EMAIL = 'editor@nyu.edu'
+
+
+@pytest.fixture(autouse=True)
+def throttle_db(tmp_path, monkeypatch):
+    # keep failed logins in one test from locking out the next
+    monkeypatch.setattr(ep.thr, 'THROTTLE_DB',
+                        str(tmp_path / 'throttle.sqlite3'))
 
 
 def test_get_hello():
@@ -118,11 +133,8 @@ def test_people_create_form():
     assert form_data[ep.ppl.ROLES] == 'list of strings'
 
 
-@patch('data.people.exists', autospec=True)
 @patch('data.people.create', autospec=True, return_value='test@nyu.edu')
-def test_create_person(mock_create, mock_exists):
-    mock_exists.return_value = False  # assume person doesn't exist yet
-    
+def test_create_person(mock_create):
     test_data = {
         ep.ppl.NAME: 'Test Person',
         ep.ppl.EMAIL: mock_create.return_value,
@@ -139,15 +151,12 @@ def test_create_person(mock_create, mock_exists):
     assert resp_json[ep.MESSAGE] == 'Person added!'
     assert resp_json[ep.RETURN] == mock_create.return_value
     
-    mock_exists.assert_called_once_with('test@nyu.edu')
     mock_create.assert_called_once()
 
 
-@patch('data.people.exists', autospec=True)
-@patch('data.people.create', autospec=True)
-def test_create_person_exists(mock_create, mock_exists):
-    mock_exists.return_value = True  # Person already exists
-    
+@patch('data.people.create', autospec=True,
+       side_effect=ValueError('Adding duplicate email'))
+def test_create_person_exists(mock_create):
     test_data = {
         ep.ppl.NAME: 'Test Person',
         ep.ppl.EMAIL: 'test@nyu.edu',
@@ -158,8 +167,8 @@ def test_create_person_exists(mock_create, mock_exists):
     resp = TEST_CLIENT.put(f'{ep.PEOPLE_EP}/create', json=test_data)
     assert resp.status_code == NOT_ACCEPTABLE
     
-    mock_exists.assert_called_once_with('test@nyu.edu')
-    mock_create.assert_not_called()  # create should never be called if person exists
+    # create() is what refuses a taken email
+    mock_create.assert_called_once()
 
 
 @patch('data.people.read', autospec=True)
@@ -285,6 +294,17 @@ def test_get_active_manuscripts_endpoint(mock_exists, mock_get_active):
     response = TEST_CLIENT.get(f'{ep.QUERY_EP}/active/{test_email}')
     assert response.status_code == 200
     assert response.get_json() == dummy_response
+    mock_get_active.assert_called_with(test_email, None, None)
+
+
+@patch('data.manuscripts.query.get_active_manuscripts', return_value=[])
+@patch('data.people.exists', return_value=True)
+def test_get_active_manuscripts_page(mock_exists, mock_get_active):
+    test_email = 'user@example.com'
+    response = TEST_CLIENT.get(f'{ep.QUERY_EP}/active/{test_email}',
+                               query_string={ep.LIMIT: 10, ep.AFTER: 'abc'})
+    assert response.status_code == 200
+    mock_get_active.assert_called_with(test_email, 10, 'abc')
 
 
 @patch('data.manuscripts.query.get_manuscripts', return_value={'id': {flds.TITLE: 'Three Bears', 
@@ -600,8 +620,9 @@ def test_login_fail(mock_login):
     assert resp.status_code == BAD_REQUEST
 
 
+@patch('data.people.get_cached_role_mask', return_value=0)
 @patch('data.account.login', return_value=True)
-def test_login_success(mock_login):
+def test_login_success(mock_login, mock_mask):
     valid_data = {ep.acc.EMAIL: 'email@nyu.edu', ep.acc.PASSWORD: 'password'}
     resp = TEST_CLIENT.post(f'{ep.LOGIN_EP}', json=valid_data)
     assert resp.status_code == OK
@@ -631,13 +652,12 @@ def test_register_success(mock_register):
     assert resp.status_code == OK
 
 
-@patch('data.people.read_one', return_value={'roles': ['ED']})
 @patch('data.people.delete', return_value=1)
-def test_person_delete_success(mock_delete, mock_read_one):
+def test_person_delete_success(mock_delete):
     # email matches bearer header
     email = 'email@nyu.edu'
     headers = {
-        'Authorization': f'Bearer {email}'
+        'Authorization': f'Bearer {tok.issue(email, [])}'
     }
     resp = TEST_CLIENT.delete(
         f'{ep.PEOPLE_EP}/{email}', headers=headers
@@ -645,7 +665,7 @@ def test_person_delete_success(mock_delete, mock_read_one):
     assert resp.status_code == OK
 
     # an editor should succeed
-    headers['Authorization'] = 'Bearer editor@nyu.edu'
+    headers['Authorization'] = f"Bearer {tok.issue('editor@nyu.edu', ['ED'])}"
     resp = TEST_CLIENT.delete(f'{ep.PEOPLE_EP}/{email}', headers=headers)
     assert resp.status_code == OK
     resp_json = resp.get_json()
@@ -653,13 +673,12 @@ def test_person_delete_success(mock_delete, mock_read_one):
     assert type(resp_json['Deleted'] == int)
 
 
-@patch('data.people.read_one', return_value={'roles': []})
 @patch('data.people.delete')
-def test_person_delete_unauthorized(mock_delete, mock_read_one):
+def test_person_delete_unauthorized(mock_delete):
     target_email = 'someoneelse@nyu.edu'
     bearer_email = 'unauthorized@nyu.edu'
     headers = {
-        'Authorization': f'Bearer {bearer_email}'
+        'Authorization': f'Bearer {tok.issue(bearer_email, [])}'
     }
     resp = TEST_CLIENT.delete(f'{ep.PEOPLE_EP}/{target_email}', headers=headers)
 
@@ -676,7 +695,7 @@ def test_update_person():
         ep.ppl.ROLES: ['AU', 'CE'],
     }
     headers = {
-        'Authorization': f'Bearer {bearer_email}'
+        'Authorization': f"Bearer {tok.issue(bearer_email, ['ED'])}"
         }
 
     # Success case
@@ -725,34 +744,33 @@ def test_update_person():
         assert resp.status_code == NOT_ACCEPTABLE
 
 
-@patch('data.people.read_one', return_value={'roles': []})
 @patch('data.people.delete', return_value=0)
-def test_account_delete_unauthorized(mock_delete, mock_read_one):
+def test_account_delete_unauthorized(mock_delete):
     email = 'email@nyu.edu'
     headers = {
-        'Authorization': f'Bearer unauthorized@nyu.edu'
+        'Authorization': f"Bearer {tok.issue('unauthorized@nyu.edu', [])}"
     }
     resp = TEST_CLIENT.delete(f'{ep.ACCOUNT_EP}/{email}', headers=headers)
     assert resp.status_code == UNAUTHORIZED
 
 
-@patch('data.account.delete', return_value=True)
-@patch('data.people.delete', return_value=1)
-def test_account_delete_success(mock_account_delete, mock_people_delete):
+@patch('data.account.delete_user', return_value=True)
+def test_account_delete_success(mock_delete_user):
     email = 'email@nyu.edu'
     headers = {
-        'Authorization': f'Bearer {email}'
+        'Authorization': f'Bearer {tok.issue(email, [])}'
     }
     resp = TEST_CLIENT.delete(f'{ep.ACCOUNT_EP}/{email}', headers=headers)
     assert resp.status_code == OK
+    mock_delete_user.assert_called_once_with(email)
 
 
-@patch('data.account.delete', side_effect=ValueError("Account does not exist"))
-@patch('data.people.delete', return_value=0)
-def test_account_delete_fail(mock_account_delete, mock_people_delete):
+@patch('data.account.delete_user',
+       side_effect=ValueError("Account does not exist"))
+def test_account_delete_fail(mock_delete_user):
     email = 'nonexistent@nyu.edu'
     headers = {
-        'Authorization': f'Bearer {email}'
+        'Authorization': f'Bearer {tok.issue(email, [])}'
     }
     resp = TEST_CLIENT.delete(f'{ep.ACCOUNT_EP}/{email}', headers=headers)
     assert resp.status_code == BAD_REQUEST
@@ -833,3 +851,377 @@ def test_valid_states_endpoint_success(mock_states):
     assert resp.status_code == OK
     assert resp.get_json() == ['AU_RVW', 'SUB']
     mock_states.assert_called_once_with('test123', 'test@nyu.edu')
+
+
+def test_my_permissions():
+    token = tok.issue('editor@nyu.edu', ['ED'])
+    headers = {'Authorization': f'Bearer {token}'}
+    resp = TEST_CLIENT.get(f'{ep.PERMISSIONS_EP}/me', headers=headers)
+    assert resp.status_code == OK
+    resp_json = resp.get_json()
+    assert resp_json[ep.CAPS_FEATURES][sec.TEXT][sec.UPDATE] is True
+    submitted = resp_json[ep.CAPS_STATES][query.SUBMITTED]
+    assert query.ACTION_ASSIGN_REF in submitted
+    etag = resp.headers['ETag']
+
+    # Same roles: the client's copy is still good
+    headers['If-None-Match'] = etag
+    resp = TEST_CLIENT.get(f'{ep.PERMISSIONS_EP}/me', headers=headers)
+    assert resp.status_code == NOT_MODIFIED
+
+    # Different roles: new map, new ETag
+    headers['Authorization'] = f"Bearer {tok.issue('editor@nyu.edu', ['AU'])}"
+    resp = TEST_CLIENT.get(f'{ep.PERMISSIONS_EP}/me', headers=headers)
+    assert resp.status_code == OK
+    assert resp.headers['ETag'] != etag
+    assert resp.get_json()[ep.CAPS_FEATURES][sec.TEXT][sec.UPDATE] is False
+
+
+def test_my_permissions_unauthorized():
+    resp = TEST_CLIENT.get(f'{ep.PERMISSIONS_EP}/me')
+    assert resp.status_code == UNAUTHORIZED
+
+
+@patch('data.people.get_cached_role_mask', return_value=0)
+@patch('data.account.login', return_value=True)
+def test_login_issues_token(mock_login, mock_mask):
+    valid_data = {ep.acc.EMAIL: 'email@nyu.edu', ep.acc.PASSWORD: 'password'}
+    resp = TEST_CLIENT.post(f'{ep.LOGIN_EP}', json=valid_data)
+    assert resp.status_code == OK
+    claims = tok.verify(resp.get_json()[ep.TOKEN])
+    assert claims[tok.EMAIL] == 'email@nyu.edu'
+
+
+@patch('data.people.delete')
+def test_person_delete_forged_bearer(mock_delete):
+    # a bare email is no longer accepted as a credential
+    headers = {'Authorization': 'Bearer editor@nyu.edu'}
+    resp = TEST_CLIENT.delete(f'{ep.PEOPLE_EP}/someone@nyu.edu',
+                              headers=headers)
+    assert resp.status_code == UNAUTHORIZED
+    mock_delete.assert_not_called()
+
+
+@patch('data.account.login', side_effect=ep.acc.PasswordServiceBusy('busy'))
+def test_login_busy(mock_login):
+    valid_data = {ep.acc.EMAIL: 'email@nyu.edu', ep.acc.PASSWORD: 'password'}
+    resp = TEST_CLIENT.post(f'{ep.LOGIN_EP}', json=valid_data)
+    assert resp.status_code == SERVICE_UNAVAILABLE
+    assert 'Retry-After' in resp.headers
+
+
+@patch('data.account.register',
+       side_effect=ep.acc.PasswordServiceBusy('busy'))
+def test_register_busy(mock_register):
+    valid_data = {ep.acc.EMAIL: 'email@nyu.edu', ep.acc.PASSWORD: 'password'}
+    resp = TEST_CLIENT.post(f'{ep.REGISTER_EP}', json=valid_data)
+    assert resp.status_code == SERVICE_UNAVAILABLE
+
+
+@patch('data.account.login', side_effect=ValueError("Invalid credentials"))
+def test_login_locked_out(mock_login):
+    bad_data = {ep.acc.EMAIL: 'email@nyu.edu', ep.acc.PASSWORD: 'wrong'}
+    for _ in range(ep.thr.MAX_EMAIL_FAILURES):
+        resp = TEST_CLIENT.post(f'{ep.LOGIN_EP}', json=bad_data)
+        assert resp.status_code == BAD_REQUEST
+    mock_login.reset_mock()
+    resp = TEST_CLIENT.post(f'{ep.LOGIN_EP}', json=bad_data)
+    assert resp.status_code == TOO_MANY_REQUESTS
+    assert int(resp.headers['Retry-After']) > 0
+    # refused before any password check
+    mock_login.assert_not_called()
+
+
+def test_email_filter_metrics():
+    resp = TEST_CLIENT.get(f'{ep.METRICS_EP}/email_filter')
+    assert resp.status_code == OK
+    assert ep.emf.FALSE_POSITIVE_RATE in resp.get_json()
+
+
+@patch('data.people.get_name_sync_status', return_value={'state': 'done'})
+def test_person_name_sync(mock_status):
+    resp = TEST_CLIENT.get(f'{ep.PEOPLE_EP}/someone@nyu.edu/name_sync')
+    assert resp.status_code == OK
+    assert resp.get_json() == {'state': 'done'}
+
+
+@patch('data.people.get_name_sync_status', return_value=None)
+def test_person_name_sync_not_found(mock_status):
+    resp = TEST_CLIENT.get(f'{ep.PEOPLE_EP}/someone@nyu.edu/name_sync')
+    assert resp.status_code == NOT_FOUND
+
+
+MANU_TEXT = 'Hello, manuscript world!'
+INLINE_MANU = {flds.ID: '123', flds.STATE: 'SUB', flds.TEXT: MANU_TEXT}
+
+
+@patch('data.manuscripts.query.get_one_manu', return_value=INLINE_MANU)
+def test_query_text(mock_get_one):
+    resp = TEST_CLIENT.get(f'{ep.QUERY_EP}/123/text')
+    assert resp.status_code == OK
+    assert resp.get_data(as_text=True) == MANU_TEXT
+    assert resp.headers['Accept-Ranges'] == 'bytes'
+    mock_get_one.assert_called_once_with('123', with_body=False)
+
+
+@patch('data.manuscripts.query.get_one_manu', return_value=INLINE_MANU)
+def test_query_text_range(mock_get_one):
+    resp = TEST_CLIENT.get(f'{ep.QUERY_EP}/123/text',
+                           headers={'Range': 'bytes=7-16'})
+    assert resp.status_code == PARTIAL_CONTENT
+    assert resp.get_data(as_text=True) == MANU_TEXT[7:17]
+    assert resp.headers['Content-Range'] == f'bytes 7-16/{len(MANU_TEXT)}'
+
+
+@patch('data.manuscripts.query.get_one_manu', return_value=INLINE_MANU)
+def test_query_text_bad_range(mock_get_one):
+    resp = TEST_CLIENT.get(f'{ep.QUERY_EP}/123/text',
+                           headers={'Range': 'bytes=500-600'})
+    assert resp.status_code == REQUESTED_RANGE_NOT_SATISFIABLE
+
+
+@patch('data.manuscripts.query.get_one_manu', return_value=None)
+def test_query_text_not_found(mock_get_one):
+    resp = TEST_CLIENT.get(f'{ep.QUERY_EP}/123/text')
+    assert resp.status_code == NOT_FOUND
+
+
+@patch('data.manuscripts.query.get_valid_actions_bulk',
+       return_value={'123': ['SBR']})
+def test_valid_actions_bulk_endpoint(mock_bulk):
+    resp = TEST_CLIENT.post(f'{ep.QUERY_EP}/valid_actions/bulk', json={
+        flds.USER_EMAIL: 'referee@nyu.edu',
+        flds.MANU_IDS: ['123'],
+    })
+    assert resp.status_code == OK
+    assert resp.get_json() == {'123': ['SBR']}
+    mock_bulk.assert_called_once_with('referee@nyu.edu', ['123'])
+
+
+@patch('data.manuscripts.query.get_valid_actions_bulk', return_value={})
+def test_valid_actions_bulk_endpoint_all_active(mock_bulk):
+    resp = TEST_CLIENT.post(f'{ep.QUERY_EP}/valid_actions/bulk',
+                            json={flds.USER_EMAIL: 'editor@nyu.edu'})
+    assert resp.status_code == OK
+    mock_bulk.assert_called_once_with('editor@nyu.edu', None)
+
+
+def test_valid_actions_bulk_endpoint_missing_user():
+    resp = TEST_CLIENT.post(f'{ep.QUERY_EP}/valid_actions/bulk',
+                            json={flds.MANU_IDS: ['123']})
+    assert resp.status_code == BAD_REQUEST
+
+
+def editor_headers(**headers) -> dict:
+    token = tok.issue(EDITOR_EMAIL, ['ED'])
+    return {'Authorization': f'Bearer {token}', **headers}
+
+
+@patch('data.manuscripts.query.transition', return_value=('REF_RVW', 4))
+def test_handle_action_if_match(mock_transition):
+    resp = TEST_CLIENT.put(f'{ep.QUERY_EP}/handle_action', json={
+        flds.ID: '123', flds.ACTION: 'ARF', flds.REFEREES: 'ref@nyu.edu',
+    }, headers=editor_headers(**{'If-Match': '"3"'}))
+    assert resp.status_code == OK
+    assert resp.get_json()[ep.RETURN] == 'REF_RVW'
+    assert resp.headers['ETag'] == '"4"'
+    mock_transition.assert_called_once_with('123', 'ARF', 'ref@nyu.edu', 3,
+                                            EDITOR_EMAIL)
+
+
+@patch('data.manuscripts.query.transition')
+def test_handle_action_needs_login(mock_transition):
+    resp = TEST_CLIENT.put(f'{ep.QUERY_EP}/handle_action', json={
+        flds.ID: '123', flds.ACTION: 'ACC', flds.EDITOR: 'anyone',
+    })
+    assert resp.status_code == UNAUTHORIZED
+    mock_transition.assert_not_called()
+
+
+@patch('data.manuscripts.query.transition',
+       side_effect=query.ManuscriptConflict('changed'))
+def test_handle_action_conflict(mock_transition):
+    resp = TEST_CLIENT.put(f'{ep.QUERY_EP}/handle_action', json={
+        flds.ID: '123', flds.ACTION: 'ACC',
+    }, headers=editor_headers())
+    assert resp.status_code == CONFLICT
+
+
+def test_handle_action_bad_if_match():
+    resp = TEST_CLIENT.put(f'{ep.QUERY_EP}/handle_action', json={
+        flds.ID: '123', flds.ACTION: 'ACC',
+    }, headers=editor_headers(**{'If-Match': '"abc"'}))
+    assert resp.status_code == BAD_REQUEST
+
+
+@patch('data.manuscripts.query.transition')
+def test_handle_action_many_if_match_tags(mock_transition):
+    resp = TEST_CLIENT.put(f'{ep.QUERY_EP}/handle_action', json={
+        flds.ID: '123', flds.ACTION: 'ACC',
+    }, headers=editor_headers(**{'If-Match': '"1", "2"'}))
+    assert resp.status_code == BAD_REQUEST
+    mock_transition.assert_not_called()
+
+
+@patch('data.manuscripts.query.transition',
+       side_effect=query.ManuscriptConflict('changed'))
+def test_handle_action_if_match_failed(mock_transition):
+    resp = TEST_CLIENT.put(f'{ep.QUERY_EP}/handle_action', json={
+        flds.ID: '123', flds.ACTION: 'ACC',
+    }, headers=editor_headers(**{'If-Match': '"3"'}))
+    assert resp.status_code == PRECONDITION_FAILED
+
+
+@patch('data.manuscripts.query.move',
+       side_effect=query.ManuscriptConflict('changed'))
+def test_handle_state_conflict(mock_move):
+    resp = TEST_CLIENT.put(f'{ep.QUERY_EP}/handle_state', json={
+        flds.ID: '123', flds.STATE: 'CED',
+    }, headers=editor_headers(**{'If-Match': '"0"'}))
+    assert resp.status_code == PRECONDITION_FAILED
+    mock_move.assert_called_once_with('123', 'CED', 0, EDITOR_EMAIL)
+
+
+@patch('data.manuscripts.query.patch', return_value=6)
+@patch('data.manuscripts.query.exists', return_value=True)
+def test_patch_manuscript(mock_exists, mock_patch):
+    resp = TEST_CLIENT.patch(f'{ep.QUERY_EP}/123',
+                             json={flds.STATE: 'CED'},
+                             headers={'If-Match': '"5"'})
+    assert resp.status_code == OK
+    assert resp.headers['ETag'] == '"6"'
+    mock_patch.assert_called_once_with('123', {flds.STATE: 'CED'}, 5)
+
+
+@patch('data.manuscripts.query.patch', side_effect=ValueError('bad'))
+@patch('data.manuscripts.query.exists', return_value=True)
+def test_patch_manuscript_bad_field(mock_exists, mock_patch):
+    resp = TEST_CLIENT.patch(f'{ep.QUERY_EP}/123', json={'nope': 1})
+    assert resp.status_code == BAD_REQUEST
+
+
+@patch('data.manuscripts.query.patch',
+       side_effect=query.ManuscriptConflict('changed'))
+@patch('data.manuscripts.query.exists', return_value=True)
+def test_patch_manuscript_conflict(mock_exists, mock_patch):
+    resp = TEST_CLIENT.patch(f'{ep.QUERY_EP}/123', json={flds.TITLE: 'T'})
+    assert resp.status_code == CONFLICT
+
+
+@patch('data.manuscripts.query.patch',
+       side_effect=query.ManuscriptConflict('changed'))
+@patch('data.manuscripts.query.exists', return_value=True)
+def test_patch_manuscript_if_match_failed(mock_exists, mock_patch):
+    resp = TEST_CLIENT.patch(f'{ep.QUERY_EP}/123', json={flds.TITLE: 'T'},
+                             headers={'If-Match': '"1"'})
+    assert resp.status_code == PRECONDITION_FAILED
+
+
+@patch('data.manuscripts.query.patch', return_value=3)
+@patch('data.manuscripts.query.exists', return_value=True)
+def test_patch_manuscript_etag_without_if_match(mock_exists, mock_patch):
+    resp = TEST_CLIENT.patch(f'{ep.QUERY_EP}/123', json={flds.TITLE: 'T'})
+    assert resp.status_code == OK
+    assert resp.headers['ETag'] == '"3"'
+
+
+@patch('data.manuscripts.query.exists', return_value=False)
+def test_patch_manuscript_not_found(mock_exists):
+    resp = TEST_CLIENT.patch(f'{ep.QUERY_EP}/123', json={flds.TITLE: 'T'})
+    assert resp.status_code == NOT_FOUND
+
+
+@patch('data.manuscripts.history.read', return_value=[{'to_state': 'SUB'}])
+def test_query_history(mock_read):
+    resp = TEST_CLIENT.get(f'{ep.QUERY_EP}/123/history?limit=10&after=abc')
+    assert resp.status_code == OK
+    assert resp.get_json() == [{'to_state': 'SUB'}]
+    mock_read.assert_called_once_with('123', 10, 'abc')
+
+
+@patch('data.manuscripts.history.read', side_effect=ValueError('bad'))
+def test_query_history_bad_after(mock_read):
+    resp = TEST_CLIENT.get(f'{ep.QUERY_EP}/123/history?after=abc')
+    assert resp.status_code == BAD_REQUEST
+
+
+@patch('data.manuscripts.stats.get_stats', return_value={'state_counts': {}})
+def test_query_stats(mock_stats):
+    resp = TEST_CLIENT.get(f'{ep.QUERY_EP}/stats?refresh=true')
+    assert resp.status_code == OK
+    assert resp.get_json() == {'state_counts': {}}
+    mock_stats.assert_called_once_with(True)
+
+
+@patch('data.manuscripts.search.search', return_value=[])
+def test_query_search(mock_search):
+    resp = TEST_CLIENT.get(f'{ep.QUERY_EP}/search?q=bears&state=SUB'
+                           '&limit=5&offset=10')
+    assert resp.status_code == OK
+    assert resp.get_json() == []
+    mock_search.assert_called_once_with('bears', 'SUB', None, 5, 10)
+
+
+def test_query_search_no_terms():
+    resp = TEST_CLIENT.get(f'{ep.QUERY_EP}/search')
+    assert resp.status_code == BAD_REQUEST
+
+
+@patch('data.manuscripts.referee_load.get_loads',
+       return_value={'ref@nyu.edu': 2})
+@patch('data.people.get_role_holders', return_value=['ref@nyu.edu'])
+def test_referee_load(mock_holders, mock_loads):
+    resp = TEST_CLIENT.get(f'{ep.PEOPLE_EP}/referees/load')
+    assert resp.status_code == OK
+    assert resp.get_json() == {'ref@nyu.edu': 2}
+    mock_holders.assert_called_once_with('RE')
+    mock_loads.assert_called_once_with(['ref@nyu.edu'])
+
+
+@patch('data.manuscripts.query.suggest_referees',
+       side_effect=ValueError('No such manuscript'))
+def test_referee_suggestions_not_found(mock_suggest):
+    resp = TEST_CLIENT.get(f'{ep.QUERY_EP}/123/referee_suggestions')
+    assert resp.status_code == NOT_FOUND
+
+
+@patch('data.manuscripts.query.handle_actions',
+       return_value=[{'_id': '123', 'outcome': 'done'}])
+def test_handle_action_bulk(mock_handle):
+    actions = [{flds.ID: '123', flds.ACTION: 'DON'}]
+    resp = TEST_CLIENT.put(f'{ep.QUERY_EP}/handle_action/bulk', json={
+        flds.ACTIONS: actions, flds.EDITOR: 'someone@else.edu'},
+        headers=editor_headers())
+    assert resp.status_code == OK
+    assert resp.get_json() == [{'_id': '123', 'outcome': 'done'}]
+    mock_handle.assert_called_once_with(actions, EDITOR_EMAIL)
+
+
+def test_handle_action_bulk_no_list():
+    resp = TEST_CLIENT.put(f'{ep.QUERY_EP}/handle_action/bulk',
+                           json={flds.ACTIONS: 'DON'},
+                           headers=editor_headers())
+    assert resp.status_code == BAD_REQUEST
+
+
+@patch('data.manuscripts.revisions.get_revisions',
+       return_value=[{'_id': 'r1', 'size': 3}])
+def test_query_revisions(mock_get):
+    resp = TEST_CLIENT.get(f'{ep.QUERY_EP}/123/revisions')
+    assert resp.status_code == OK
+    assert resp.get_json() == [{'_id': 'r1', 'size': 3}]
+    mock_get.assert_called_once_with('123')
+
+
+@patch('data.manuscripts.revisions.read', return_value='Some text.')
+def test_query_revision(mock_read):
+    resp = TEST_CLIENT.get(f'{ep.QUERY_EP}/123/revisions/r1')
+    assert resp.status_code == OK
+    assert resp.get_data(as_text=True) == 'Some text.'
+    mock_read.assert_called_once_with('123', 'r1')
+
+
+@patch('data.manuscripts.revisions.read', side_effect=ValueError('none'))
+def test_query_revision_not_found(mock_read):
+    resp = TEST_CLIENT.get(f'{ep.QUERY_EP}/123/revisions/r1')
+    assert resp.status_code == NOT_FOUND